@@ -5,9 +5,14 @@ ansible dynamic inventory script for use with kcli
 '''
 
 from kvirt import Kvirt
+from kvirt.cache import Cache
+from kvirt.defaults import CACHETTL
+from kvirt.inventory import InventorySnapshot, VM
+from multiprocessing.pool import ThreadPool
 import json
 import yaml
 import os
+import sys
 import argparse
 
 
@@ -30,19 +35,17 @@ class KcliInventory(object):
             if 'default' not in ini or 'client' not in ini['default']:
                 print "Missing default section in config file. Leaving..."
                 os._exit(1)
-        client = ini['default']['client']
-        if client not in ini:
-            print "Missing section for client %s in config file. Leaving..." % client
-            os._exit(1)
-        options = ini[client]
-        host = options.get('host', '127.0.0.1')
-        port = options.get('port', None)
-        user = options.get('user', 'root')
-        protocol = options.get('protocol', 'ssh')
-        self.k = Kvirt(host=host, port=port, user=user, protocol=protocol)
-        if self.k.conn is None:
-            print "Couldnt connect to specify hypervisor %s. Leaving..." % host
-            os._exit(1)
+        if self.args.all_clients:
+            self.clients = sorted([e for e in ini if e != 'default'])
+        elif self.args.clients is not None:
+            self.clients = [client.strip() for client in self.args.clients.split(',') if client.strip()]
+        else:
+            self.clients = [ini['default']['client']]
+        for client in self.clients:
+            if client not in ini:
+                print "Missing section for client %s in config file. Leaving..." % client
+                os._exit(1)
+        self.ini = ini
 
         # Called with `--list`.
         if self.args.list:
@@ -61,27 +64,68 @@ class KcliInventory(object):
         parser = argparse.ArgumentParser()
         parser.add_argument('--list', action='store_true')
         parser.add_argument('--host', action='store')
+        parser.add_argument('--refresh', action='store_true')
+        parser.add_argument('--clients', action='store', help='Comma separated clients to gather vms from')
+        parser.add_argument('--all-clients', action='store_true', help='Gather vms from every client')
         self.args = parser.parse_args()
 
+    def connect(self, client):
+        options = self.ini[client]
+        host = options.get('host', '127.0.0.1')
+        port = options.get('port', None)
+        user = options.get('user', 'root')
+        protocol = options.get('protocol', 'ssh')
+        controlpersist = options.get('controlpersist', self.ini['default'].get('controlpersist'))
+        url = options.get('url', None)
+        k = Kvirt(host=host, port=port, user=user, protocol=protocol, url=url, shared=True, controlpersist=controlpersist)
+        if k.conn is None:
+            if len(self.clients) > 1:
+                raise Exception("Couldnt connect to specify hypervisor %s" % host)
+            print "Couldnt connect to specify hypervisor %s. Leaving..." % host
+            os._exit(1)
+        return k
+
+    def vms(self, client):
+        ttl = self.ini[client].get('cachettl', self.ini['default'].get('cachettl', CACHETTL))
+        cache = Cache(client, ttl=int(ttl))
+        try:
+            return cache.fetch('vms', lambda: [vm for vm in self.connect(client).iterlist()], refresh=self.args.refresh)
+        except Exception as e:
+            sys.stderr.write("Client %s failed: %s\n" % (client, e))
+            return []
+
     def get(self):
         ubuntus = ['utopic', 'vivid', 'wily', 'xenial', 'yakkety']
-        k = self.k
         metadata = {'_meta': {'hostvars': {}}}
         hostvalues = metadata['_meta']['hostvars']
-        for vm in k.list():
-            name = vm[0]
-            status = vm[1]
-            ip = vm[2]
-            template = vm[3]
-            description = vm[4]
-            profile = vm[5]
+        pool = ThreadPool(len(self.clients))
+        try:
+            listings = pool.map(self.vms, self.clients)
+        finally:
+            pool.close()
+            pool.join()
+        # vms named the same on several clients get the client as prefix, so that none of them is overwritten
+        seen = {}
+        for listing in listings:
+            for vm in listing:
+                seen[vm[0]] = seen.get(vm[0], 0) + 1
+        hosts = []
+        for client, listing in zip(self.clients, listings):
+            for vm in InventorySnapshot([VM(*vm) for vm in listing]):
+                hosts.append((client, "%s_%s" % (client, vm.name) if seen[vm.name] > 1 else vm.name, vm))
+        for client, name, vm in hosts:
+            status = vm.status
+            ip = vm.ip
+            template = vm.source
+            description = vm.description
+            profile = vm.profile
             if description == '':
                 description = 'kvirt'
             if description not in metadata:
                 metadata[description] = {"hosts": [name], "vars": {"plan": description, "profile": profile}}
             else:
                 metadata[description]["hosts"].append(name)
-            hostvalues[name] = {'status': status}
+            hostvalues[name] = {'status': status, 'client': client}
             if ip != '':
                 hostvalues[name]['ansible_host'] = ip
             if template != '':
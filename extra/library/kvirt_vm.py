@@ -2,6 +2,7 @@
 
 from ansible.module_utils.basic import *
 from kvirt import Kvirt
+from kvirt.profiles import ProfileResolver
 
 DOCUMENTATION = '''
 module: kvirt_vm
@@ -24,6 +25,13 @@ EXAMPLES = '''
     user: root
   register: result
 
+- name: Create a vm from profile base7 of ~/kcli_profiles.yml, with more memory
+  kvirt_vm:
+    name: prout
+    profile: base7
+    memory: 2048
+  register: result
+
 - name: Delete that vm
   kvirt_vm:
     name: prout
@@ -41,6 +49,7 @@ def main():
         "user": {"default": 'root', "type": "str"},
         "protocol": {"default": 'ssh', "type": "str", 'choices': ['ssh', 'tcp']},
         "url": {"default": None, "type": "str"},
+        "controlpersist": {"default": None, "type": "int"},
         "state": {
             "default": "present",
             "choices": ['present', 'absent'],
@@ -48,16 +57,17 @@ def main():
         },
         "name": {"required": True, "type": "str"},
         "description": {"default": 'kvirt', "type": "str"},
-        "numcpus": {"default": 2, "type": "int"},
-        "memory": {"default": 512, "type": "int"},
-        "pool": {"default": 'default', "type": "str"},
+        "profile": {"default": None, "type": "str"},
+        "numcpus": {"default": None, "type": "int"},
+        "memory": {"default": None, "type": "int"},
+        "pool": {"default": None, "type": "str"},
         "template": {"type": "str"},
 
     }
     module = AnsibleModule(argument_spec=argument_spec)
     # url = module.params['url'] if 'url' in module.params else None
     # k = Kvirt(host=module.params['host'], port=module.params['port'], user=module.params['user'], protocol=module.params['protocol'], url=url)
-    k = Kvirt(host=module.params['host'], port=module.params['port'], user=module.params['user'], protocol=module.params['protocol'])
+    k = Kvirt(host=module.params['host'], port=module.params['port'], user=module.params['user'], protocol=module.params['protocol'], controlpersist=module.params['controlpersist'])
     name = module.params['name']
     exists = k.exists(name)
     state = module.params['state']
@@ -67,13 +77,14 @@ def main():
             skipped = True
             meta = {'result': 'skipped'}
         else:
-            template = module.params['template'] if 'template' in module.params else None
-            # description = module.params['description'] if 'description' in module.params else None
-            pool = module.params['pool'] if 'pool' in module.params else 'default'
-            numcpus = module.params['numcpus'] if 'numcpus' in module.params else 2
-            memory = module.params['memory'] if 'numcpus' in module.params else '512'
-            # meta = k.create(name=name, description=description, numcpus=numcpus, memory=memory, pool=pool, template=template, disks=disks, disksize=disksize, diskthin=diskthin, diskinterface=diskinterface, nets=nets, iso=iso, vnc=vnc, cloudinit=cloudinit, start=start, keys=keys, cmds=cmds, ips=ips, netmasks=netmasks, gateway=gateway, dns=dns, domain=domain)
-            meta = k.create(name=name, numcpus=numcpus, memory=memory, pool=pool, template=template)
+            profile = module.params['profile']
+            parameters = ProfileResolver.fromhome().resolve(profile, description=module.params['description'])
+            if parameters is None:
+                module.fail_json(msg="Invalid profile %s" % profile)
+            for key in ['numcpus', 'memory', 'pool', 'template']:
+                if module.params.get(key) is not None:
+                    parameters[key] = module.params[key]
+            meta = k.create(name=name, **parameters)
             # meta = k.create(name)
             changed = True
             skipped = False
@@ -4,16 +4,21 @@
 interact with a local/remote libvirt daemon
 """
 
-from iptools import IpRange
-from netaddr import IPNetwork
-from libvirt import open as libvirtopen
-try:
-    from libvirt import VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE
-except:
-    pass
+from kvirt import events
+from kvirt.cache import Descriptors
+from kvirt.connection import alive, manager, sshcommand
+from kvirt.inventory import InventorySnapshot, iterinventory, leases, parse, reachable
+from kvirt.spec import Disk, Domain, Interface, Network, Pool, Volume
+from kvirt.transfer import CHUNKSIZE, SEGMENT, filesize, readahead, send, write
+from io import BytesIO
+import copy
+import hashlib
 import os
+import random
 import socket
 import string
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 __version__ = "1.0.28"
@@ -34,10 +39,14 @@ guestwindows2003 = "windows_2003"
 guestwindows200364 = "windows_2003x64"
 guestwindows2008 = "windows_2008"
 guestwindows200864 = "windows_2008x64"
+# description of the stopped vms kept ready to be claimed by create
+WARM = "kcliwarm"
 
 
-class Kvirt:
-    def __init__(self, host='127.0.0.1', port=None, user='root', protocol='ssh', url=None):
+class Kvirt(object):
+    _descriptors = None
+
+    def __init__(self, host='127.0.0.1', port=None, user='root', protocol='ssh', url=None, shared=False, controlpersist=None):
         if url is None:
             if host == '127.0.0.1' or host == 'localhost':
                 url = "qemu:///system"
@@ -49,10 +58,15 @@ class Kvirt:
                 url = "qemu+%s://%s:%s/system?socket=/var/run/libvirt/libvirt-sock" % (protocol, host, port)
             else:
                 url = "qemu:///system"
-        try:
-            self.conn = libvirtopen(url)
-        except Exception:
-            self.conn = None
+        if controlpersist and url.startswith('qemu+ssh'):
+            url = "%s%scommand=%s" % (url, '&' if '?' in url else '?', sshcommand(controlpersist))
+        self.url = url
+        self.shared = shared
+        self._conn = manager.get(url) if shared else manager.open(url)
+        self._descriptors = manager.descriptors(url, shared)
+        self._volumes = None
+        self._paths = None
+        self._indexed = None
         self.host = host
         self.user = user
         self.port = port
@@ -60,10 +74,41 @@ class Kvirt:
         if self.protocol == 'ssh' and port is None:
             self.port = '22'
 
+    @property
+    def conn(self):
+        """
+        the libvirt connection, transparently reopened when it was dropped
+        """
+        conn = self._conn
+        if conn is not None and not alive(conn):
+            if self.shared:
+                conn = manager.get(self.url)
+            else:
+                manager.increment('reconnects')
+                conn = manager.open(self.url)
+            self._conn = conn
+            self._volumes, self._paths = None, None
+        return conn
+
+    @conn.setter
+    def conn(self, conn):
+        self._conn = conn
+
+    @property
+    def descriptors(self):
+        """
+        parsed descriptors of the domains and pools of the connection
+        """
+        if self._descriptors is None:
+            self._descriptors = Descriptors()
+        self._descriptors.bind(self.conn)
+        return self._descriptors
+
     def close(self):
-        conn = self.conn
-        conn.close()
-        self.conn = None
+        conn = self._conn
+        if not self.shared:
+            conn.close()
+        self._conn = None
 
     def exists(self, name):
         conn = self.conn
@@ -73,32 +118,61 @@ class Kvirt:
         except:
             return False
 
-    def create(self, name, virttype='kvm', title='', description='kvirt', numcpus=2, memory=512, guestid='guestrhel764', pool='default', template=None, disks=[{'size': 10}], disksize=10, diskthin=True, diskinterface='virtio', nets=['default'], iso=None, vnc=False, cloudinit=True, start=True, keys=None, cmds=None, ips=None, netmasks=None, gateway=None, nested=True, dns=None, domain=None):
-        default_diskinterface = diskinterface
-        default_diskthin = diskthin
-        default_disksize = disksize
+    def _volumeindex(self, refresh=False):
+        """
+        return volumes of every pool indexed by name and by path. the index is rebuilt after a storage pool event
+        of the connection and, as volumes created or deleted elsewhere get no events, once older than the descriptors ttl
+        """
+        conn = self.conn
+        descriptors = self.descriptors
+        now = time.time()
+        if self._volumes is not None and not refresh:
+            indexed, storage = self._indexed
+            refresh = storage != descriptors.storage or now - indexed > descriptors.ttl
+        if self._volumes is None or refresh:
+            self._indexed = (now, descriptors.storage)
+            self._volumes, self._paths = {}, {}
+            for pool in conn.listAllStoragePools(0):
+                if not pool.isActive():
+                    continue
+                pool.refresh(0)
+                poolpath = self.descriptors.pool(pool).path
+                for volume in pool.listAllVolumes(0):
+                    self._indexvolume(pool, volume, poolpath)
+        return self._volumes, self._paths
+
+    def _indexvolume(self, pool, volume, poolpath=None):
+        if self._volumes is None:
+            return
+        name = volume.name()
+        if poolpath is not None:
+            path = "%s/%s" % (poolpath, name)
+        else:
+            path = volume.path()
+        entry = {'pool': pool, 'object': volume, 'path': path}
+        self._volumes[name] = entry
+        self._paths[path] = entry
+
+    def _unindexvolume(self, path):
+        if self._volumes is None or path not in self._paths:
+            return
+        name = os.path.basename(path)
+        entry = self._paths.pop(path)
+        if self._volumes.get(name) is entry:
+            del self._volumes[name]
+
+    def _createcontext(self, pool):
+        """
+        resolve the pool, volumes, networks and bridges needed by create, so that they can be shared between vms
+        """
         conn = self.conn
         try:
             storagepool = conn.storagePoolLookupByName(pool)
-        except:
-            print("Pool %s not found.Leaving..." % pool)
-            return {'result': 'failure', 'reason': "Pool %s not found" % pool}
-        poolxml = storagepool.XMLDesc(0)
-        root = ET.fromstring(poolxml)
-        pooltype = root.getiterator('pool')[0].get('type')
-        poolpath = None
-        for element in root.getiterator('path'):
-            poolpath = element.text
-            break
-        if vnc:
-            display = 'vnc'
-        else:
-            display = 'spice'
-        volumes = {}
-        for p in conn.listStoragePools():
-            poo = conn.storagePoolLookupByName(p)
-            for vol in poo.listAllVolumes():
-                volumes[vol.name()] = {'pool': poo, 'object': vol}
+        except Exception:
+            return None
+        poolspec = self.descriptors.pool(storagepool)
+        pooltype, poolpath = poolspec.type, poolspec.path
+        volumes, paths = self._volumeindex()
         networks = []
         bridges = []
         for net in conn.listNetworks():
@@ -106,9 +180,28 @@ class Kvirt:
         for net in conn.listInterfaces():
             if net != 'lo':
                 bridges.append(net)
-        machine = 'pc'
-        sysinfo = "<smbios mode='sysinfo'/>"
-        disksxml = ''
+        return {'pool': storagepool, 'pooltype': pooltype, 'poolpath': poolpath, 'volumes': volumes, 'paths': paths, 'networks': networks, 'bridges': bridges}
+
+    def create(self, name, virttype='kvm', title='', description='kvirt', numcpus=2, memory=512, guestid='guestrhel764', pool='default', template=None, disks=[{'size': 10}], disksize=10, diskthin=True, diskinterface='virtio', nets=['default'], iso=None, vnc=False, cloudinit=True, start=True, keys=None, cmds=None, ips=None, netmasks=None, gateway=None, nested=True, dns=None, domain=None, context=None):
+        default_diskinterface = diskinterface
+        default_diskthin = diskthin
+        default_disksize = disksize
+        conn = self.conn
+        if context is None:
+            context = self._createcontext(pool)
+        if context is None:
+            print("Pool %s not found.Leaving..." % pool)
+            return {'result': 'failure', 'reason': "Pool %s not found" % pool}
+        storagepool = context['pool']
+        pooltype = context['pooltype']
+        poolpath = context['poolpath']
+        volumes, paths = context['volumes'], context['paths']
+        networks, bridges = context['networks'], context['bridges']
+        if vnc:
+            display = 'vnc'
+        else:
+            display = 'spice'
+        definition = Domain(name, virttype=virttype, description=description, title=title, memory=memory, numcpus=numcpus, display=display, nested=nested)
         volsxml = []
         for index, disk in enumerate(disks):
             if disk is None:
@@ -136,35 +229,16 @@ class Kvirt:
             storagename = "%s_%d.img" % (name, index + 1)
             diskpath = "%s/%s" % (poolpath, storagename)
             if template is not None and index == 0:
-                try:
-                    storagepool.refresh(0)
-                    backingvolume = volumes[template]['object']
-                    backingxml = backingvolume.XMLDesc(0)
-                    root = ET.fromstring(backingxml)
-                except:
+                if template not in volumes:
                     print("Invalid template %s.Leaving..." % template)
                     return {'result': 'failure', 'reason': "Invalid template %s" % template}
-                backing = backingvolume.path()
-                backingxml = """<backingStore type='file' index='1'>
-                                <format type='raw'/>
-                                <source file='%s'/>
-                                <backingStore/>
-                                </backingStore>""" % backing
+                backing = volumes[template]['path']
             else:
                 backing = None
-                backingxml = '<backingStore/>'
-            volxml = self._xmlvolume(path=diskpath, size=disksize, pooltype=pooltype, backing=backing, diskformat=diskformat)
-            volsxml.append(volxml)
+            volsxml.append(self._xmlvolume(path=diskpath, size=disksize, pooltype=pooltype, backing=backing, diskformat=diskformat))
             if pooltype == 'logical':
                 diskformat = 'raw'
-            disksxml = """%s<disk type='file' device='disk'>
-                    <driver name='qemu' type='%s'/>
-                    <source file='%s'/>
-                    %s
-                    <target dev='%s' bus='%s'/>
-                    </disk>""" % (disksxml, diskformat, diskpath, backingxml, diskdev, diskbus)
-        netxml = ''
-        version = ''
+            definition.disks.append(Disk(diskpath, diskdev, bus=diskbus, format=diskformat, backing=backing))
         for index, net in enumerate(nets):
             if isinstance(net, str):
                 netname = net
@@ -177,124 +251,179 @@ class Kvirt:
                 elif 'ip' in nets[index]:
                     ip = nets[index]['ip']
                 if index == 0 and ip is not None:
-                    version = "<entry name='version'>%s</entry>" % ips[0]
+                    definition.version = ip
             if netname in bridges:
                 sourcenet = 'bridge'
             elif netname in networks:
                 sourcenet = 'network'
             else:
                 print("Invalid network %s.Leaving..." % netname)
-            netxml = """%s
-                     <interface type='%s'>
-                     <source %s='%s'/>
-                     <model type='virtio'/>
-                     </interface>""" % (netxml, sourcenet, sourcenet, netname)
-        version = """<sysinfo type='smbios'>
-                     <system>
-                     %s
-                     <entry name='product'>%s</entry>
-                     </system>
-                     </sysinfo>""" % (version, title)
+                return {'result': 'failure', 'reason': "Invalid network %s" % netname}
+            definition.interfaces.append(Interface(netname, type=sourcenet))
         if iso is None:
             if cloudinit:
                 iso = "%s/%s.iso" % (poolpath, name)
             else:
                 iso = ''
         else:
-            try:
-                iso = "%s/%s" % (poolpath, iso)
-                isovolume = volumes[template][iso]
-                iso = isovolume.path()
-            except:
+            if iso in volumes:
+                iso = volumes[iso]['path']
+            elif iso not in paths:
                 print("Invalid Iso %s.Leaving..." % iso)
                 return {'result': 'failure', 'reason': "Invalid iso %s" % iso}
-        isoxml = """<disk type='file' device='cdrom'>
-                      <driver name='qemu' type='raw'/>
-                      <source file='%s'/>
-                      <target dev='hdc' bus='ide'/>
-                      <readonly/>
-                    </disk>""" % (iso)
-        displayxml = """<input type='tablet' bus='usb'/>
-                        <input type='mouse' bus='ps2'/>
-                        <graphics type='%s' port='-1' autoport='yes' listen='0.0.0.0'>
-                        <listen type='address' address='0.0.0.0'/>
-                        </graphics>
-                        <memballoon model='virtio'/>""" % (display)
-        if nested and virttype == 'kvm':
-            nestedxml = """<cpu match='exact'>
-                  <model>Westmere</model>
-                   <feature policy='require' name='vmx'/>
-                </cpu>"""
-        else:
-            nestedxml = ""
-        if self.host in ['localhost', '127.0.0.1']:
-            serialxml = """<serial type='pty'>
-                       <target port='0'/>
-                       </serial>
-                       <console type='pty'>
-                       <target type='serial' port='0'/>
-                       </console>"""
-        else:
-            serialxml = """ <serial type="tcp">
-                     <source mode="bind" host="127.0.0.1" service="%s"/>
-                     <protocol type="telnet"/>
-                     <target port="0"/>
-                     </serial>""" % self._get_free_port()
-        vmxml = """<domain type='%s'>
-                  <name>%s</name>
-                  <description>%s</description>
-                  %s
-                  <memory unit='MiB'>%d</memory>
-                  <vcpu>%d</vcpu>
-                  <os>
-                    <type arch='x86_64' machine='%s'>hvm</type>
-                    <boot dev='hd'/>
-                    <boot dev='cdrom'/>
-                    <bootmenu enable='yes'/>
-                    %s
-                  </os>
-                  <features>
-                    <acpi/>
-                    <apic/>
-                    <pae/>
-                  </features>
-                  <clock offset='utc'/>
-                  <on_poweroff>destroy</on_poweroff>
-                  <on_reboot>restart</on_reboot>
-                  <on_crash>restart</on_crash>
-                  <devices>
-                    %s
-                    %s
-                    %s
-                    %s
-                    %s
-                  </devices>
-                    %s
-                    </domain>""" % (virttype, name, description, version, memory, numcpus, machine, sysinfo, disksxml, netxml, isoxml, displayxml, serialxml, nestedxml)
-        pool = conn.storagePoolLookupByName(pool)
-        pool.refresh(0)
+        definition.disks.append(Disk(iso, 'hdc', bus='ide', format='raw', device='cdrom', readonly=True))
+        if self.host not in ['localhost', '127.0.0.1']:
+            definition.serial = self._get_free_port()
+        vmxml = definition.xml()
+        pool = storagepool
         for volxml in volsxml:
-            pool.createXML(volxml, 0)
+            volume = pool.createXML(volxml, 0)
+            self._indexvolume(pool, volume, poolpath)
         conn.defineXML(vmxml)
         vm = conn.lookupByName(name)
         vm.setAutostart(1)
         if cloudinit:
-            self._cloudinit(name=name, keys=keys, cmds=cmds, nets=nets, gateway=gateway, dns=dns, domain=domain)
-            self._uploadiso(name, pool=pool)
+            iso = self._cloudinit(name=name, keys=keys, cmds=cmds, nets=nets, gateway=gateway, dns=dns, domain=domain)
+            self._uploadiso(name, pool=pool, poolpath=poolpath, data=iso)
         if start:
             vm.create()
         return {'result': 'success'}
 
+    def _map(self, function, items, workers=4):
+        """
+        apply function to each of items, spread over workers threads sharing the connection.
+        results are returned in the order of items
+        """
+        workers = max(1, min(workers, len(items)))
+        if workers == 1:
+            return [function(item) for item in items]
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def create_many(self, specs, workers=4):
+        """
+        create several vms, each spec being a dict of create parameters including name.
+        pools, volumes, networks and bridges are resolved once and the creation of the vms
+        is then spread over workers threads sharing the connection. results are returned in the order of specs
+        """
+        contexts = {}
+        for spec in specs:
+            pool = spec.get('pool', 'default')
+            if pool not in contexts:
+                contexts[pool] = self._createcontext(pool)
+
+        def create(spec):
+            spec = copy.deepcopy(spec)
+            context = contexts[spec.get('pool', 'default')]
+            if context is None:
+                return self.create(**spec)
+            try:
+                return self.create(context=context, **spec)
+            except Exception as e:
+                return {'result': 'failure', 'reason': str(e)}
+        return self._map(create, specs, workers=workers)
+
+    def warm(self, spec, count, workers=4):
+        """
+        keep count stopped vms of the profile of spec, a dict of create parameters including title,
+        created without cloudinit and ready to be claimed. extra ones are deleted
+        """
+        title = spec['title']
+        vms = self.warms(title)
+        if vms[count:]:
+            self.delete_many(vms[count:], workers=workers)
+        specs = []
+        for index in range(count - len(vms)):
+            suffix = ''.join(random.choice(string.ascii_lowercase) for letter in range(5))
+            specs.append(dict(spec, name="%s-warm-%s" % (title, suffix), title=title, description=WARM, start=False, cloudinit=False, iso=None))
+        if not specs:
+            return []
+        return self.create_many(specs, workers=workers)
+
+    def warms(self, title):
+        """
+        names of the stopped warm vms of profile title. they are spotted by name, so that only their descriptors are fetched
+        """
+        prefix = "%s-warm-" % title
+        names = []
+        for vm in self.conn.listAllDomains(0):
+            try:
+                name = vm.name()
+                if name.startswith(prefix) and not vm.isActive() and self.descriptors.domain(vm).description == WARM:
+                    names.append(name)
+            except Exception:
+                continue
+        return names
+
+    def claim(self, name, title, description='kvirt', pool='default', nets=['default'], cloudinit=True, start=True, keys=None, cmds=None, ips=None, gateway=None, dns=None, domain=None, warms=None):
+        """
+        turn a warm vm of profile title into vm name, renaming it and seeding it with its own cloudinit iso.
+        renaming is atomic so concurrent claims never get the same vm. warms are the candidates, as returned by
+        warms() and consumed as they are tried, so that several claims look them up once. return None when no warm vm is left
+        """
+        conn = self.conn
+        if warms is None:
+            warms = self.warms(title)
+        while warms:
+            candidate = warms.pop(0)
+            try:
+                conn.lookupByName(candidate).rename(name, 0)
+                break
+            except Exception:
+                continue
+        else:
+            return None
+        vm = conn.lookupByName(name)
+        descriptors = self.descriptors
+        descriptors.invalidate(vm.UUIDString())
+        root = ET.fromstring(descriptors.xml(vm))
+        root.find('description').text = description
+        nets = copy.deepcopy(nets)
+        for index, net in enumerate(nets):
+            if isinstance(net, dict) and ips and len(ips) > index and ips[index] is not None:
+                net['ip'] = ips[index]
+        ip = nets[0].get('ip') if nets and isinstance(nets[0], dict) else None
+        system = root.find('sysinfo/system')
+        if ip is not None and system is not None:
+            version = system.find("entry[@name='version']")
+            if version is None:
+                version = ET.SubElement(system, 'entry', {'name': 'version'})
+            version.text = ip
+        if cloudinit:
+            storagepool = conn.storagePoolLookupByName(pool)
+            poolpath = descriptors.pool(storagepool).path
+            iso = self._cloudinit(name=name, keys=keys, cmds=cmds, nets=nets, gateway=gateway, dns=dns, domain=domain)
+            self._uploadiso(name, pool=storagepool, poolpath=poolpath, data=iso)
+            for disk in root.iter('disk'):
+                if disk.get('device') != 'cdrom':
+                    continue
+                source = disk.find('source')
+                if source is None:
+                    source = ET.SubElement(disk, 'source')
+                source.set('file', "%s/%s.iso" % (poolpath, name))
+                break
+        conn.defineXML(ET.tostring(root).decode('utf-8'))
+        descriptors.invalidate(vm.UUIDString())
+        if start:
+            vm = conn.lookupByName(name)
+            vm.create()
+        return {'result': 'success', 'warm': candidate}
+
     def start(self, name):
         conn = self.conn
         status = {0: 'down', 1: 'up'}
         try:
-            vm = conn.lookupByName(name)
             vm = conn.lookupByName(name)
             if status[vm.isActive()] == "up":
                 return 1
             else:
                 vm.create()
+                self.descriptors.invalidate(vm.UUIDString())
         except:
             print("VM %s not found" % name)
 
@@ -307,6 +436,7 @@ class Kvirt:
                 return
             else:
                 vm.destroy()
+                self.descriptors.invalidate(vm.UUIDString())
         except:
             print("VM %s not found" % name)
 
@@ -319,53 +449,94 @@ class Kvirt:
         else:
             vm.restart()
 
-    def report(self):
+    def report(self, display=True):
         conn = self.conn
         hostname = conn.getHostname()
         cpus = conn.getCPUMap()[0]
         memory = conn.getInfo()[1]
-        print("Host:%s Cpu:%s Memory:%sMB\n" % (hostname, cpus, memory))
+        report = {'host': hostname, 'cpus': cpus, 'memory': memory, 'pools': [], 'networks': []}
         for pool in conn.listStoragePools():
             poolname = pool
             pool = conn.storagePoolLookupByName(pool)
-            poolxml = pool.XMLDesc(0)
-            root = ET.fromstring(poolxml)
-            pooltype = root.getiterator('pool')[0].get('type')
-            if pooltype == 'dir':
-                poolpath = root.getiterator('path')[0].text
-            else:
-                poolpath = root.getiterator('device')[0].get('path')
+            poolspec = self.descriptors.pool(pool)
+            pooltype = poolspec.type
+            poolpath = poolspec.path if pooltype == 'dir' else poolspec.device
             s = pool.info()
             used = "%.2f" % (float(s[2]) / 1024 / 1024 / 1024)
             available = "%.2f" % (float(s[3]) / 1024 / 1024 / 1024)
             # Type,Status, Total space in Gb, Available space in Gb
             used = float(used)
             available = float(available)
-            print("Storage:%s Type:%s Path:%s Used space:%sGB Available space:%sGB" % (poolname, pooltype, poolpath, used, available))
-        print
+            report['pools'].append({'name': poolname, 'type': pooltype, 'path': poolpath, 'used': used, 'available': available})
         for interface in conn.listAllInterfaces():
             interfacename = interface.name()
             if interfacename == 'lo':
                 continue
-            print("Network:%s Type:bridged" % (interfacename))
+            report['networks'].append({'name': interfacename, 'type': 'bridged'})
+        from netaddr import IPNetwork
         for network in conn.listAllNetworks():
             networkname = network.name()
-            netxml = network.XMLDesc(0)
+            netspec = Network.fromxml(network.XMLDesc(0))
             cidr = 'N/A'
-            root = ET.fromstring(netxml)
-            ip = root.getiterator('ip')
-            if ip:
-                attributes = ip[0].attrib
-                firstip = attributes.get('address')
-                netmask = attributes.get('netmask')
-                ip = IPNetwork('%s/%s' % (firstip, netmask))
-                cidr = ip.cidr
-            dhcp = root.getiterator('dhcp')
-            if dhcp:
-                dhcp = True
+            if netspec.gateway is not None:
+                cidr = str(IPNetwork('%s/%s' % (netspec.gateway, netspec.netmask)).cidr)
+            dhcp = netspec.start is not None
+            report['networks'].append({'name': networkname, 'type': 'routed', 'cidr': cidr, 'dhcp': dhcp})
+        if display:
+            self.printreport(report)
+        return report
+
+    @staticmethod
+    def printreport(report):
+        print("Host:%s Cpu:%s Memory:%sMB\n" % (report['host'], report['cpus'], report['memory']))
+        for pool in report['pools']:
+            print("Storage:%s Type:%s Path:%s Used space:%sGB Available space:%sGB" % (pool['name'], pool['type'], pool['path'], pool['used'], pool['available']))
+        print('')
+        for network in report['networks']:
+            if network['type'] == 'bridged':
+                print("Network:%s Type:bridged" % (network['name']))
             else:
-                dhcp = False
-            print("Network:%s Type:routed Cidr:%s Dhcp:%s" % (networkname, cidr, dhcp))
+                print("Network:%s Type:routed Cidr:%s Dhcp:%s" % (network['name'], network['cidr'], network['dhcp']))
+
+    def capacity(self, count=5, interval=0, display=True):
+        """
+        capacity and usage of the hypervisor, aggregated per plan and per pool out of the bulk stats of every domain,
+        with overcommit ratios and the top count consumers. counters are rates when interval seconds is set
+        """
+        from kvirt.stats import capacity, measure
+        conn = self.conn
+        info = conn.getInfo()
+        pools = {}
+        for pool in conn.listAllStoragePools(0):
+            if not pool.isActive():
+                continue
+            size, allocation, available = pool.info()[1:4]
+            pools[pool.name()] = (self.descriptors.pool(pool).path, size, available)
+        report = capacity(measure(conn, self.descriptors, interval=interval), conn.getCPUMap()[0], info[1], pools, count=count, interval=interval)
+        report['host'] = conn.getHostname()
+        if display:
+            self.printcapacity(report)
+        return report
+
+    @staticmethod
+    def printcapacity(report):
+        rate = "/s" if report['interval'] else ''
+        print("Host:%s Cpu:%s Memory:%sMB Vms:%s Running:%s" % (report['host'], report['cpus'], report['memory'], report['vms'], report['active']))
+        overcommit = report['overcommit']
+        print("Overcommit Cpu:%.2f Memory:%.2f ( with every vm running Cpu:%.2f Memory:%.2f)\n" % (overcommit['cpu'], overcommit['memory'], overcommit['cpudefined'], overcommit['memorydefined']))
+        for plan in sorted(report['plans']):
+            entry = report['plans'][plan]
+            disk = float(entry['blockread'] + entry['blockwrite']) / 1024 / 1024
+            net = float(entry['netrx'] + entry['nettx']) / 1024 / 1024
+            print("Plan:%s Vms:%d Cpus:%d Memory:%dMB Rss:%dMB Cputime:%.1fs%s Disk:%.1fMB%s Net:%.1fMB%s" % (plan or 'N/A', entry['vms'], entry['vcpus'], entry['memory'], entry['rss'], entry['cputime'], rate, disk, rate, net, rate))
+        print('')
+        for pool in sorted(report['pools']):
+            entry = report['pools'][pool]
+            sizes = [float(entry[key]) / 1024 / 1024 / 1024 for key in ['allocation', 'capacity', 'size', 'available']]
+            print("Storage:%s Disks:%d Allocated:%.2fGB Provisioned:%.2fGB Size:%.2fGB Available:%.2fGB Overcommit:%.2f" % tuple([pool, entry['disks']] + sizes + [entry['overcommit']]))
+        print('')
+        for ranking, unit, divider in [('cputime', "s%s" % rate, 1), ('rss', 'MB', 1), ('blockio', "MB%s" % rate, 1024 * 1024), ('netio', "MB%s" % rate, 1024 * 1024)]:
+            print("Top %s: %s" % (ranking, ' '.join("%s(%.1f%s)" % (name, value / divider, unit) for name, value in report['top'][ranking])))
 
     def status(self, name):
         conn = self.conn
@@ -376,43 +547,22 @@ class Kvirt:
             return None
         return status[vm.isActive()]
 
+    def inventory(self):
+        return InventorySnapshot.fromconn(self.conn, self.descriptors)
+
     def list(self):
-        vms = []
-        conn = self.conn
-        status = {0: 'down', 1: 'up'}
-        for vm in conn.listAllDomains(0):
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
-            description = root.getiterator('description')
-            if description:
-                description = description[0].text
-            else:
-                description = ''
-            name = vm.name()
-            state = status[vm.isActive()]
-            ip = ''
-            title = ''
-            if vm.isActive():
-                try:
-                    for address in vm.interfaceAddresses(VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE).values():
-                        ip = address['addrs'][0]['addr']
-                        break
-                except:
-                    ip = ''
-            for entry in root.getiterator('entry'):
-                attributes = entry.attrib
-                if attributes['name'] == 'version':
-                    ip = entry.text
-                if attributes['name'] == 'product':
-                    title = entry.text
-            source = ''
-            for element in root.getiterator('backingStore'):
-                s = element.find('source')
-                if s is not None:
-                    source = os.path.basename(s.get('file'))
-                    break
-            vms.append([name, state, ip, source, description, title])
-        return vms
+        """
+        name, status, ip, source, plan and profile of every vm, sorted by name. inventory() and iterlist() also
+        provide numcpus and memory
+        """
+        return [list(vm[:6]) for vm in self.inventory()]
+
+    def iterlist(self):
+        """
+        yield the entries of list one at a time, as soon as each vm is parsed, instead of sorted once all of them are
+        """
+        for vm in iterinventory(self.conn, self.descriptors):
+            yield list(vm)
 
     def console(self, name):
         conn = self.conn
@@ -421,16 +571,11 @@ class Kvirt:
             print("VM down")
             return
         else:
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
-            for element in root.getiterator('graphics'):
-                attributes = element.attrib
-                if attributes['listen'] == '127.0.0.1':
+            for protocol, listen, port in self.descriptors.domain(vm).graphics:
+                if listen == '127.0.0.1':
                     host = '127.0.0.1'
                 else:
                     host = self.host
-                protocol = attributes['type']
-                port = attributes['port']
                 url = "%s://%s:%s" % (protocol, host, port)
                 os.popen("remote-viewer %s &" % url)
 
@@ -441,395 +586,607 @@ class Kvirt:
             print("VM down")
             return
         else:
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
-            serial = root.getiterator('serial')
-            if not serial:
+            serialport = self.descriptors.domain(vm).serial
+            if not serialport:
                 print("No serial Console found. Leaving...")
                 return
-            for element in serial:
-                serialport = element.find('source').get('service')
-                if serialport:
-                    if self.host in ['localhost', '127.0.0.1']:
-                        serialcommand = "telnet 127.0.0.1 %s" % serialport
-                    elif self.protocol != 'ssh':
-                        print("Remote serial Console requires using ssh . Leaving...")
-                        return
-                    else:
-                        serialcommand = "ssh -p %s %s@%s telnet 127.0.0.1 %s" % (self.port, self.user, self.host, serialport)
-                    os.system(serialcommand)
-                else:
-                    print("No serial Console found. Leaving...")
-                    return
+            if self.host in ['localhost', '127.0.0.1']:
+                serialcommand = "telnet 127.0.0.1 %s" % serialport
+            elif self.protocol != 'ssh':
+                print("Remote serial Console requires using ssh . Leaving...")
+                return
+            else:
+                serialcommand = "ssh -p %s %s@%s telnet 127.0.0.1 %s" % (self.port, self.user, self.host, serialport)
+            os.system(serialcommand)
 
-    def info(self, name):
+    def info(self, name, display=True):
         ips = []
         conn = self.conn
         try:
             vm = conn.lookupByName(name)
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
+            definition = self.descriptors.domain(vm)
         except:
-            print("VM %s not found" % name)
+            if display:
+                print("VM %s not found" % name)
             return
         state = 'down'
-        memory = root.getiterator('memory')[0]
-        unit = memory.attrib['unit']
-        memory = memory.text
-        if unit == 'KiB':
-            memory = float(memory) / 1024
-            memory = int(memory)
-        numcpus = root.getiterator('vcpu')[0]
-        numcpus = numcpus.text
         if vm.isActive():
             state = 'up'
-        print("name:%s" % name)
-        print("status:%s" % state)
-        description = root.getiterator('description')
-        if description:
-            description = description[0].text
-        else:
-            description = ''
-        title = None
-        for entry in root.getiterator('entry'):
-            attributes = entry.attrib
-            if attributes['name'] == 'product':
-                title = entry.text
-        print("description:%s" % description)
-        if title is not None:
-            print("profile: %s" % title)
-        print("cpus:%s" % numcpus)
-        print("memory:%sMB" % memory)
-        nicnumber = 0
-        for element in root.getiterator('interface'):
-            networktype = element.get('type')
+        info = {'name': name, 'status': state, 'description': definition.description, 'profile': definition.title or None, 'cpus': definition.numcpus, 'memory': definition.memory, 'nets': [], 'disks': [], 'ips': ips}
+        addresses = {}
+        if vm.isActive():
+            try:
+                from libvirt import VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE
+                addresses = vm.interfaceAddresses(VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE).values()
+            except:
+                addresses = {}
+        for nicnumber, interface in enumerate(definition.interfaces):
             device = "eth%s" % nicnumber
-            mac = element.find('mac').get('address')
-            if networktype == 'bridge':
-                bridge = element.find('source').get('bridge')
-                print("net interfaces:%s mac:%s net:%s type:bridge" % (device, mac, bridge))
-            else:
-                network = element.find('source').get('network')
-                print("net interfaces:%s mac: %s net: %s type:routed" % (device, mac, network))
-                network = conn.networkLookupByName(network)
-            if vm.isActive():
-                for address in vm.interfaceAddresses(VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE).values():
-                    if address['hwaddr'] == mac:
-                        ip = address['addrs'][0]['addr']
-                        ips.append(ip)
-        for entry in root.getiterator('entry'):
-            attributes = entry.attrib
-            if attributes['name'] == 'version':
-                ip = entry.text
-                ips.append(ip)
-                break
-            nicnumber = nicnumber + 1
-        for element in root.getiterator('disk'):
-            disktype = element.get('device')
-            if disktype == 'cdrom':
+            networktype = 'bridge' if interface.type == 'bridge' else 'routed'
+            info['nets'].append({'device': device, 'mac': interface.mac, 'net': interface.source, 'type': networktype})
+            for address in addresses:
+                if address['hwaddr'] == interface.mac:
+                    ip = address['addrs'][0]['addr']
+                    ips.append(ip)
+        if definition.version is not None:
+            ips.append(definition.version)
+        for disk in definition.disks:
+            if disk.device == 'cdrom':
                 continue
-            device = element.find('target').get('dev')
-            diskformat = 'file'
-            drivertype = element.find('driver').get('type')
-            path = element.find('source').get('file')
-            volume = conn.storageVolLookupByPath(path)
+            volume = conn.storageVolLookupByPath(disk.path)
             disksize = int(float(volume.info()[1]) / 1024 / 1024 / 1024)
-            print("diskname:%s disksize:%sGB diskformat:%s type:%s path:%s" % (device, disksize, diskformat, drivertype, path))
-        for ip in ips:
+            info['disks'].append({'device': disk.dev, 'size': disksize, 'format': 'file', 'type': disk.format, 'path': disk.path})
+        if display:
+            self.printinfo(info)
+        return info
+
+    @staticmethod
+    def printinfo(info):
+        print("name:%s" % info['name'])
+        print("status:%s" % info['status'])
+        print("description:%s" % info['description'])
+        if info['profile'] is not None:
+            print("profile: %s" % info['profile'])
+        print("cpus:%s" % info['cpus'])
+        print("memory:%sMB" % info['memory'])
+        for net in info['nets']:
+            if net['type'] == 'bridge':
+                print("net interfaces:%s mac:%s net:%s type:bridge" % (net['device'], net['mac'], net['net']))
+            else:
+                print("net interfaces:%s mac: %s net: %s type:routed" % (net['device'], net['mac'], net['net']))
+        for disk in info['disks']:
+            print("diskname:%s disksize:%sGB diskformat:%s type:%s path:%s" % (disk['device'], disk['size'], disk['format'], disk['type'], disk['path']))
+        for ip in info['ips']:
             print("ip:%s" % ip)
 
     def volumes(self, iso=False):
         isos = []
         templates = []
-        conn = self.conn
-        for storage in conn.listStoragePools():
-            storage = conn.storagePoolLookupByName(storage)
-            storage.refresh(0)
-            storagexml = storage.XMLDesc(0)
-            root = ET.fromstring(storagexml)
-            for element in root.getiterator('path'):
-                storagepath = element.text
-                break
-            for volume in storage.listVolumes():
-                if volume.endswith('iso'):
-                    isos.append("%s/%s" % (storagepath, volume))
-                elif volume.endswith('qcow2'):
-                    templates.append("%s/%s" % (storagepath, volume))
+        volumes, paths = self._volumeindex()
+        for path in paths:
+            if path.endswith('iso'):
+                isos.append(path)
+            elif path.endswith('qcow2'):
+                templates.append(path)
         if iso:
             return isos
         else:
             return templates
 
-    def delete(self, name):
+    def _undefine(self, name):
+        """
+        destroy and undefine vm name. return the paths of the disks to delete along with it, None if it doesnt exist
+        """
         conn = self.conn
         try:
             vm = conn.lookupByName(name)
-        except:
-            return
+        except Exception:
+            return None
         status = {0: 'down', 1: 'up'}
-        vmxml = vm.XMLDesc(0)
-        root = ET.fromstring(vmxml)
         disks = []
-        for element in root.getiterator('disk'):
-            source = element.find('source')
-            if source is not None:
-                imagefile = element.find('source').get('file')
-                if 'iso' not in imagefile or name in imagefile:
-                    disks.append(imagefile)
+        for disk in self.descriptors.domain(vm).disks:
+            if disk.path is not None and ('iso' not in disk.path or name in disk.path):
+                disks.append(disk.path)
         if status[vm.isActive()] != "down":
             vm.destroy()
         vm.undefine()
-        for storage in conn.listStoragePools():
-            deleted = False
-            storage = conn.storagePoolLookupByName(storage)
-            storage.refresh(0)
-            for stor in storage.listVolumes():
-                for disk in disks:
-                    if stor in disk:
-                        volume = storage.storageVolLookupByName(stor)
-                        volume.delete(0)
-                        deleted = True
-            if deleted:
-                storage.refresh(0)
+        self.descriptors.invalidate(vm.UUIDString())
+        return disks
+
+    def _deletevolumes(self, disks, workers=1):
+        """
+        delete the volumes at paths disks. when there are several, they are resolved through the volume index,
+        built once, and grouped by pool so that pools are emptied concurrently
+        """
+        conn = self.conn
+        if len(disks) > 1:
+            self._volumeindex()
+        pools = {}
+        for disk in disks:
+            if self._paths is not None and disk in self._paths:
+                entry = self._paths[disk]
+                pool, volume = entry['pool'].name(), entry['object']
+            else:
+                try:
+                    volume = conn.storageVolLookupByPath(disk)
+                    pool = volume.storagePoolLookupByVolume().name()
+                except Exception:
+                    continue
+            pools.setdefault(pool, []).append((disk, volume))
+
+        def empty(pool):
+            for disk, volume in pools[pool]:
+                try:
+                    volume.delete(0)
+                except Exception:
+                    continue
+                self._unindexvolume(disk)
+        self._map(empty, sorted(pools), workers=workers)
+
+    def delete(self, name):
+        disks = self._undefine(name)
+        if disks is not None:
+            self._deletevolumes(disks)
+
+    def delete_many(self, names, workers=4):
+        """
+        delete several vms concurrently, then their volumes in one batch per pool
+        """
+        undefined = self._map(self._undefine, names, workers=workers)
+        self._deletevolumes([disk for disks in undefined if disks is not None for disk in disks], workers=workers)
+        return [{'result': 'success'} if disks is not None else {'result': 'failure', 'reason': "VM %s not found" % name} for name, disks in zip(names, undefined)]
+
+    def start_many(self, names, workers=4):
+        return self._map(self.start, names, workers=workers)
+
+    def stop_many(self, names, workers=4):
+        return self._map(self.stop, names, workers=workers)
 
     def _xmldisk(self, diskpath, diskdev, diskbus='virtio', diskformat='qcow2'):
-        diskxml = """<disk type='file' device='disk'>
-        <driver name='qemu' type='%s' cache='none'/>
-        <source file='%s'/>
-        <target bus='%s' dev='%s'/>
-        </disk>""" % (diskformat, diskpath, diskbus, diskdev)
-        return diskxml
-
-    def _xmlvolume(self, path, size, pooltype='file', backing=None, diskformat='qcow2'):
-        size = int(size) * MB
-        name = path.split('/')[-1]
-        if pooltype == 'block':
-            volume = """<volume type='block'>
-                        <name>%s</name>
-                        <capacity unit="bytes">%d</capacity>
-                        <target>
-                        <path>%s</path>
-                        <compat>1.1</compat>
-                      </target>
-                    </volume>""" % (name, size, path)
-            return volume
-        if backing is not None:
-            backingstore = """
-<backingStore>
-<path>%s</path>
-<format type='%s'/>
-</backingStore>""" % (backing, diskformat)
-        else:
-            backingstore = "<backingStore/>"
-        volume = """
-<volume type='file'>
-<name>%s</name>
-<capacity unit="bytes">%d</capacity>
-<target>
-<path>%s</path>
-<format type='%s'/>
-<permissions>
-<mode>0644</mode>
-</permissions>
-<compat>1.1</compat>
-</target>
-%s
-</volume>""" % (name, size, path, diskformat, backingstore)
-        return volume
-
-    def clone(self, old, new, full=False, start=False):
+        return Disk(diskpath, diskdev, bus=diskbus, format=diskformat, cache='none').xml()
+
+    def _xmlvolume(self, path, size, pooltype='file', backing=None, diskformat='qcow2', capacity=None, backingformat=None):
+        size = int(size) * MB if capacity is None else capacity
+        return Volume(path, size, format=diskformat, backing=backing, backingformat=backingformat, pooltype=pooltype).xml()
+
+    def _freeze(self, name):
+        """
+        take an external disk only snapshot of name, so that its current disks are no longer written and can back
+        linked clones, while the vm goes on, running or not, over new overlays. return a dict target -> (path, format)
+        of the frozen disks
+        """
+        from libvirt import VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC, VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY, VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA
         conn = self.conn
-        oldvm = conn.lookupByName(old)
-        oldxml = oldvm.XMLDesc(0)
-        tree = ET.fromstring(oldxml)
-        uuid = tree.getiterator('uuid')[0]
-        tree.remove(uuid)
-        for vmname in tree.getiterator('name'):
-            vmname.text = new
+        vm = conn.lookupByName(name)
+        root = ET.fromstring(self.descriptors.xml(vm))
+        stamp = int(time.time())
+        snapshot = ET.Element('domainsnapshot')
+        ET.SubElement(snapshot, 'name').text = "kcli-%d" % stamp
+        disks = ET.SubElement(snapshot, 'disks')
+        frozen, overlays = {}, []
+        for disk in root.iter('disk'):
+            target = disk.find('target').get('dev')
+            source = disk.find('source')
+            if disk.get('device') != 'disk' or source is None or source.get('file') is None:
+                ET.SubElement(disks, 'disk', {'name': target, 'snapshot': 'no'})
+                continue
+            path = source.get('file')
+            driver = disk.find('driver')
+            frozen[target] = (path, driver.get('type', 'raw') if driver is not None else 'raw')
+            base, extension = os.path.splitext(path)
+            overlay = "%s-%d%s" % (base, stamp, extension)
+            overlays.append((path, overlay))
+            entry = ET.SubElement(disks, 'disk', {'name': target, 'snapshot': 'external'})
+            ET.SubElement(entry, 'driver', {'type': 'qcow2'})
+            ET.SubElement(entry, 'source', {'file': overlay})
+        flags = VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY | VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA | VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+        vm.snapshotCreateXML(ET.tostring(snapshot).decode('utf-8'), flags)
+        self.descriptors.invalidate(vm.UUIDString())
+        for path, overlay in overlays:
+            pool = conn.storageVolLookupByPath(path).storagePoolLookupByVolume()
+            pool.refresh(0)
+            self._indexvolume(pool, pool.storageVolLookupByName(os.path.basename(overlay)), os.path.dirname(overlay))
+        return frozen
+
+    def clone(self, old, new, full=False, start=False, linked=False, frozen=None):
+        """
+        clone old into new, copying its first disk, or all of them when full. linked clones get instead qcow2 overlays
+        backed by the disks of old, frozen beforehand with an external snapshot unless frozen, as returned by _freeze, is given.
+        return the time it took and the bytes allocated for the new volumes
+        """
+        begin = time.time()
+        conn = self.conn
+        try:
+            oldvm = conn.lookupByName(old)
+        except Exception:
+            print("VM %s not found" % old)
+            return {'result': 'failure', 'reason': "VM %s not found" % old}
+        if linked and frozen is None:
+            frozen = self._freeze(old)
+            oldvm = conn.lookupByName(old)
+        tree = ET.fromstring(self.descriptors.xml(oldvm))
+        uuid = tree.find('uuid')
+        if uuid is not None:
+            tree.remove(uuid)
+        tree.find('name').text = new
+        devices = tree.find('devices')
+        allocation = 0
         firstdisk = True
-        for disk in tree.getiterator('disk'):
-            if firstdisk or full:
-                source = disk.find('source')
-                oldpath = source.get('file')
+        for disk in devices.findall('disk'):
+            source = disk.find('source')
+            target = disk.find('target').get('dev')
+            driver = disk.find('driver')
+            if linked:
+                if target not in frozen:
+                    devices.remove(disk)
+                    continue
+                backing, backingformat = frozen[target]
+                oldvolume = conn.storageVolLookupByPath(backing)
+                newpath = self._clonepath(backing, old, new)
+                newvolumexml = self._xmlvolume(newpath, 0, backing=backing, capacity=oldvolume.info()[1], backingformat=backingformat)
+                pool = oldvolume.storagePoolLookupByVolume()
+                newvolume = pool.createXML(newvolumexml, 0)
+                driver.set('type', 'qcow2')
                 backingstore = disk.find('backingStore')
+                if backingstore is not None:
+                    disk.remove(backingstore)
+            elif (firstdisk or full) and source is not None and source.get('file') is not None:
+                oldpath = source.get('file')
                 backing = None
-                for b in backingstore.getiterator():
-                    backingstoresource = b.find('source')
-                    if backingstoresource is not None:
-                        backing = backingstoresource.get('file')
-                newpath = oldpath.replace(old, new)
-                source.set('file', newpath)
+                backingstore = disk.find('backingStore')
+                if backingstore is not None:
+                    for b in backingstore.iter():
+                        backingstoresource = b.find('source')
+                        if backingstoresource is not None:
+                            backing = backingstoresource.get('file')
+                newpath = self._clonepath(oldpath, old, new)
                 oldvolume = conn.storageVolLookupByPath(oldpath)
-                oldinfo = oldvolume.info()
-                oldvolumesize = (float(oldinfo[1]) / 1024 / 1024 / 1024)
-                newvolumexml = self._xmlvolume(newpath, oldvolumesize, backing)
+                diskformat = driver.get('type', 'qcow2') if driver is not None else 'qcow2'
+                newvolumexml = self._xmlvolume(newpath, 0, backing=backing, diskformat=diskformat, capacity=oldvolume.info()[1])
                 pool = oldvolume.storagePoolLookupByVolume()
-                pool.createXMLFrom(newvolumexml, oldvolume, 0)
+                newvolume = pool.createXMLFrom(newvolumexml, oldvolume, 0)
                 firstdisk = False
+            elif firstdisk or full:
+                continue
             else:
-                devices = tree.getiterator('devices')[0]
                 devices.remove(disk)
-        for interface in tree.getiterator('interface'):
+                continue
+            source.set('file', newpath)
+            self._indexvolume(pool, newvolume, os.path.dirname(newpath))
+            allocation += newvolume.info()[2]
+        for interface in tree.iter('interface'):
             mac = interface.find('mac')
-            interface.remove(mac)
+            if mac is not None:
+                interface.remove(mac)
         if self.host not in ['127.0.0.1', 'localhost']:
-            for serial in tree.getiterator('serial'):
+            for serial in tree.iter('serial'):
                 source = serial.find('source')
                 source.set('service', str(self._get_free_port()))
-        newxml = ET.tostring(tree)
+        newxml = ET.tostring(tree).decode('utf-8')
         conn.defineXML(newxml)
         vm = conn.lookupByName(new)
         if start:
             vm.setAutostart(1)
             vm.create()
+        return {'result': 'success', 'time': time.time() - begin, 'allocation': allocation}
+
+    def clone_many(self, old, names, full=False, start=False, linked=False, workers=4):
+        """
+        clone old into each of names. linked clones all share the disks of old, frozen once, as backing files.
+        clones are spread over workers threads, so that copies to different pools run concurrently.
+        results are returned in the order of names
+        """
+        frozen = None
+        if linked:
+            try:
+                frozen = self._freeze(old)
+            except Exception as e:
+                return [{'result': 'failure', 'reason': str(e)} for name in names]
+
+        def clone(name):
+            try:
+                return self.clone(old, name, full=full, start=start, linked=linked, frozen=frozen)
+            except Exception as e:
+                return {'result': 'failure', 'reason': str(e)}
+        return self._map(clone, names, workers=workers)
+
+    @staticmethod
+    def _clonepath(path, old, new):
+        """
+        path of the copy for vm new of path, a disk of vm old
+        """
+        directory, name = os.path.split(path)
+        if old in name:
+            name = name.replace(old, new)
+        else:
+            name = "%s-%s" % (new, name)
+        return "%s/%s" % (directory, name)
 
     def _cloudinit(self, name, keys=None, cmds=None, nets=[], gateway=None, dns=None, domain=None):
+        """
+        return the nocloud seed iso of name, built in memory
+        """
         default_gateway = gateway
-        with open('/tmp/meta-data', 'w') as metadatafile:
-            if domain is not None:
-                localhostname = "%s.%s" % (name, domain)
-            else:
-                localhostname = name
-            metadatafile.write('instance-id: XXX\nlocal-hostname: %s\n' % localhostname)
-            metadata = ''
-            if nets:
-                for index, net in enumerate(nets):
-                    if isinstance(net, str):
-                        if index == 0:
-                            continue
-                        nicname = "eth%d" % index
-                        ip = None
-                        netmask = None
-                    elif isinstance(net, dict):
-                        nicname = net.get('nic', "eth%d" % index)
-                        ip = net.get('ip')
-                        netmask = net.get('mask')
-                    metadata += "  auto %s\n" % nicname
-                    if ip is not None and netmask is not None:
-                        metadata += "  iface %s inet static\n" % nicname
-                        metadata += "  address %s\n" % ip
-                        metadata += "  netmask %s\n" % netmask
-                        gateway = net.get('gateway')
-                        if index == 0 and default_gateway is not None:
-                            metadata += "  gateway %s\n" % default_gateway
-                        elif gateway is not None:
-                            metadata += "  gateway %s\n" % gateway
-                    else:
-                        metadata += "  iface %s inet dhcp\n" % nicname
-                if metadata:
-                    metadatafile.write("network-interfaces: |\n")
-                    metadatafile.write(metadata)
-                    if dns is not None:
-                        metadatafile.write("  dns-nameservers %s\n" % dns)
-                    if domain is not None:
-                        metadatafile.write("  dns-search %s\n" % domain)
-        with open('/tmp/user-data', 'w') as userdata:
-            userdata.write('#cloud-config\nhostname: %s\n' % name)
-            if domain is not None:
-                userdata.write("fqdn: %s.%s\n" % (name, domain))
-            if keys is not None:
-                userdata.write("ssh_authorized_keys:\n")
-                for key in keys:
-                    userdata.write("- %s\n" % key)
-            elif os.path.exists("%s/.ssh/id_rsa.pub" % os.environ['HOME']):
-                publickeyfile = "%s/.ssh/id_rsa.pub" % os.environ['HOME']
-                with open(publickeyfile, 'r') as ssh:
-                    key = ssh.read().rstrip()
-                    userdata.write("ssh_authorized_keys:\n")
-                    userdata.write("- %s\n" % key)
-            if cmds is not None:
-                    userdata.write("runcmd:\n")
-                    for cmd in cmds:
-                        userdata.write("- %s\n" % cmd)
-        os.system("mkisofs --quiet -o /tmp/%s.iso --volid cidata --joliet --rock /tmp/user-data /tmp/meta-data" % name)
-
-    def handler(self, stream, data, file_):
-        return file_.read(data)
-
-    def _uploadiso(self, name, pool='default'):
+        if domain is not None:
+            localhostname = "%s.%s" % (name, domain)
+        else:
+            localhostname = name
+        metadatacontent = 'instance-id: XXX\nlocal-hostname: %s\n' % localhostname
+        metadata = ''
+        if nets:
+            for index, net in enumerate(nets):
+                if isinstance(net, str):
+                    if index == 0:
+                        continue
+                    nicname = "eth%d" % index
+                    ip = None
+                    netmask = None
+                elif isinstance(net, dict):
+                    nicname = net.get('nic', "eth%d" % index)
+                    ip = net.get('ip')
+                    netmask = net.get('mask')
+                metadata += "  auto %s\n" % nicname
+                if ip is not None and netmask is not None:
+                    metadata += "  iface %s inet static\n" % nicname
+                    metadata += "  address %s\n" % ip
+                    metadata += "  netmask %s\n" % netmask
+                    gateway = net.get('gateway')
+                    if index == 0 and default_gateway is not None:
+                        metadata += "  gateway %s\n" % default_gateway
+                    elif gateway is not None:
+                        metadata += "  gateway %s\n" % gateway
+                else:
+                    metadata += "  iface %s inet dhcp\n" % nicname
+            if metadata:
+                metadatacontent += "network-interfaces: |\n"
+                metadatacontent += metadata
+                if dns is not None:
+                    metadatacontent += "  dns-nameservers %s\n" % dns
+                if domain is not None:
+                    metadatacontent += "  dns-search %s\n" % domain
+        userdata = '#cloud-config\nhostname: %s\n' % name
+        if domain is not None:
+            userdata += "fqdn: %s.%s\n" % (name, domain)
+        if keys is not None:
+            userdata += "ssh_authorized_keys:\n"
+            for key in keys:
+                userdata += "- %s\n" % key
+        elif os.path.exists("%s/.ssh/id_rsa.pub" % os.environ['HOME']):
+            publickeyfile = "%s/.ssh/id_rsa.pub" % os.environ['HOME']
+            with open(publickeyfile, 'r') as ssh:
+                key = ssh.read().rstrip()
+                userdata += "ssh_authorized_keys:\n"
+                userdata += "- %s\n" % key
+        if cmds is not None:
+                userdata += "runcmd:\n"
+                for cmd in cmds:
+                    userdata += "- %s\n" % cmd
+        from kvirt.iso import seed
+        return seed(userdata, metadatacontent)
+
+    def _uploadiso(self, name, pool='default', origin=None, poolpath=None, data=None):
+        """
+        upload an iso as volume <name>.iso of pool, either from origin or from data, its content
+        """
+        if data is not None:
+            origin = BytesIO(data)
+        elif origin is None:
+            origin = "/tmp/%s.iso" % name
+        self._upload(pool, "%s.iso" % name, origin, poolpath=poolpath)
+
+    def _upload(self, pool, name, origin, poolpath=None, chunksize=CHUNKSIZE, sparse=False, callback=None):
+        """
+        create volume name in pool and stream origin, a path or a file object, into it.
+        return the number of bytes sent and the time it took
+        """
+        conn = self.conn
+        if poolpath is None:
+            poolpath = self.descriptors.pool(pool).path
+        opened = not hasattr(origin, 'read')
+        if opened:
+            origin = open(origin, 'rb')
+        try:
+            size = filesize(origin)
+            path = "%s/%s" % (poolpath, name)
+            volxml = self._xmlvolume(path=path, size=0, diskformat='raw', capacity=size)
+            volume = pool.createXML(volxml, 0)
+            self._indexvolume(pool, volume, poolpath)
+            stream = conn.newStream(0)
+            sparse = sparse and hasattr(stream, 'sendHole')
+            try:
+                if sparse:
+                    from libvirt import VIR_STORAGE_VOL_UPLOAD_SPARSE_STREAM
+                    volume.upload(stream, 0, size, VIR_STORAGE_VOL_UPLOAD_SPARSE_STREAM)
+                else:
+                    volume.upload(stream, 0, size, 0)
+                elapsed = send(stream, origin, size, chunksize=chunksize, sparse=sparse, callback=callback)
+                stream.finish()
+            except Exception:
+                try:
+                    stream.abort()
+                except Exception:
+                    pass
+                self._unindexvolume(path)
+                volume.delete(0)
+                raise
+        finally:
+            if opened:
+                origin.close()
+        return size, elapsed
+
+    def upload_volume(self, pool, origin, name=None, chunksize=CHUNKSIZE, sparse=True, callback=None):
+        """
+        upload origin, a path or a file object, as volume name of pool, named after origin by default.
+        chunks of zeros are sent as holes when sparse and callback(sent, size, elapsed) is called after each chunk
+        """
+        conn = self.conn
+        if name is None:
+            if hasattr(origin, 'read'):
+                return {'result': 'failure', 'reason': "Missing volume name"}
+            name = os.path.basename(origin)
+        if not hasattr(origin, 'read') and not os.path.exists(origin):
+            return {'result': 'failure', 'reason': "File %s not found" % origin}
+        try:
+            storagepool = conn.storagePoolLookupByName(pool)
+        except Exception:
+            return {'result': 'failure', 'reason': "Pool %s not found" % pool}
+        try:
+            size, elapsed = self._upload(storagepool, name, origin, chunksize=chunksize, sparse=sparse, callback=callback)
+        except Exception as e:
+            return {'result': 'failure', 'reason': str(e)}
+        storagepool.refresh(0)
+        return {'result': 'success', 'size': size, 'time': elapsed, 'rate': size / elapsed if elapsed else 0}
+
+    def import_volume(self, pool, path, name=None, checksum=None, offset=None, workers=4, chunksize=CHUNKSIZE, segment=SEGMENT, sparse=True, callback=None, checkpoint=None):
+        """
+        import path, a local image, as volume name of pool, named after path by default. the image is read ahead by workers
+        threads and streamed in segments of segment bytes, checkpoint(offset) being called after each of them, so that
+        an interrupted import can be resumed by passing the last offset reported. an existing volume is only written over
+        when offset is given. when checksum, the expected sha256 of the image, is given, it is verified along the way and
+        the volume removed if it doesnt match. callback(sent, size, elapsed) is called after each chunk
+        """
         conn = self.conn
-        poolxml = pool.XMLDesc(0)
-        root = ET.fromstring(poolxml)
-        for element in root.getiterator('path'):
-            poolpath = element.text
-            break
-        isopath = "%s/%s.iso" % (poolpath, name)
-        isoxml = self._xmlvolume(path=isopath, size=0, diskformat='raw')
-        pool.createXML(isoxml, 0)
-        isovolume = conn.storageVolLookupByPath(isopath)
-        stream = conn.newStream(0)
-        isovolume.upload(stream, 0, 0)
-        with open("/tmp/%s.iso" % name) as origin:
-            stream.sendAll(self.handler, origin)
-            stream.finish()
+        if name is None:
+            name = os.path.basename(path)
+        if not os.path.exists(path):
+            return {'result': 'failure', 'reason': "File %s not found" % path}
+        try:
+            storagepool = conn.storagePoolLookupByName(pool)
+        except Exception:
+            return {'result': 'failure', 'reason': "Pool %s not found" % pool}
+        poolpath = self.descriptors.pool(storagepool).path
+        volumepath = "%s/%s" % (poolpath, name)
+        size = os.path.getsize(path)
+        volumes, paths = self._volumeindex()
+        volume = paths[volumepath]['object'] if volumepath in paths else None
+        if volume is not None and offset is None:
+            return {'result': 'failure', 'reason': "Volume %s already exists" % name, 'exists': True}
+        if volume is not None and not offset:
+            self._unindexvolume(volumepath)
+            volume.delete(0)
+            volume = None
+        if volume is None:
+            offset = 0
+            volxml = self._xmlvolume(path=volumepath, size=0, diskformat='raw', capacity=size)
+            volume = storagepool.createXML(volxml, 0)
+            self._indexvolume(storagepool, volume, poolpath)
+        chunksize = min(chunksize, segment)
+        segment -= segment % chunksize
+        zeros = b'\x00' * chunksize
+        digest = hashlib.sha256() if checksum is not None else None
+        begin = time.time()
+        sent = offset
+        reader = None
+        try:
+            if digest is not None and offset:
+                for chunk in readahead(path, 0, offset, chunksize=chunksize, workers=workers):
+                    digest.update(chunk)
+            reader = readahead(path, offset, size - offset, chunksize=chunksize, workers=workers)
+            while sent < size:
+                length = min(segment, size - sent)
+                stream = conn.newStream(0)
+                holes = sparse and hasattr(stream, 'sendHole')
+                if holes:
+                    from libvirt import VIR_STORAGE_VOL_UPLOAD_SPARSE_STREAM
+                    volume.upload(stream, sent, length, VIR_STORAGE_VOL_UPLOAD_SPARSE_STREAM)
+                else:
+                    volume.upload(stream, sent, length, 0)
+                try:
+                    done = 0
+                    while done < length:
+                        chunk = next(reader)
+                        if digest is not None:
+                            digest.update(chunk)
+                        done += write(stream, chunk, zeros if holes else None)
+                        if callback is not None:
+                            callback(sent + done, size, time.time() - begin)
+                    stream.finish()
+                except Exception:
+                    try:
+                        stream.abort()
+                    except Exception:
+                        pass
+                    raise
+                sent += length
+                if checkpoint is not None:
+                    checkpoint(sent)
+        except Exception as e:
+            return {'result': 'failure', 'reason': str(e), 'offset': sent}
+        finally:
+            if reader is not None:
+                reader.close()
+        elapsed = time.time() - begin
+        if digest is not None and digest.hexdigest() != checksum.lower():
+            self._unindexvolume(volumepath)
+            volume.delete(0)
+            return {'result': 'failure', 'reason': "Checksum mismatch for %s" % path}
+        storagepool.refresh(0)
+        return {'result': 'success', 'size': size - offset, 'time': elapsed, 'rate': (size - offset) / elapsed if elapsed else 0}
 
     def update_ip(self, name, ip):
         conn = self.conn
         vm = conn.lookupByName(name)
-        xml = vm.XMLDesc(0)
-        root = ET.fromstring(xml)
+        root = ET.fromstring(self.descriptors.xml(vm))
         if not vm:
             print("VM %s not found" % name)
         if vm.isActive() == 1:
             print("Machine up. Change will only appear upon next reboot")
-        os = root.getiterator('os')[0]
+        os = root.find('os')
         smbios = os.find('smbios')
         if smbios is None:
             newsmbios = ET.Element("smbios", mode="sysinfo")
             os.append(newsmbios)
-        sysinfo = root.getiterator('sysinfo')
-        system = root.getiterator('system')
-        if not sysinfo:
+        sysinfo = root.find('sysinfo')
+        if sysinfo is None:
             sysinfo = ET.Element("sysinfo", type="smbios")
             root.append(sysinfo)
-        sysinfo = root.getiterator('sysinfo')[0]
-        if not system:
+        system = sysinfo.find('system')
+        if system is None:
             system = ET.Element("system")
             sysinfo.append(system)
-        system = root.getiterator('system')[0]
         versionfound = False
-        for entry in root.getiterator('entry'):
-            attributes = entry.attrib
-            if attributes['name'] == 'version':
+        for entry in system.iter('entry'):
+            if entry.get('name') == 'version':
                 entry.text = ip
                 versionfound = True
         if not versionfound:
             version = ET.Element("entry", name="version")
             version.text = ip
             system.append(version)
-        newxml = ET.tostring(root)
+        newxml = ET.tostring(root).decode('utf-8')
         conn.defineXML(newxml)
+        self.descriptors.invalidate(vm.UUIDString())
 
     def update_memory(self, name, memory):
         conn = self.conn
         memory = str(int(memory) * 1024)
         try:
             vm = conn.lookupByName(name)
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
+            root = ET.fromstring(self.descriptors.xml(vm))
         except:
             print("VM %s not found" % name)
             return
-        memorynode = root.getiterator('memory')[0]
-        memorynode.text = memory
-        currentmemory = root.getiterator('currentMemory')[0]
-        currentmemory.text = memory
-        newxml = ET.tostring(root)
+        for element in [root.find('memory'), root.find('currentMemory')]:
+            if element is not None:
+                element.text = memory
+                element.set('unit', 'KiB')
+        newxml = ET.tostring(root).decode('utf-8')
         conn.defineXML(newxml)
+        self.descriptors.invalidate(vm.UUIDString())
 
     def update_cpu(self, name, numcpus):
         conn = self.conn
         try:
             vm = conn.lookupByName(name)
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
+            root = ET.fromstring(self.descriptors.xml(vm))
         except:
             print("VM %s not found" % name)
             return
-        cpunode = root.getiterator('vcpu')[0]
-        cpunode.text = numcpus
-        newxml = ET.tostring(root)
+        cpunode = root.find('vcpu')
+        cpunode.text = str(numcpus)
+        newxml = ET.tostring(root).decode('utf-8')
         conn.defineXML(newxml)
+        self.descriptors.invalidate(vm.UUIDString())
 
     def add_disk(self, name, size, pool=None, thin=True):
         conn = self.conn
@@ -842,39 +1199,30 @@ class Kvirt:
             diskformat = 'raw'
         try:
             vm = conn.lookupByName(name)
-            xml = vm.XMLDesc(0)
-            root = ET.fromstring(xml)
+            definition = self.descriptors.domain(vm)
         except:
             print("VM %s not found" % name)
             return
-        currentdisk = 0
-        for element in root.getiterator('disk'):
-            disktype = element.get('device')
-            if disktype == 'cdrom':
-                continue
-            currentdisk = currentdisk + 1
+        currentdisk = len([disk for disk in definition.disks if disk.device != 'cdrom'])
         diskindex = currentdisk + 1
         diskdev = "vd%s" % string.ascii_lowercase[currentdisk]
         if pool is not None:
             pool = conn.storagePoolLookupByName(pool)
-            poolxml = pool.XMLDesc(0)
-            poolroot = ET.fromstring(poolxml)
-            pooltype = poolroot.getiterator('pool')[0].get('type')
-            for element in poolroot.getiterator('path'):
-                poolpath = element.text
-                break
+            poolspec = self.descriptors.pool(pool)
+            pooltype, poolpath = poolspec.type, poolspec.path
         else:
             print("Pool not found. Leaving....")
             return
-        pool.refresh(0)
         storagename = "%s_%d.img" % (name, diskindex)
         diskpath = "%s/%s" % (poolpath, storagename)
         volxml = self._xmlvolume(path=diskpath, size=size, pooltype=pooltype, diskformat=diskformat, backing=None)
         if pooltype == 'logical':
             diskformat = 'raw'
         diskxml = self._xmldisk(diskpath=diskpath, diskdev=diskdev, diskbus=diskbus, diskformat=diskformat)
-        pool.createXML(volxml, 0)
+        volume = pool.createXML(volxml, 0)
+        self._indexvolume(pool, volume, poolpath)
         vm.attachDevice(diskxml)
+        self.descriptors.invalidate(vm.UUIDString())
 
     def ssh(self, name):
         ubuntus = ['utopic', 'vivid', 'wily', 'xenial', 'yakkety']
@@ -886,8 +1234,8 @@ class Kvirt:
         if vm.isActive() != 1:
             print("Machine down. Cannot ssh...")
             return
-        vm = [v for v in self.list() if v[0] == name][0]
-        template = vm[3]
+        vm = parse(name, True, self.descriptors.xml(vm), leases(conn))
+        template = vm.source
         if template != '':
             if 'centos' in template.lower():
                 user = 'centos'
@@ -901,12 +1249,58 @@ class Kvirt:
                 user = 'cloud-user'
             elif 'debian' in template.lower():
                 user = 'debian'
-        ip = vm[2]
+        ip = vm.ip
         if ip == '':
             print("No ip found. Cannot ssh...")
         else:
             os.system("ssh %s@%s" % (user, ip))
 
+    def wait(self, names, state='up', timeout=300, interval=2):
+        """
+        wait until vms names are up, have an ip or accept ssh connections, for at most timeout seconds.
+        all of them are checked at once, with a single pass over domains and leases, upon each domain lifecycle event
+        or every interval seconds otherwise, since dhcp leases dont trigger events
+        """
+        if state not in ['up', 'ip', 'ssh']:
+            return {'result': 'failure', 'reason': "Invalid state %s" % state}
+        begin = time.time()
+        # events are only delivered to connections opened once the event loop runs
+        events.start()
+        conn = manager.open(self.url)
+        if conn is None:
+            return {'result': 'failure', 'reason': "Couldnt connect to specify hypervisor %s" % self.host}
+        descriptors = manager.descriptors(self.url, shared=False)
+        descriptors.bind(conn)
+        changed = threading.Event()
+        try:
+            ids = events.notify(conn, changed)
+        except Exception:
+            ids = []
+        pending = set(names)
+        try:
+            while True:
+                changed.clear()
+                inventory = InventorySnapshot.fromconn(conn, descriptors)
+                ready = {}
+                for name in pending:
+                    vm = inventory.get(name)
+                    if vm is not None and vm.status == 'up' and (state == 'up' or vm.ip):
+                        ready[name] = vm.ip
+                if state == 'ssh':
+                    ips = reachable(set(ready.values()))
+                    ready = dict((name, ip) for name, ip in ready.items() if ip in ips)
+                pending -= set(ready)
+                remaining = timeout - (time.time() - begin)
+                if not pending or remaining <= 0:
+                    break
+                changed.wait(min(interval, remaining))
+        finally:
+            events.unnotify(conn, ids)
+            conn.close()
+        if pending:
+            return {'result': 'failure', 'reason': "Timeout waiting for %s" % ','.join(sorted(pending)), 'pending': sorted(pending)}
+        return {'result': 'success', 'time': time.time() - begin}
+
     def _get_free_port(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.bind(('localhost', 0))
@@ -931,26 +1325,9 @@ class Kvirt:
                 os.system(cmd2)
             else:
                 print("Make sur %s directory exists on hypervisor" % name)
-            poolxml = """<pool type='dir'>
-                         <name>%s</name>
-                         <source>
-                         </source>
-                         <target>
-                         <path>%s</path>
-                         </target>
-                         </pool>""" % (name, poolpath)
+            poolxml = Pool(name, poolpath).xml()
         elif pooltype == 'logical':
-            poolxml = """<pool type='logical'>
-                         <name>%s</name>
-                         <source>
-                         <device path='%s'/>
-                         <name>%s</name>
-                         <format type='lvm2'/>
-                         </source>
-                         <target>
-                         <path>/dev/%s</path>
-                         </target>
-                         </pool>""" % (name, poolpath, name, name)
+            poolxml = Pool(name, "/dev/%s" % name, type='logical', device=poolpath).xml()
         else:
             print("Invalid pool type %s.Leaving..." % pooltype)
             return
@@ -961,6 +1338,8 @@ class Kvirt:
         pool.create()
 
     def create_network(self, name, cidr, dhcp=True):
+        from iptools import IpRange
+        from netaddr import IPNetwork
         conn = self.conn
         try:
             range = IpRange(cidr)
@@ -969,25 +1348,10 @@ class Kvirt:
             return
         netmask = IPNetwork(cidr).netmask
         gateway = range[1]
+        network = Network(name, gateway=gateway, netmask=netmask)
         if dhcp:
-            start = range[2]
-            end = range[-2]
-            dhcpxml = """<dhcp>
-                    <range start='%s' end='%s'/>
-                    </dhcp>""" % (start, end)
-        else:
-            dhcpxml = ''
-        networkxml = """<network><name>%s</name>
-                    <forward mode='nat'>
-                    <nat>
-                    <port start='1024' end='65535'/>
-                    </nat>
-                    </forward>
-                    <domain name='%s'/>
-                    <ip address='%s' netmask='%s'>
-                    %s
-                    </ip>
-                    </network>""" % (name, name, gateway, netmask, dhcpxml)
+            network.start, network.end = range[2], range[-2]
+        networkxml = network.xml()
         new_net = conn.networkDefineXML(networkxml)
         new_net.setAutostart(True)
         new_net.create()
@@ -1027,9 +1391,11 @@ class Kvirt:
         if full:
             for vol in pool.listAllVolumes():
                 vol.delete(0)
+            self._volumes, self._paths = None, None
         if pool.isActive():
             pool.destroy()
         pool.undefine()
+        self.descriptors.invalidate(pool.UUIDString())
 
     def bootstrap(self, pool=None, poolpath=None, pooltype='dir', nets={}):
         conn = self.conn
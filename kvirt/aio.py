@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio facade over Kvirt, to drive several hypervisors concurrently. requires python3
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from kvirt import Kvirt
+
+
+class AsyncKvirt:
+    """
+    expose Kvirt methods as coroutines, offloading libvirt calls to an executor dedicated to the connection
+    and allowing at most maxinflight calls against the hypervisor at once
+    """
+    def __init__(self, host='127.0.0.1', port=None, user='root', protocol='ssh', url=None, maxinflight=4, kvirt=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.protocol = protocol
+        self.url = url
+        self.maxinflight = maxinflight
+        self.executor = ThreadPoolExecutor(max_workers=maxinflight)
+        self.k = kvirt
+        self._semaphore = None
+        self._lock = None
+
+    @classmethod
+    def fromoptions(cls, options, maxinflight=4):
+        """
+        build from a client section of kcli.yml
+        """
+        return cls(host=options.get('host', '127.0.0.1'), port=options.get('port'), user=options.get('user', 'root'),
+                   protocol=options.get('protocol', 'ssh'), url=options.get('url'), maxinflight=maxinflight)
+
+    async def _kvirt(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.maxinflight)
+        async with self._lock:
+            if self.k is None:
+                loop = asyncio.get_event_loop()
+                connect = functools.partial(Kvirt, host=self.host, port=self.port, user=self.user, protocol=self.protocol, url=self.url)
+                k = await loop.run_in_executor(self.executor, connect)
+                if k.conn is None:
+                    raise ConnectionError("Couldnt connect to hypervisor %s" % self.host)
+                self.k = k
+        return self.k
+
+    async def _call(self, method, *args, **kwargs):
+        k = await self._kvirt()
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(getattr(k, method), *args, **kwargs))
+
+    async def list(self):
+        return await self._call('list')
+
+    async def create(self, name, **parameters):
+        return await self._call('create', name, **parameters)
+
+    async def delete(self, name):
+        return await self._call('delete', name)
+
+    async def start(self, name):
+        return await self._call('start', name)
+
+    async def stop(self, name):
+        return await self._call('stop', name)
+
+    async def info(self, name):
+        return await self._call('info', name)
+
+    async def volumes(self, iso=False):
+        return await self._call('volumes', iso=iso)
+
+    async def close(self):
+        if self.k is not None and self.k.conn is not None:
+            await asyncio.get_event_loop().run_in_executor(self.executor, self.k.close)
+        self.executor.shutdown(wait=False)
+
+
+async def fanout(clients, method, *args, **kwargs):
+    """
+    run method concurrently against a dict of name -> AsyncKvirt and return a dict name -> result.
+    a client failing gets its exception as result instead of aborting the others
+    """
+    names = sorted(clients)
+    results = await asyncio.gather(*[getattr(clients[name], method)(*args, **kwargs) for name in names], return_exceptions=True)
+    return dict(zip(names, results))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+on disk cache of the listings of a client and in memory cache of the descriptors of a connection
+"""
+
+from kvirt import events
+from kvirt.spec import Domain, Pool
+import json
+import os
+import tempfile
+import threading
+import time
+
+CACHEDIR = '~/.kcli/cache'
+# keys to invalidate upon libvirt lifecycle events
+DOMAINKEYS = ['vms']
+STORAGEKEYS = ['templates', 'isos', 'pools']
+NETWORKKEYS = ['networks', 'vms']
+# seconds descriptors are trusted when libvirt events arent received to invalidate them
+DESCRIPTORTTL = 5
+
+
+class Cache:
+    """
+    store listings as json files under ~/.kcli/cache/<client>, each of them expiring after ttl seconds
+    """
+    def __init__(self, client, ttl=30, path=CACHEDIR):
+        self.client = client
+        self.ttl = ttl
+        self.path = os.path.join(os.path.expanduser(path), client)
+
+    def _file(self, key):
+        return os.path.join(self.path, "%s.json" % key)
+
+    def get(self, key):
+        if not self.ttl:
+            return None
+        try:
+            with open(self._file(key), 'r') as entry:
+                entry = json.load(entry)
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - entry.get('timestamp', 0) > self.ttl:
+            return None
+        return entry.get('value')
+
+    def set(self, key, value):
+        if not self.ttl:
+            return
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".%s" % key)
+            with os.fdopen(fd, 'w') as entry:
+                json.dump({'timestamp': time.time(), 'value': value}, entry)
+            os.rename(tmp, self._file(key))
+        except (IOError, OSError):
+            pass
+
+    def invalidate(self, *keys):
+        """
+        remove the given keys, or every key of the client when none is given
+        """
+        if not keys:
+            if not os.path.isdir(self.path):
+                return
+            keys = [entry[:-5] for entry in os.listdir(self.path) if entry.endswith('.json')]
+        for key in keys:
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+
+    def fetch(self, key, function, refresh=False):
+        """
+        return the cached value of key, computing and storing it through function when missing, expired or refresh is requested
+        """
+        value = None if refresh else self.get(key)
+        if value is None:
+            value = function()
+            self.set(key, value)
+        return value
+
+    def watch(self, conn):
+        """
+        invalidate entries upon domain, storage and network lifecycle events of conn.
+        this requires the libvirt event loop to be running before conn was opened, so is only relevant for long lived processes
+        """
+        import libvirt
+
+        def domainevent(conn, dom, event, detail, opaque):
+            self.invalidate(*DOMAINKEYS)
+
+        def storageevent(conn, pool, event, detail, opaque):
+            self.invalidate(*STORAGEKEYS)
+
+        def networkevent(conn, net, event, detail, opaque):
+            self.invalidate(*NETWORKKEYS)
+        conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, domainevent, None)
+        if hasattr(conn, 'storagePoolEventRegisterAny'):
+            conn.storagePoolEventRegisterAny(None, libvirt.VIR_STORAGE_POOL_EVENT_ID_LIFECYCLE, storageevent, None)
+            conn.storagePoolEventRegisterAny(None, libvirt.VIR_STORAGE_POOL_EVENT_ID_REFRESH, storageevent, None)
+        if hasattr(conn, 'networkEventRegisterAny'):
+            conn.networkEventRegisterAny(None, libvirt.VIR_NETWORK_EVENT_ID_LIFECYCLE, networkevent, None)
+
+
+class Descriptors(object):
+    """
+    xml descriptors of the domains and pools of a connection, keyed by uuid and parsed once into kvirt.spec objects,
+    which are shared and shouldnt be modified. when the libvirt event loop runs, entries are kept until a define,
+    undefine or any other lifecycle event of their domain or pool. otherwise they expire after ttl seconds.
+    callers changing a domain or a pool invalidate it themselves. storage counts the storage pool events received,
+    so that what is derived from the volumes of the pools can tell it is stale
+    """
+    def __init__(self, ttl=DESCRIPTORTTL):
+        self.ttl = ttl
+        self.conn = None
+        self.watched = False
+        self.entries = {}
+        self.generation = 0
+        self.storage = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def bind(self, conn):
+        """
+        start over when conn isnt the connection the entries were fetched through, watching it if possible
+        """
+        if conn is self.conn:
+            return
+        with self.lock:
+            self.conn = conn
+            self.watched = False
+            self.entries = {}
+            self.generation += 1
+        if conn is not None and events.running():
+            try:
+                self.watch(conn)
+                self.watched = True
+            except Exception:
+                pass
+
+    def watch(self, conn):
+        import libvirt
+
+        def domainevent(conn, dom, *args):
+            self.invalidate(dom.UUIDString())
+
+        def poolevent(conn, pool, *args):
+            self.invalidate(pool.UUIDString())
+            with self.lock:
+                self.storage += 1
+        conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, domainevent, None)
+        for eventid in ['VIR_DOMAIN_EVENT_ID_DEVICE_ADDED', 'VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED']:
+            if hasattr(libvirt, eventid):
+                conn.domainEventRegisterAny(None, getattr(libvirt, eventid), domainevent, None)
+        if hasattr(conn, 'storagePoolEventRegisterAny'):
+            conn.storagePoolEventRegisterAny(None, libvirt.VIR_STORAGE_POOL_EVENT_ID_LIFECYCLE, poolevent, None)
+            if hasattr(libvirt, 'VIR_STORAGE_POOL_EVENT_ID_REFRESH'):
+                conn.storagePoolEventRegisterAny(None, libvirt.VIR_STORAGE_POOL_EVENT_ID_REFRESH, poolevent, None)
+
+    def invalidate(self, uuid=None):
+        """
+        forget the descriptors of uuid, or every descriptor when it is None
+        """
+        with self.lock:
+            self.generation += 1
+            self.stats['invalidations'] += 1
+            if uuid is None:
+                self.entries = {}
+            else:
+                for kind in ['domain', 'pool']:
+                    self.entries.pop((kind, uuid), None)
+
+    def _entry(self, kind, element):
+        key = (kind, element.UUIDString())
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (self.watched or now - entry[0] <= self.ttl):
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+            generation = self.generation
+        entry = [now, element.XMLDesc(0), None]
+        with self.lock:
+            # an invalidation received while fetching could be about an older descriptor than the one fetched
+            if generation == self.generation:
+                self.entries[key] = entry
+        return entry
+
+    def xml(self, vm):
+        """
+        xml descriptor of domain vm
+        """
+        return self._entry('domain', vm)[1]
+
+    def domain(self, vm):
+        """
+        kvirt.spec.Domain of domain vm
+        """
+        entry = self._entry('domain', vm)
+        if entry[2] is None:
+            entry[2] = Domain.fromxml(entry[1])
+        return entry[2]
+
+    def pool(self, pool):
+        """
+        kvirt.spec.Pool of storage pool pool
+        """
+        entry = self._entry('pool', pool)
+        if entry[2] is None:
+            entry[2] = Pool.fromxml(entry[1])
+        return entry[2]
@@ -1,23 +1,38 @@
 #!/usr/bin/env python
 
 import click
+from collections import OrderedDict
+import json
 import fileinput
-from .defaults import NETS, POOL, NUMCPUS, MEMORY, DISKS, DISKSIZE, DISKINTERFACE, DISKTHIN, GUESTID, VNC, CLOUDINIT, START
-from prettytable import PrettyTable
+import fnmatch
+import glob
+from .defaults import CACHETTL, TEMPLATES
 from kvirt import Kvirt, __version__
+from kvirt.cache import Cache
+from kvirt.connection import manager
+from kvirt.daemon import RemoteKvirt
+from kvirt.inventory import InventorySnapshot, VM
+from kvirt.output import FORMATS, write
+from kvirt.profiles import ProfileResolver, defaults
+from kvirt.transfer import checksum
 import os
-import yaml
+import sys
+import time
 from shutil import copyfile
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
 class Config():
-    def load(self):
+    def __init__(self):
+        self.failed = []
+
+    def load(self, client=None):
+        import yaml
         inifile = "%s/kcli.yml" % os.environ.get('HOME')
         if not os.path.exists(inifile):
             ini = {'default': {'client': 'local'}, 'local': {'pool': 'default'}}
-            click.secho("Using local hypervisor as no kcli.yml was found...", fg='green')
+            click.secho("Using local hypervisor as no kcli.yml was found...", fg='green', err=True)
         else:
             with open(inifile, 'r') as entries:
                 try:
@@ -29,79 +44,253 @@ class Config():
                 click.secho("Missing default section in config file. Leaving...", fg='red')
                 self.host = None
                 return
+        self.ini = ini
         self.clients = [e for e in ini if e != 'default']
-        self.client = ini['default']['client']
+        self.client = client if client is not None else ini['default']['client']
+        self.targets = [self.client]
         if self.client not in ini:
             click.secho("Missing section for client %s in config file. Leaving..." % self.client, fg='red')
             self.host = None
             return
-        defaults = {}
         default = ini['default']
-        defaults['nets'] = default.get('nets', NETS)
-        defaults['pool'] = default.get('pool', POOL)
-        defaults['numcpus'] = int(default.get('numcpus', NUMCPUS))
-        defaults['memory'] = int(default.get('memory', MEMORY))
-        defaults['disks'] = default.get('disks', DISKS)
-        defaults['disksize'] = default.get('disksize', DISKSIZE)
-        defaults['diskinterface'] = default.get('diskinterface', DISKINTERFACE)
-        defaults['diskthin'] = default.get('diskthin', DISKTHIN)
-        defaults['guestid'] = default.get('guestid', GUESTID)
-        defaults['vnc'] = bool(default.get('vnc', VNC))
-        defaults['cloudinit'] = bool(default.get('cloudinit', CLOUDINIT))
-        defaults['start'] = bool(default.get('start', START))
-        self.default = defaults
+        self.default = defaults(default)
         options = ini[self.client]
         self.host = options.get('host', '127.0.0.1')
         self.port = options.get('port', None)
         self.user = options.get('user', 'root')
         self.protocol = options.get('protocol', 'ssh')
         self.url = options.get('url', None)
+        self.controlpersist = options.get('controlpersist', default.get('controlpersist'))
+        self.cache = self.clientcache(self.client)
         profilefile = "%s/kcli_profiles.yml" % os.environ.get('HOME')
         if not os.path.exists(profilefile):
             self.profiles = {}
         else:
             with open(profilefile, 'r') as entries:
                 self.profiles = yaml.load(entries)
+        self.resolver = ProfileResolver(self.profiles, self.default)
 
     def get(self):
         if self.host is None:
             click.secho("Problem parsing your configuration file", fg='red')
             os._exit(1)
-        k = Kvirt(host=self.host, port=self.port, user=self.user, protocol=self.protocol, url=self.url)
+        if len(self.targets) > 1:
+            click.secho("This command can only target one client. Leaving...", fg='red')
+            os._exit(1)
+        k = RemoteKvirt.connect(self.client, self.local)
+        if k is not None:
+            return k
+        return self.local()
+
+    def local(self):
+        k = self.connect(shared=True)
         if k.conn is None:
             click.secho("Couldnt connect to specify hypervisor %s. Leaving..." % self.host, fg='red')
             os._exit(1)
         return k
 
+    def listing(self, key, function, refresh=False):
+        """
+        return a list of (client, listing) for every targeted client, served from the cache of each client
+        or computed through function(k)
+        """
+        if len(self.targets) == 1:
+            return [(self.client, self.cache.fetch(key, lambda: function(self.get()), refresh=refresh))]
+        return self.fanout(lambda client: self.clientcache(client).fetch(key, lambda: function(self.kvirt(client)), refresh=refresh))
+
+    def stream(self, key, function, refresh=False):
+        """
+        yield (client, entry) for every entry of the listing key of every targeted client, as soon as it is available.
+        function(k) yields the entries of a client, which are cached once all of them were gathered.
+        clients failing are reported on stderr, recorded in failed and left out
+        """
+        import threading
+        try:
+            from Queue import Queue
+        except ImportError:
+            from queue import Queue
+        queue = Queue()
+        done = object()
+
+        def run(client):
+            try:
+                cache = self.clientcache(client)
+                entries = None if refresh else cache.get(key)
+                if entries is not None:
+                    for entry in entries:
+                        queue.put((client, entry))
+                else:
+                    entries = []
+                    for entry in function(self.get() if len(self.targets) == 1 else self.kvirt(client)):
+                        entries.append(entry)
+                        queue.put((client, entry))
+                    cache.set(key, entries)
+            except Exception as e:
+                self.failed.append(client)
+                click.secho("Client %s failed: %s" % (client, e), fg='red', err=True)
+            finally:
+                queue.put((client, done))
+        for client in self.targets:
+            thread = threading.Thread(target=run, args=(client,))
+            thread.daemon = True
+            thread.start()
+        running = len(self.targets)
+        while running:
+            client, entry = queue.get()
+            if entry is done:
+                running -= 1
+            else:
+                yield client, entry
+
+    def connect(self, client=None, shared=False):
+        """
+        return a Kvirt for client. shared ones reuse the connection already opened to the same url in this process
+        """
+        if client is None or client == self.client:
+            return Kvirt(host=self.host, port=self.port, user=self.user, protocol=self.protocol, url=self.url, shared=shared, controlpersist=self.controlpersist)
+        options = self.ini[client]
+        controlpersist = options.get('controlpersist', self.ini['default'].get('controlpersist'))
+        return Kvirt(host=options.get('host', '127.0.0.1'), port=options.get('port'), user=options.get('user', 'root'), protocol=options.get('protocol', 'ssh'), url=options.get('url'), shared=shared, controlpersist=controlpersist)
+
+    def clientcache(self, client):
+        ttl = self.ini[client].get('cachettl', self.ini['default'].get('cachettl', CACHETTL))
+        return Cache(client, ttl=int(ttl))
+
+    def kvirt(self, client):
+        k = RemoteKvirt.connect(client, lambda: self.connect(client, shared=True)) or self.connect(client, shared=True)
+        if k.conn is None:
+            raise Exception("Couldnt connect to specify hypervisor %s" % k.host)
+        return k
+
+    def fanout(self, function):
+        """
+        run function(client) concurrently for every targeted client and return a list of (client, result) sorted by client.
+        clients failing are reported on stderr, recorded in failed and left out
+        """
+        from multiprocessing.pool import ThreadPool
+
+        def run(client):
+            try:
+                return client, function(client), None
+            except Exception as e:
+                return client, None, e
+        pool = ThreadPool(len(self.targets))
+        try:
+            results = pool.map(run, sorted(self.targets))
+        finally:
+            pool.close()
+            pool.join()
+        for client, result, error in results:
+            if error is not None:
+                self.failed.append(client)
+                click.secho("Client %s failed: %s" % (client, error), fg='red', err=True)
+        return [(client, result) for client, result, error in results if error is None]
+
+    def finish(self):
+        """
+        exit with an error when any targeted client failed, once the results of the others were output
+        """
+        if self.failed:
+            sys.stdout.flush()
+            os._exit(1)
+
 pass_config = click.make_pass_decorator(Config, ensure=True)
 
 
 @click.group(context_settings=CONTEXT_SETTINGS)
 @click.version_option(version=__version__)
+@click.option('-C', '--clients', help='Comma separated clients to target instead of the default one')
+@click.option('--all-clients', 'allclients', is_flag=True, help='Target every client of the config file')
+@click.option('--metrics', is_flag=True, help='Report time spent connecting versus running the command')
 @pass_config
-def cli(config):
+def cli(config, clients, allclients, metrics):
     """Libvirt wrapper on steroids. Check out https://github.com/karmab/kcli!"""
-    config.load()
+    if metrics:
+        begin = time.time()
+
+        def report():
+            stats = manager.stats
+            total = time.time() - begin
+            click.secho("Connections opened: %s reused: %s reconnected: %s failed: %s" % (stats['connects'], stats['reuses'], stats['reconnects'], stats['failures']), fg='blue', err=True)
+            click.secho("Connect time: %.3fs Call time: %.3fs Total: %.3fs" % (stats['connecttime'], max(total - stats['connecttime'], 0), total), fg='blue', err=True)
+            descriptors = manager.descriptorstats()
+            click.secho("Descriptors cached: %s fetched: %s invalidated: %s" % (descriptors['hits'], descriptors['misses'], descriptors['invalidations']), fg='blue', err=True)
+        click.get_current_context().call_on_close(report)
+    if clients is None:
+        config.load()
+    else:
+        clients = [client.strip() for client in clients.split(',') if client.strip()]
+        config.load(client=clients[0])
+    if config.host is None:
+        return
+    if allclients:
+        clients = sorted(config.clients)
+    if clients is not None:
+        for client in clients:
+            if client not in config.clients:
+                click.secho("Client %s not found in config.Leaving...." % client, fg='red')
+                os._exit(1)
+        config.targets = clients
+
+
+def selection(k, names, plan=None, template=None):
+    """
+    names of the vms matching names, which can be globs, belonging to plan or created from template
+    """
+    inventory = None
+    if plan is not None or template is not None or [name for name in names if glob.has_magic(name)]:
+        inventory = k.inventory()
+    selected = []
+    for name in names:
+        if glob.has_magic(name):
+            selected.extend(vm.name for vm in inventory if fnmatch.fnmatchcase(vm.name, name))
+        else:
+            selected.append(name)
+    if plan is not None:
+        selected.extend(vm.name for vm in inventory.plan(plan))
+    if template is not None:
+        selected.extend(vm.name for vm in inventory.template(template))
+    unique = []
+    for name in selected:
+        if name not in unique:
+            unique.append(name)
+    return unique
 
 
 @cli.command()
-@click.argument('name')
+@click.option('-p', '--plan', help='Start every vm of this plan')
+@click.option('-t', '--template', help='Start every vm created from this template')
+@click.option('--workers', help='Number of vms to start in parallel', type=int, default=4)
+@click.argument('names', nargs=-1)
 @pass_config
-def start(config, name):
-    """Start vm"""
+def start(config, plan, template, workers, names):
+    """Start vms"""
     k = config.get()
-    click.secho("Started vm %s..." % name, fg='green')
-    k.start(name)
+    names = selection(k, names, plan=plan, template=template)
+    if not names:
+        click.secho("No vm selected. Leaving...", fg='red')
+        os._exit(1)
+    click.secho("Started vm %s..." % ','.join(names), fg='green')
+    k.start_many(names, workers=workers)
+    config.cache.invalidate()
 
 
 @cli.command()
-@click.argument('name')
+@click.option('-p', '--plan', help='Stop every vm of this plan')
+@click.option('-t', '--template', help='Stop every vm created from this template')
+@click.option('--workers', help='Number of vms to stop in parallel', type=int, default=4)
+@click.argument('names', nargs=-1)
 @pass_config
-def stop(config, name):
-    """Stop vm"""
+def stop(config, plan, template, workers, names):
+    """Stop vms"""
     k = config.get()
-    click.secho("Stopped vm %s..." % name, fg='green')
-    k.stop(name)
+    names = selection(k, names, plan=plan, template=template)
+    if not names:
+        click.secho("No vm selected. Leaving...", fg='red')
+        os._exit(1)
+    click.secho("Stopped vm %s..." % ','.join(names), fg='green')
+    k.stop_many(names, workers=workers)
+    config.cache.invalidate()
 
 
 @cli.command()
@@ -119,13 +308,23 @@ def console(config, serial, name):
 
 @cli.command()
 @click.confirmation_option(help='Are you sure?')
-@click.argument('name')
+@click.option('-p', '--plan', help='Delete every vm of this plan')
+@click.option('-t', '--template', help='Delete every vm created from this template')
+@click.option('--workers', help='Number of vms to delete in parallel', type=int, default=4)
+@click.argument('names', nargs=-1)
 @pass_config
-def delete(config, name):
-    """Delete vm"""
+def delete(config, plan, template, workers, names):
+    """Delete vms"""
     k = config.get()
-    click.secho("Deleted vm %s..." % name, fg='red')
-    k.delete(name)
+    names = selection(k, names, plan=plan, template=template)
+    if not names:
+        click.secho("No vm selected. Leaving...", fg='red')
+        os._exit(1)
+    click.secho("Deleted vm %s..." % ','.join(names), fg='red')
+    for result in k.delete_many(names, workers=workers):
+        if result['result'] != 'success':
+            click.secho(result['reason'], fg='red')
+    config.cache.invalidate()
 
 
 @cli.command()
@@ -153,21 +352,16 @@ def switch(config, client):
 @click.option('-i', '--isos', is_flag=True)
 @click.option('-P', '--pools', is_flag=True)
 @click.option('-n', '--networks', is_flag=True)
+@click.option('-r', '--refresh', is_flag=True, help='Ignore cached listings')
+@click.option('-o', '--output', type=click.Choice(FORMATS), help='Machine readable output. ndjson entries are printed as soon as they are gathered')
 @pass_config
-def list(config, clients, profiles, templates, isos, pools, networks):
+def list(config, clients, profiles, templates, isos, pools, networks, refresh, output):
     """List clients, profiles, templates, isos, pools or vms"""
-    k = config.get()
-    if pools:
-        pools = k.list_pools()
-        for pool in sorted(pools):
-            print(pool)
-        return
-    if networks:
-        networks = k.list_networks()
-        for network in sorted(networks):
-            print(network)
-        return
     if clients:
+        if output is not None:
+            write(({'name': client, 'current': client == config.client} for client in sorted(config.clients)), output)
+            return
+        from prettytable import PrettyTable
         clientstable = PrettyTable(["Name", "Current"])
         clientstable.align["Name"] = "l"
         for client in sorted(config.clients):
@@ -176,20 +370,85 @@ def list(config, clients, profiles, templates, isos, pools, networks):
             else:
                 clientstable.add_row([client, ''])
         print(clientstable)
+        return
     elif profiles:
+        if output is not None:
+            write(({'name': profile} for profile in sorted(config.profiles)), output)
+            return
         for profile in sorted(config.profiles):
             print(profile)
+        return
+    elif pools:
+        key, function = 'pools', lambda k: k.list_pools()
+    elif networks:
+        key, function = 'networks', lambda k: k.list_networks()
     elif templates:
-        for template in sorted(k.volumes()):
-            print(template)
+        key, function = 'templates', lambda k: k.volumes()
     elif isos:
-        for iso in sorted(k.volumes(iso=True)):
-            print(iso)
+        key, function = 'isos', lambda k: k.volumes(iso=True)
     else:
-        vms = PrettyTable(["Name", "Status", "Ips", "Source", "Description/Plan", "Profile"])
-        for vm in sorted(k.list()):
-            vms.add_row(vm)
+        if output == 'ndjson':
+            write((vmrecord(client, entry) for client, entry in config.stream('vms', lambda k: k.iterlist(), refresh=refresh)), output)
+            config.finish()
+            return
+        listing = config.listing('vms', lambda k: [vm for vm in k.iterlist()], refresh=refresh)
+        if output is not None:
+            write((vmrecord(client, vm) for client, entries in listing for vm in InventorySnapshot([VM(*vm) for vm in entries])), output, fields=['client'] + [field for field in VM._fields])
+            config.finish()
+            return
+        from prettytable import PrettyTable
+        if len(config.targets) == 1:
+            vms = PrettyTable(["Name", "Status", "Ips", "Source", "Description/Plan", "Profile"])
+            for client, entries in listing:
+                for vm in InventorySnapshot([VM(*vm) for vm in entries]):
+                    vms.add_row(vm[:6])
+        else:
+            vms = PrettyTable(["Client", "Name", "Status", "Ips", "Source", "Description/Plan", "Profile"])
+            for client, entries in listing:
+                for vm in InventorySnapshot([VM(*vm) for vm in entries]):
+                    vms.add_row((client,) + vm[:6])
         print(vms)
+        config.finish()
+        return
+    if output == 'ndjson':
+        write(({'client': client, 'name': entry} for client, entry in config.stream(key, function, refresh=refresh)), output)
+        config.finish()
+        return
+    listing = config.listing(key, function, refresh=refresh)
+    if output is not None:
+        write(({'client': client, 'name': entry} for client, entries in listing for entry in sorted(entries)), output)
+    elif len(config.targets) == 1:
+        for client, entries in listing:
+            for entry in sorted(entries):
+                print(entry)
+    else:
+        from prettytable import PrettyTable
+        entriestable = PrettyTable(["Client", "Name"])
+        entriestable.align["Name"] = "l"
+        for client, entries in listing:
+            for entry in sorted(entries):
+                entriestable.add_row([client, entry])
+        print(entriestable)
+    config.finish()
+
+
+def vmrecord(client, vm):
+    """
+    record of vm, a VM or a list entry as cached, for machine readable output
+    """
+    vm = VM(*vm)
+    return OrderedDict([('client', client)] + [(field, getattr(vm, field)) for field in VM._fields])
+
+
+def profilespec(config, profile):
+    """
+    create parameters of profile, falling back to the default section, None if profile doesnt exist
+    """
+    if profile not in config.resolver:
+        return None
+    spec = config.resolver.resolve(profile)
+    spec.pop('ips')
+    return spec
 
 
 @cli.command()
@@ -202,76 +461,84 @@ def list(config, clients, profiles, templates, isos, pools, networks):
 @click.option('-6', '--ip6', help='Optional Ip to assign to eth5. Netmask and gateway will be retrieved from profile')
 @click.option('-7', '--ip7', help='Optional Ip to assign to eth6. Netmask and gateway will be retrieved from profile')
 @click.option('-8', '--ip8', help='Optional Ip to assign to eth8. Netmask and gateway will be retrieved from profile')
-@click.argument('name')
+@click.option('--count', help='Number of vms to create', type=int, default=1)
+@click.option('--prefix', help='Prefix of the names of the vms when using count. Defaults to name')
+@click.option('--workers', help='Number of vms to create in parallel when using count', type=int, default=4)
+@click.argument('name', required=False)
 @pass_config
-def create(config, profile, ip1, ip2, ip3, ip4, ip5, ip6, ip7, ip8, name):
+def create(config, profile, ip1, ip2, ip3, ip4, ip5, ip6, ip7, ip8, count, prefix, workers, name):
     """Create vm from given profile"""
-    click.secho("Deploying vm %s from profile %s..." % (name, profile), fg='green')
+    ips = [ip1, ip2, ip3, ip4, ip5, ip6, ip7, ip8]
+    if count > 1:
+        if prefix is None:
+            prefix = name
+        if prefix is None:
+            click.secho("Missing name or prefix. Leaving...", fg='red')
+            os._exit(1)
+        if [ip for ip in ips if ip is not None]:
+            click.secho("Ips cant be set when creating several vms. Leaving...", fg='red')
+            os._exit(1)
+        names = ["%s%d" % (prefix, index) for index in range(1, count + 1)]
+        click.secho("Deploying vms %s from profile %s..." % (','.join(names), profile), fg='green')
+    elif name is None:
+        click.secho("Missing name. Leaving...", fg='red')
+        os._exit(1)
+    else:
+        names = [name]
+        click.secho("Deploying vm %s from profile %s..." % (name, profile), fg='green')
     k = config.get()
-    default = config.default
-    profiles = config.profiles
-    if profile not in profiles:
+    spec = profilespec(config, profile)
+    if spec is None:
         click.secho("Invalid profile %s. Leaving..." % profile, fg='red')
         os._exit(1)
-    title = profile
-    profile = profiles[profile]
-    template = profile.get('template')
-    description = 'kvirt'
-    nets = profile.get('nets', default['nets'])
-    numcpus = profile.get('numcpus', default['numcpus'])
-    memory = profile.get('memory', default['memory'])
-    pool = profile.get('pool', default['pool'])
-    disks = profile.get('disks', default['disks'])
-    disksize = profile.get('disksize', default['disksize'])
-    diskinterface = profile.get('diskinterface', default['diskinterface'])
-    diskthin = profile.get('diskthin', default['diskthin'])
-    guestid = profile.get('guestid', default['guestid'])
-    iso = profile.get('iso')
-    vnc = profile.get('vnc', default['vnc'])
-    cloudinit = profile.get('cloudinit', default['cloudinit'])
-    start = profile.get('start', default['start'])
-    keys = profile.get('keys', None)
-    cmds = profile.get('cmds', None)
-    netmasks = profile.get('netmasks')
-    gateway = profile.get('gateway')
-    dns = profile.get('dns')
-    domain = profile.get('domain')
-    scripts = profile.get('scripts')
-    if scripts is not None:
-        scriptcmds = []
-        for script in scripts:
-            script = os.path.expanduser(script)
-            if not os.path.exists(script):
-                click.secho("Script %s not found.Ignoring..." % script, fg='red')
-            else:
-                scriptlines = [line.strip() for line in open(script).readlines() if line != '\n']
-                if scriptlines:
-                    scriptcmds.extend(scriptlines)
-        if scriptcmds:
-            if cmds is None:
-                cmds = scriptcmds
-            else:
-                cmds = cmds + scriptcmds
-    ips = [ip1, ip2, ip3, ip4, ip5, ip6, ip7, ip8]
-    result = k.create(name=name, description=description, title=title, numcpus=int(numcpus), memory=int(memory), guestid=guestid, pool=pool, template=template, disks=disks, disksize=disksize, diskthin=diskthin, diskinterface=diskinterface, nets=nets, iso=iso, vnc=bool(vnc), cloudinit=bool(cloudinit), start=bool(start), keys=keys, cmds=cmds, ips=ips, netmasks=netmasks, gateway=gateway, dns=dns, domain=domain)
-    if result['result'] == 'success':
-        click.secho("%s deployed!" % name, fg='green')
-    else:
-        reason = result['reason']
-        click.secho("%s not deployed because of %s :(" % (name, reason), fg='red')
+    specs = [dict(spec, name=name, ips=ips) for name in names]
+    results = []
+    warms = k.warms(profile)
+    while specs and warms:
+        result = k.claim(specs[0]['name'], profile, description=spec['description'], pool=spec['pool'], nets=spec['nets'], cloudinit=spec['cloudinit'], start=spec['start'], keys=spec['keys'], cmds=spec['cmds'], ips=ips, gateway=spec['gateway'], dns=spec['dns'], domain=spec['domain'], warms=warms)
+        if result is None:
+            break
+        results.append(result)
+        specs.pop(0)
+    if len(specs) == 1:
+        results.append(k.create(**specs[0]))
+    elif specs:
+        results.extend(k.create_many(specs, workers=workers))
+    config.cache.invalidate()
+    for name, result in zip(names, results):
+        if result['result'] == 'success' and 'warm' in result:
+            click.secho("%s deployed from warm vm %s!" % (name, result['warm']), fg='green')
+        elif result['result'] == 'success':
+            click.secho("%s deployed!" % name, fg='green')
+        else:
+            reason = result['reason']
+            click.secho("%s not deployed because of %s :(" % (name, reason), fg='red')
 
 
 @cli.command()
 @click.option('-b', '--base', help='Base VM')
 @click.option('-f', '--full', is_flag=True)
 @click.option('-s', '--start', is_flag=True)
+@click.option('-l', '--linked', is_flag=True, help='Create qcow2 overlays of the disks of the base vm, frozen with an external snapshot, instead of copies')
+@click.option('--count', help='Number of clones to create, named after name', type=int, default=1)
+@click.option('--workers', help='Number of clones to create in parallel when using count', type=int, default=4)
 @click.argument('name')
 @pass_config
-def clone(config, base, full, start, name):
+def clone(config, base, full, start, linked, count, workers, name):
     """Clone existing vm"""
-    click.secho("Cloning vm %s from vm %s..." % (name, base), fg='green')
+    if full and linked:
+        click.secho("Full and linked clones are exclusive. Leaving...", fg='red')
+        os._exit(1)
+    names = [name] if count == 1 else ["%s%d" % (name, index) for index in range(1, count + 1)]
+    click.secho("Cloning %s from vm %s..." % (','.join(names), base), fg='green')
     k = config.get()
-    k.clone(base, name, full=full, start=start)
+    results = k.clone_many(base, names, full=full, start=start, linked=linked, workers=workers)
+    config.cache.invalidate()
+    for name, result in zip(names, results):
+        if result['result'] == 'success':
+            click.secho("%s cloned in %.2fs, allocating %d MB" % (name, result['time'], result['allocation'] // 1024 // 1024), fg='green')
+        else:
+            click.secho("%s not cloned because of %s :(" % (name, result['reason']), fg='red')
 
 
 @cli.command()
@@ -292,6 +559,7 @@ def update(config, ip, memory, numcpus, name):
     elif numcpus is not None:
         click.secho("Updating numcpus of vm %s to %s..." % (name, numcpus), fg='green')
         k.update_cpu(name, numcpus)
+    config.cache.invalidate()
 
 
 @cli.command()
@@ -310,6 +578,7 @@ def add(config, size, pool, name):
     k = config.get()
     click.secho("Adding disk %s..." % (name), fg='green')
     k.add_disk(name=name, size=size, pool=pool)
+    config.cache.invalidate()
 
 
 @cli.command()
@@ -317,26 +586,191 @@ def add(config, size, pool, name):
 @click.option('-f', '--full', is_flag=True)
 @click.option('-t', '--pooltype', help='Type of the pool', type=click.Choice(['dir', 'logical']), default='dir')
 @click.option('-p', '--path', help='Path of the pool')
-@click.argument('pool')
+@click.option('-w', '--warm', help='Profile to keep stopped vms ready for, to be claimed by create')
+@click.option('--count', help='Number of warm vms to keep', type=int, default=1)
+@click.option('--workers', help='Number of warm vms to create in parallel', type=int, default=4)
+@click.argument('pool', required=False)
 @pass_config
-def pool(config, delete, full, pooltype, path, pool):
-    """Create/Delete pool"""
+def pool(config, delete, full, pooltype, path, warm, count, workers, pool):
+    """Create/Delete pool or keep warm vms"""
     k = config.get()
+    if warm is not None:
+        spec = profilespec(config, warm)
+        if spec is None:
+            click.secho("Invalid profile %s. Leaving..." % warm, fg='red')
+            os._exit(1)
+        if pool is not None:
+            spec['pool'] = pool
+        click.secho("Keeping %d warm vms of profile %s..." % (count, warm), fg='green')
+        for result in k.warm(spec, count, workers=workers):
+            if result['result'] != 'success':
+                click.secho("Warm vm not created because of %s :(" % result['reason'], fg='red')
+        config.cache.invalidate()
+        return
+    if pool is None:
+        click.secho("Missing pool. Leaving...", fg='red')
+        os._exit(1)
     if delete:
         click.secho("Deleting pool %s..." % (pool), fg='green')
         k.delete_pool(name=pool, full=full)
+        config.cache.invalidate()
         return
     if path is None:
         click.secho("Missing path. Leaving...", fg='red')
         return
     click.secho("Adding pool %s..." % (pool), fg='green')
     k.create_pool(name=pool, poolpath=path, pooltype=pooltype)
+    config.cache.invalidate()
+
+
+@cli.command()
+@click.option('-p', '--pool', help='Pool to upload to. Defaults to the pool of the client')
+@click.option('-n', '--name', help='Name of the volume. Defaults to the name of the file')
+@click.option('--chunksize', default=4, type=int, help='Size of the chunks sent, in MB')
+@click.option('--nosparse', is_flag=True, help='Send chunks of zeros as data rather than as holes')
+@click.argument('path')
+@pass_config
+def upload(config, pool, name, chunksize, nosparse, path):
+    """Upload a file such as a template to a pool"""
+    if pool is None:
+        pool = config.ini[config.client].get('pool', config.default['pool'])
+    k = config.get()
+
+    def progress(sent, size, elapsed):
+        rate = sent / elapsed / 1024 / 1024 if elapsed else 0
+        click.echo("\r%d%% %.2fMB/s" % (sent * 100 / size, rate), nl=False)
+    click.secho("Uploading %s to pool %s..." % (path, pool), fg='green')
+    result = k.upload_volume(pool, path, name=name, chunksize=chunksize * 1024 * 1024, sparse=not nosparse, callback=progress)
+    click.echo('')
+    if result['result'] == 'success':
+        click.secho("Uploaded %.2fMB in %.2fs ( %.2fMB/s)" % (result['size'] / 1024.0 / 1024, result['time'], result['rate'] / 1024 / 1024), fg='green')
+        config.cache.invalidate()
+    else:
+        click.secho("Couldnt upload %s: %s" % (path, result['reason']), fg='red')
+        os._exit(1)
+
+
+def downloads(client, entries=None):
+    """
+    load, or save when entries are given, the state of the unfinished downloads of client
+    """
+    path = os.path.expanduser("~/.kcli/downloads/%s.json" % client)
+    if entries is None:
+        try:
+            with open(path) as state:
+                return json.load(state)
+        except (IOError, OSError, ValueError):
+            return {}
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open("%s.tmp" % path, 'w') as state:
+        json.dump(entries, state)
+    os.rename("%s.tmp" % path, path)
 
 
 @cli.command()
+@click.option('-p', '--pool', help='Pool to download to. Defaults to the pool of the client')
+@click.option('-m', '--mirror', help='Directory or file url holding the images. Defaults to the mirror of the client')
+@click.option('--workers', default=4, type=int, help='Number of concurrent readers')
+@click.argument('templates', nargs=-1, required=True)
 @pass_config
-def report(config):
+def download(config, pool, mirror, workers, templates):
+    """Download templates from a mirror into a pool"""
+    options = config.ini[config.client]
+    if pool is None:
+        pool = options.get('pool', config.default['pool'])
+    if mirror is None:
+        mirror = options.get('mirror', config.ini['default'].get('mirror'))
+    if mirror is None:
+        click.secho("Missing mirror. Leaving...", fg='red')
+        os._exit(1)
+    if mirror.startswith('file://'):
+        mirror = mirror[len('file://'):]
+    elif '://' in mirror:
+        click.secho("Only directories and file urls are supported as mirror. Leaving...", fg='red')
+        os._exit(1)
+    k = config.get()
+    state = downloads(config.client)
+    failed = False
+
+    def progress(sent, size, elapsed):
+        rate = (sent - start) / elapsed / 1024 / 1024 if elapsed else 0
+        click.echo("\r%d%% %.2fMB/s" % (sent * 100 / size, rate), nl=False)
+    for template in templates:
+        image = TEMPLATES.get(template, template)
+        path = os.path.join(os.path.expanduser(mirror), image)
+        if not os.path.exists(path):
+            click.secho("Image %s not found in mirror %s" % (image, mirror), fg='red')
+            failed = True
+            continue
+        key = "%s/%s" % (pool, image)
+        source = os.stat(path)
+        entry = state.get(key)
+        offset = None
+        if entry is not None:
+            offset = entry['offset'] if [entry['size'], entry['mtime']] == [source.st_size, source.st_mtime] else 0
+        start = offset or 0
+        expected = checksum(path)
+        if expected is None:
+            click.secho("No checksum found for %s, it wont be verified" % image, fg='blue')
+
+        def checkpoint(offset):
+            state[key] = {'offset': offset, 'size': source.st_size, 'mtime': source.st_mtime}
+            downloads(config.client, state)
+        if offset is None:
+            checkpoint(0)
+        if start:
+            click.secho("Resuming download of %s to pool %s at %.2fMB..." % (image, pool, start / 1024.0 / 1024), fg='green')
+        else:
+            click.secho("Downloading %s to pool %s..." % (image, pool), fg='green')
+        result = k.import_volume(pool, path, checksum=expected, offset=offset, workers=workers, callback=progress, checkpoint=checkpoint)
+        click.echo('')
+        if result['result'] == 'success':
+            state.pop(key, None)
+            downloads(config.client, state)
+            click.secho("Downloaded %s: %.2fMB in %.2fs ( %.2fMB/s)" % (image, result['size'] / 1024.0 / 1024, result['time'], result['rate'] / 1024 / 1024), fg='green')
+        elif result.get('exists'):
+            state.pop(key, None)
+            downloads(config.client, state)
+            click.secho("Template %s already in pool %s" % (image, pool), fg='blue')
+        else:
+            failed = True
+            click.secho("Couldnt download %s: %s" % (image, result['reason']), fg='red')
+    config.cache.invalidate()
+    if failed:
+        os._exit(1)
+
+
+@cli.command()
+@click.option('-o', '--output', type=click.Choice(FORMATS), help='Machine readable output')
+@click.option('-s', '--stats', is_flag=True, help='Report capacity and usage per plan and per pool out of the stats of every vm')
+@click.option('--top', help='Number of top consumers to report with stats', type=int, default=5)
+@click.option('--interval', help='Seconds between two samples so that stats report rates instead of totals', type=float, default=0)
+@pass_config
+def report(config, output, stats, top, interval):
     """Report hypervisor setup"""
+    if stats:
+        reports = config.fanout(lambda client: config.kvirt(client).capacity(count=top, interval=interval, display=False)) if len(config.targets) > 1 else [(config.client, config.get().capacity(count=top, interval=interval, display=False))]
+        if output is not None:
+            write((OrderedDict([('client', client)] + [item for item in report.items()]) for client, report in reports), output, single=len(config.targets) == 1)
+            config.finish()
+            return
+        for client, report in reports:
+            click.secho("Reporting capacity for client %s..." % client, fg='green')
+            Kvirt.printcapacity(report)
+        config.finish()
+        return
+    if output is not None:
+        reports = config.fanout(lambda client: config.kvirt(client).report(display=False)) if len(config.targets) > 1 else [(config.client, config.get().report(display=False))]
+        write((OrderedDict([('client', client)] + [item for item in report.items()]) for client, report in reports), output, single=len(config.targets) == 1)
+        config.finish()
+        return
+    if len(config.targets) > 1:
+        for client, report in config.fanout(lambda client: config.kvirt(client).report(display=False)):
+            click.secho("Reporting setup for client %s..." % client, fg='green')
+            Kvirt.printreport(report)
+        config.finish()
+        return
     click.secho("Reporting setup for client %s..." % config.client, fg='green')
     k = config.get()
     k.report()
@@ -347,46 +781,48 @@ def report(config):
 @click.option('-s', '--start', is_flag=True)
 @click.option('-w', '--stop', is_flag=True)
 @click.option('-d', '--delete', is_flag=True)
+@click.option('-a', '--apply', is_flag=True, help='Only create missing vms and update numcpus and memory of deployed ones')
+@click.option('--workers', help='Number of vms to deploy in parallel', type=int, default=1)
 @click.argument('plan', required=False)
 @pass_config
-def plan(config, inputfile, start, stop, delete, plan):
+def plan(config, inputfile, start, stop, delete, apply, workers, plan):
     """Create/Delete/Stop/Start vms from plan file"""
+    from kvirt.plan import PlanExecutor, critical_path, diff, find_cycle
+    from prettytable import PrettyTable
+    import yaml
     if plan is None:
         plan = 'kvirt'
-    k = config.get()
-    if delete:
-        if plan == '':
-            click.secho("That would delete every vm...Not doing that", fg='red')
-            return
-        click.confirm('Are you sure about deleting this plan', abort=True)
-        for vm in sorted(k.list()):
-            name = vm[0]
-            description = vm[4]
-            if description == plan:
-                k.delete(name)
-                click.secho("%s deleted!" % name, fg='green')
-        click.secho("Plan %s deleted!" % plan, fg='green')
-        return
-    if start:
-        click.secho("Starting vms from plan %s" % (plan), fg='green')
-        for vm in sorted(k.list()):
-            name = vm[0]
-            description = vm[4]
-            if description == plan:
-                k.start(name)
-                click.secho("%s started!" % name, fg='green')
-        click.secho("Plan %s started!" % plan, fg='green')
-        return
-    if stop:
-        click.secho("Stopping vms from plan %s" % (plan), fg='green')
-        for vm in sorted(k.list()):
-            name = vm[0]
-            description = vm[4]
-            if description == plan:
-                k.stop(name)
-                click.secho("%s stopped!" % name, fg='green')
-        click.secho("Plan %s stopped!" % plan, fg='green')
+    if delete or start or stop:
+        if delete:
+            if plan == '':
+                click.secho("That would delete every vm...Not doing that", fg='red')
+                return
+            click.confirm('Are you sure about deleting this plan', abort=True)
+            action, done = 'delete', 'deleted'
+        elif start:
+            click.secho("Starting vms from plan %s" % (plan), fg='green')
+            action, done = 'start', 'started'
+        else:
+            click.secho("Stopping vms from plan %s" % (plan), fg='green')
+            action, done = 'stop', 'stopped'
+
+        def run(client):
+            k = config.get() if len(config.targets) == 1 else config.kvirt(client)
+            names = [vm.name for vm in k.inventory().plan(plan)]
+            getattr(k, "%s_many" % action)(names, workers=workers)
+            for name in names:
+                if len(config.targets) == 1:
+                    click.secho("%s %s!" % (name, done), fg='green')
+                else:
+                    click.secho("%s %s on client %s!" % (name, done, client), fg='green')
+            config.clientcache(client).invalidate()
+        config.fanout(run)
+        if config.failed:
+            click.secho("Plan %s not %s on clients %s :(" % (plan, done, ','.join(config.failed)), fg='red', err=True)
+            config.finish()
+        click.secho("Plan %s %s!" % (plan, done), fg='green')
         return
+    k = config.get()
     if inputfile is None:
         inputfile = 'kcli_plan.yml'
         click.secho("using default input file kcli_plan.yml", fg='green')
@@ -395,69 +831,130 @@ def plan(config, inputfile, start, stop, delete, plan):
         click.secho("No input file found nor default kcli_plan.yml.Leaving....", fg='red')
         os._exit(1)
     click.secho("Deploying vms from plan %s" % (plan), fg='green')
-    default = config.default
+    planvms = []
+    dependencies = {}
     with open(inputfile, 'r') as entries:
         vms = yaml.load(entries)
         for name in vms:
             profile = vms[name]
-            if 'profile' in profile.keys():
-                profiles = config.profiles
-                customprofile = profiles[profile['profile']]
-                title = profile['profile']
-            else:
-                customprofile = {}
-                title = plan
-            description = plan
-            pool = next((e for e in [profile.get('pool'), customprofile.get('pool'), default['pool']] if e is not None))
-            template = next((e for e in [profile.get('template'), customprofile.get('template')] if e is not None), None)
-            numcpus = next((e for e in [profile.get('numcpus'), customprofile.get('numcpus'), default['numcpus']] if e is not None))
-            memory = next((e for e in [profile.get('memory'), customprofile.get('memory'), default['memory']] if e is not None))
-            disks = next((e for e in [profile.get('disks'), customprofile.get('disks'), default['disks']] if e is not None))
-            disksize = next((e for e in [profile.get('disksize'), customprofile.get('disksize'), default['disksize']] if e is not None))
-            diskinterface = next((e for e in [profile.get('diskinterface'), customprofile.get('diskinterface'), default['diskinterface']] if e is not None))
-            diskthin = next((e for e in [profile.get('diskthin'), customprofile.get('diskthin'), default['diskthin']] if e is not None))
-            guestid = next((e for e in [profile.get('guestid'), customprofile.get('guestid'), default['guestid']] if e is not None))
-            vnc = next((e for e in [profile.get('vnc'), customprofile.get('vnc'), default['vnc']] if e is not None))
-            cloudinit = next((e for e in [profile.get('cloudinit'), customprofile.get('cloudinit'), default['cloudinit']] if e is not None))
-            start = next((e for e in [profile.get('start'), customprofile.get('start'), default['start']] if e is not None))
-            nets = next((e for e in [profile.get('nets'), customprofile.get('nets'), default['nets']] if e is not None))
-            iso = next((e for e in [profile.get('iso'), customprofile.get('iso')] if e is not None), None)
-            keys = next((e for e in [profile.get('keys'), customprofile.get('keys')] if e is not None), None)
-            cmds = next((e for e in [profile.get('cmds'), customprofile.get('cmds')] if e is not None), None)
-            netmasks = next((e for e in [profile.get('netmasks'), customprofile.get('netmasks')] if e is not None), None)
-            gateway = next((e for e in [profile.get('gateway'), customprofile.get('gateway')] if e is not None), None)
-            dns = next((e for e in [profile.get('dns'), customprofile.get('dns')] if e is not None), None)
-            domain = next((e for e in [profile.get('domain'), customprofile.get('domain')] if e is not None), None)
-            ips = profile.get('ips')
-            scripts = next((e for e in [profile.get('scripts'), customprofile.get('scripts')] if e is not None), None)
-            if scripts is not None:
-                scriptcmds = []
-                for script in scripts:
-                    script = os.path.expanduser(script)
-                    if not os.path.exists(script):
-                        click.secho("Script %s not found.Ignoring..." % script, fg='red')
-                    else:
-                        scriptlines = [line.strip() for line in open(script).readlines() if line != '\n']
-                        if scriptlines:
-                            scriptcmds.extend(scriptlines)
-                if scriptcmds:
-                    if cmds is None:
-                        cmds = scriptcmds
-                    else:
-                        cmds = cmds + scriptcmds
-            result = k.create(name=name, description=description, title=title, numcpus=int(numcpus), memory=int(memory), guestid=guestid, pool=pool, template=template, disks=disks, disksize=disksize, diskthin=diskthin, diskinterface=diskinterface, nets=nets, iso=iso, vnc=bool(vnc), cloudinit=bool(cloudinit), start=bool(start), keys=keys, cmds=cmds, ips=ips, netmasks=netmasks, gateway=gateway, dns=dns, domain=domain)
-            if result['result'] == 'success':
-                click.secho("%s deployed!" % name, fg='green')
-            else:
-                reason = result['reason']
-                click.secho("%s not deployed because of %s :(" % (name, reason), fg='red')
+            title = profile.get('profile', plan)
+            parameters = config.resolver.resolve(entry=profile, title=title, description=plan)
+            if parameters is None:
+                click.secho("Invalid profile %s for %s. Leaving..." % (profile['profile'], name), fg='red')
+                os._exit(1)
+            planvms.append((name, parameters))
+            requires = []
+            for key in ['after', 'requires']:
+                entry = profile.get(key)
+                if isinstance(entry, str):
+                    requires.append(entry)
+                elif entry is not None:
+                    requires.extend(entry)
+            if requires:
+                dependencies[name] = requires
+    for name in dependencies:
+        for dependency in [d for d in dependencies[name] if d not in vms]:
+            if not k.exists(dependency):
+                click.secho("%s requires %s which is neither in plan nor deployed. Leaving..." % (name, dependency), fg='red')
+                os._exit(1)
+            dependencies[name].remove(dependency)
+    cycle = find_cycle(dependencies)
+    if cycle is not None:
+        click.secho("Dependency cycle found in plan: %s. Leaving..." % ' -> '.join(cycle), fg='red')
+        os._exit(1)
+    if apply:
+        missing, drifted, unchanged = diff(planvms, k.inventory())
+        for name, changes in drifted:
+            if 'numcpus' in changes:
+                k.update_cpu(name, changes['numcpus'])
+                click.secho("%s numcpus updated to %d!" % (name, changes['numcpus']), fg='green')
+            if 'memory' in changes:
+                k.update_memory(name, changes['memory'])
+                click.secho("%s memory updated to %dMB!" % (name, changes['memory']), fg='green')
+        click.secho("Plan %s: %d vms to create, %d updated, %d unchanged" % (plan, len(missing), len(drifted), len(unchanged)), fg='green')
+        if drifted:
+            config.cache.invalidate()
+        planvms = missing
+
+    def deployed(vm):
+        name = vm['name']
+        result = vm['result']
+        if result['result'] == 'success':
+            click.secho("%s deployed!" % name, fg='green')
+        else:
+            reason = result['reason']
+            click.secho("%s not deployed because of %s :(" % (name, reason), fg='red')
+
+    def connect():
+        if workers > 1:
+            return config.connect()
+        return k
+    executor = PlanExecutor(connect, workers=workers)
+    results = executor.run(planvms, callback=deployed, dependencies=dependencies)
+    config.cache.invalidate()
+    if results:
+        begin = min(vm['start'] for vm in results)
+        timings = PrettyTable(["Name", "Result", "Start", "End", "Time", "After"])
+        timings.align["Name"] = "l"
+        for vm in sorted(results, key=lambda vm: (vm['start'], vm['name'])):
+            after = ','.join(dependencies.get(vm['name'], []))
+            timings.add_row([vm['name'], vm['result']['result'], "%.2fs" % (vm['start'] - begin), "%.2fs" % (vm['end'] - begin), "%.2fs" % vm['time'], after])
+        print(timings)
+        if dependencies:
+            path = critical_path(results, dependencies)
+            click.secho("Critical path: %s" % ' -> '.join(path), fg='green')
+        click.secho("Plan %s deployed in %.2fs" % (plan, max(vm['end'] for vm in results) - begin), fg='green')
 
 
 @cli.command()
+@click.option('-p', '--plan', help='Wait for every vm of this plan')
+@click.option('-s', '--state', help='State to wait for', type=click.Choice(['up', 'ip', 'ssh']), default='up')
+@click.option('-t', '--timeout', help='Seconds to wait at most', type=int, default=300)
+@click.argument('names', nargs=-1)
+@pass_config
+def wait(config, plan, state, timeout, names):
+    """Wait for vms to be up, have an ip or accept ssh"""
+    k = config.get()
+    names = [name for name in names]
+    if plan is not None:
+        names.extend(vm.name for vm in k.inventory().plan(plan))
+    if not names:
+        click.secho("Missing names or plan. Leaving...", fg='red')
+        os._exit(1)
+    click.secho("Waiting for %s to reach state %s..." % (','.join(names), state), fg='green')
+    result = k.wait(names, state=state, timeout=timeout)
+    if result['result'] != 'success':
+        click.secho("%s :(" % result['reason'], fg='red')
+        os._exit(1)
+    click.secho("%s reached state %s in %.2fs" % (','.join(names), state, result['time']), fg='green')
+
+
+@cli.command()
+@click.option('-o', '--output', type=click.Choice(FORMATS), help='Machine readable output')
 @click.argument('name')
 @pass_config
-def info(config, name):
+def info(config, output, name):
     """Info about vm"""
+    if output is not None:
+        infos = config.fanout(lambda client: config.kvirt(client).info(name, display=False)) if len(config.targets) > 1 else [(config.client, config.get().info(name, display=False))]
+        infos = [OrderedDict([('client', client)] + [item for item in info.items()]) for client, info in infos if info is not None]
+        if not infos:
+            click.secho("VM %s not found" % name, fg='red', err=True)
+            os._exit(1)
+        write(infos, output, single=len(config.targets) == 1)
+        config.finish()
+        return
+    if len(config.targets) > 1:
+        found = False
+        for client, info in config.fanout(lambda client: config.kvirt(client).info(name, display=False)):
+            if info is not None:
+                click.secho("client:%s" % client, fg='green')
+                Kvirt.printinfo(info)
+                found = True
+        if not found:
+            print("VM %s not found" % name)
+        config.finish()
+        return
     k = config.get()
     k.info(name)
 
@@ -484,6 +981,40 @@ def network(config, delete, cidr, dhcp, name):
         k.delete_network(name=name)
     else:
         k.create_network(name=name, cidr=cidr, dhcp=dhcp)
+    config.cache.invalidate()
+
+
+@cli.command()
+@click.option('-l', '--listen', help='Address to listen on', default='127.0.0.1')
+@click.option('-p', '--port', help='Port to serve metrics on', type=int, default=9590)
+@click.option('-i', '--interval', help='Seconds between two samples of each client', type=float, default=10)
+@click.option('--history', help='Number of samples kept for each client', type=int, default=360)
+@pass_config
+def exporter(config, listen, port, interval, history):
+    """Sample every client and expose their metrics for prometheus on /metrics"""
+    from kvirt import events
+    from kvirt.exporter import Exporter, serve
+    if config.host is None:
+        os._exit(1)
+    parameters = click.get_current_context().parent.params
+    clients = sorted(config.targets) if parameters.get('clients') or parameters.get('allclients') else sorted(config.clients)
+    # events keep the descriptors of the domains cached between samples
+    events.start()
+    sampler = Exporter(lambda client: config.connect(client, shared=True), clients, interval=interval, history=history)
+    try:
+        server = serve(sampler, listen=listen, port=port)
+    except Exception as e:
+        click.secho("Couldnt listen on %s:%s: %s" % (listen, port, e), fg='red')
+        os._exit(1)
+    sampler.start()
+    click.secho("Exporting metrics of clients %s on http://%s:%s/metrics every %ss" % (','.join(clients), listen, port, interval), fg='green')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sampler.stop()
 
 
 @cli.command()
@@ -596,11 +1127,11 @@ def bootstrap(genfile, auto, name, host, port, user, protocol, url, pool, poolpa
         click.secho("Couldnt connect to specify hypervisor %s. Leaving..." % host, fg='red')
         os._exit(1)
     k.bootstrap(pool=pool, poolpath=poolpath, pooltype=pooltype, nets=nets)
-    # TODO:
-    # DOWNLOAD CIRROS ( AND CENTOS7? ) IMAGES TO POOL ?
+    click.secho("Use kcli download to get templates such as cirros or centos7 into pool %s" % pool, fg='green')
     path = os.path.expanduser('~/kcli.yml')
     if os.path.exists(path):
         copyfile(path, "%s.bck" % path)
+    import yaml
     with open(path, 'w') as conf_file:
         yaml.safe_dump(ini, conf_file, default_flow_style=False, encoding='utf-8', allow_unicode=True)
     click.secho("Environment bootstrapped!", fg='green')
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+libvirt connections shared within a process and kept alive
+"""
+
+from kvirt import events
+from kvirt.cache import Descriptors
+import os
+import threading
+import time
+import weakref
+
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
+SSHWRAPPER = """#!/bin/sh
+exec ssh -o ControlMaster=auto -o ControlPath=%s -o ControlPersist=%s "$@"
+"""
+
+
+def sshcommand(controlpersist, path='~/.kcli'):
+    """
+    write a ssh wrapper multiplexing connections through a ControlMaster socket kept for controlpersist seconds,
+    so that successive kcli runs against a qemu+ssh url reuse an authenticated channel. return its path
+    """
+    path = os.path.expanduser(path)
+    command = os.path.join(path, "ssh-%s" % controlpersist)
+    content = SSHWRAPPER % (os.path.join(path, 'ssh-%r@%h:%p'), controlpersist)
+    if os.path.exists(command):
+        with open(command) as wrapper:
+            if wrapper.read() == content:
+                return command
+    if not os.path.exists(path):
+        os.makedirs(path)
+    with open(command, 'w') as wrapper:
+        wrapper.write(content)
+    os.chmod(command, 0o755)
+    return command
+
+
+class ConnectionManager(object):
+    """
+    hand out one connection per url, reopening it when it was dropped.
+    when the libvirt event loop runs, connections get keepalive probes so dead peers are detected
+    """
+    def __init__(self, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+        self.interval = interval
+        self.count = count
+        self.connections = {}
+        self.lock = threading.RLock()
+        self.stats = {'connects': 0, 'connecttime': 0.0, 'reuses': 0, 'reconnects': 0, 'failures': 0}
+        self.caches = {}
+        self.allcaches = weakref.WeakSet()
+
+    def open(self, url):
+        """
+        open a dedicated connection to url, returning None on failure
+        """
+        from libvirt import open as libvirtopen
+        begin = time.time()
+        try:
+            conn = libvirtopen(url)
+        except Exception:
+            conn = None
+        with self.lock:
+            self.stats['connecttime'] += time.time() - begin
+            self.stats['connects' if conn is not None else 'failures'] += 1
+        if conn is None:
+            return None
+        if events.running():
+            try:
+                conn.setKeepAlive(self.interval, self.count)
+            except Exception:
+                pass
+        return conn
+
+    def increment(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def get(self, url):
+        """
+        return the shared connection to url, opening it or reopening it if it is not alive anymore
+        """
+        with self.lock:
+            conn = self.connections.get(url)
+            if conn is not None:
+                if alive(conn):
+                    self.increment('reuses')
+                    return conn
+                self.increment('reconnects')
+                del self.connections[url]
+            conn = self.open(url)
+            if conn is not None:
+                self.connections[url] = conn
+            return conn
+
+    def descriptors(self, url, shared=True):
+        """
+        return the descriptors cache of the shared connection to url, or a new one for a dedicated connection
+        """
+        with self.lock:
+            cache = self.caches.get(url) if shared else None
+            if cache is None:
+                cache = Descriptors()
+                self.allcaches.add(cache)
+                if shared:
+                    self.caches[url] = cache
+            return cache
+
+    def descriptorstats(self):
+        """
+        hits, misses and invalidations of every descriptors cache handed out
+        """
+        totals = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        with self.lock:
+            for cache in list(self.allcaches):
+                for key in totals:
+                    totals[key] += cache.stats[key]
+        return totals
+
+    def closeall(self):
+        with self.lock:
+            for conn in self.connections.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self.connections = {}
+
+
+def alive(conn):
+    try:
+        return conn.isAlive() == 1
+    except Exception:
+        return False
+
+
+manager = ConnectionManager()
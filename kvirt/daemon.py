@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kclid, a local daemon keeping warm connections and listings of the kcli clients, served over a unix socket
+"""
+
+import click
+import functools
+import json
+from kvirt import events
+import os
+import socket
+import sys
+import threading
+import time
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+SOCKET = '~/.kcli/kclid.sock'
+PINGTIMEOUT = 0.5
+# methods served by kclid, all of them returning json serializable results
+READS = ['exists', 'status', 'list', 'iterlist', 'info', 'report', 'capacity', 'volumes', 'list_pools', 'list_networks']
+WRITES = ['start', 'stop', 'restart', 'delete', 'start_many', 'stop_many', 'delete_many']
+# reads kept in memory until a libvirt event of the client or cachettl seconds
+MEMOS = ['list', 'iterlist', 'volumes', 'list_pools', 'list_networks']
+
+
+def request(message, path=SOCKET, timeout=None):
+    """
+    send message to kclid and return its response
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(os.path.expanduser(path))
+        sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        response = sock.makefile('rb').readline()
+    finally:
+        sock.close()
+    return json.loads(response.decode('utf-8'))
+
+
+class RemoteKvirt(object):
+    """
+    Kvirt lookalike forwarding the methods served by kclid to it, and any other one to a local Kvirt
+    only built when needed through local()
+    """
+    conn = True
+
+    def __init__(self, client, local, path=SOCKET):
+        self.client = client
+        self.local = local
+        self.path = path
+        self.host = client
+        self._k = None
+
+    @classmethod
+    def connect(cls, client, local, path=SOCKET):
+        """
+        return a RemoteKvirt if kclid is running and serves client, None otherwise
+        """
+        if not os.path.exists(os.path.expanduser(path)):
+            return None
+        try:
+            response = request({'client': client, 'method': 'ping'}, path=path, timeout=PINGTIMEOUT)
+        except (socket.error, ValueError):
+            return None
+        if not response.get('result'):
+            return None
+        return cls(client, local, path=path)
+
+    def _kvirt(self):
+        if self._k is None:
+            self._k = self.local()
+        return self._k
+
+    def call(self, method, *args, **kwargs):
+        try:
+            response = request({'client': self.client, 'method': method, 'args': args, 'kwargs': kwargs}, path=self.path)
+        except (socket.error, ValueError):
+            return getattr(self._kvirt(), method)(*args, **kwargs)
+        if response.get('output'):
+            sys.stdout.write(response['output'])
+        if 'error' in response:
+            raise Exception(response['error'])
+        return response.get('result')
+
+    def __getattr__(self, name):
+        if name in READS or name in WRITES:
+            return functools.partial(self.call, name)
+        return getattr(self._kvirt(), name)
+
+    def info(self, name, display=True):
+        from kvirt import Kvirt
+        info = self.call('info', name, display=False)
+        if info is None:
+            if display:
+                print("VM %s not found" % name)
+            return
+        if display:
+            Kvirt.printinfo(info)
+        return info
+
+    def report(self, display=True):
+        from kvirt import Kvirt
+        report = self.call('report', display=False)
+        if display:
+            Kvirt.printreport(report)
+        return report
+
+    def inventory(self):
+        from kvirt.inventory import InventorySnapshot, VM
+        return InventorySnapshot([VM(*vm) for vm in self.call('iterlist')])
+
+    def iterlist(self):
+        return iter(self.call('iterlist'))
+
+    def close(self):
+        if self._k is not None:
+            self._k.close()
+            self._k = None
+
+
+class Output(object):
+    """
+    sys.stdout replacement sending what is printed while handling a request back to its client
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = []
+
+    def release(self):
+        buffer = getattr(self.local, 'buffer', None) or []
+        self.local.buffer = None
+        return ''.join(buffer)
+
+    def write(self, data):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is not None:
+            buffer.append(data)
+        else:
+            self.stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class Kclid(object):
+    """
+    serve kcli requests against one shared connection per client, watched for libvirt events
+    """
+    def __init__(self, config, clients, output=None):
+        self.config = config
+        self.clients = clients
+        self.output = output
+        self.connections = {}
+        self.watched = {}
+        self.memos = dict((client, {}) for client in clients)
+        self.lock = threading.Lock()
+
+    def kvirt(self, client):
+        with self.lock:
+            k = self.connections.get(client)
+            if k is None:
+                k = self.config.connect(client, shared=True)
+                self.connections[client] = k
+            conn = k.conn
+            if conn is None:
+                del self.connections[client]
+            elif self.watched.get(client) is not conn:
+                self.watch(client, conn)
+            return k
+
+    def watch(self, client, conn):
+        def invalidate(*args):
+            self.memos[client] = {}
+        self.memos[client] = {}
+        self.watched[client] = conn
+        if not events.running():
+            return
+        import libvirt
+        try:
+            self.config.clientcache(client).watch(conn)
+            conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, invalidate, None)
+            if hasattr(conn, 'storagePoolEventRegisterAny'):
+                conn.storagePoolEventRegisterAny(None, libvirt.VIR_STORAGE_POOL_EVENT_ID_LIFECYCLE, invalidate, None)
+            if hasattr(conn, 'networkEventRegisterAny'):
+                conn.networkEventRegisterAny(None, libvirt.VIR_NETWORK_EVENT_ID_LIFECYCLE, invalidate, None)
+        except Exception as e:
+            click.secho("Couldnt watch events of client %s: %s" % (client, e), fg='red')
+
+    def handle(self, message):
+        client = message.get('client')
+        method = message.get('method')
+        if client not in self.clients:
+            return {'error': "Client %s not served" % client}
+        if method == 'ping':
+            return {'result': True}
+        if method not in READS and method not in WRITES:
+            return {'error': "Method %s not served" % method}
+        args = message.get('args', [])
+        kwargs = message.get('kwargs', {})
+        key = json.dumps([method, args, kwargs], sort_keys=True)
+        ttl = self.config.clientcache(client).ttl
+        if method in MEMOS:
+            memo = self.memos[client].get(key)
+            if memo is not None and time.time() - memo[0] <= ttl:
+                return {'result': memo[1]}
+        if self.output is not None:
+            self.output.capture()
+        try:
+            k = self.kvirt(client)
+            if k.conn is None:
+                response = {'error': "Couldnt connect to specify hypervisor %s" % k.host}
+            elif method == 'volumes':
+                # volumes are only memoized until an event, a write or the ttl, so they arent listed off an older index
+                k._volumeindex(refresh=True)
+                response = {'result': k.volumes(*args, **kwargs)}
+            elif method == 'iterlist':
+                response = {'result': [vm for vm in k.iterlist()]}
+            else:
+                response = {'result': getattr(k, method)(*args, **kwargs)}
+        except Exception as e:
+            response = {'error': str(e)}
+        finally:
+            if self.output is not None:
+                response['output'] = self.output.release()
+        if method in WRITES:
+            self.memos[client] = {}
+            self.config.clientcache(client).invalidate()
+        elif method in MEMOS and 'error' not in response and ttl:
+            self.memos[client][key] = (time.time(), response['result'])
+        return response
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            return
+        response = self.server.kclid.handle(message)
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('-s', '--socket', 'path', default=SOCKET, help='Unix socket to listen on')
+@click.option('-C', '--clients', help='Comma separated clients to serve instead of every client of the config file')
+def main(path, clients):
+    """Serve warm connections and listings of kcli clients over a unix socket"""
+    from kvirt.cli import Config
+    config = Config()
+    config.load()
+    if config.host is None:
+        os._exit(1)
+    if clients is None:
+        clients = sorted(config.clients)
+    else:
+        clients = [client.strip() for client in clients.split(',') if client.strip()]
+        for client in clients:
+            if client not in config.clients:
+                click.secho("Client %s not found in config.Leaving...." % client, fg='red')
+                os._exit(1)
+    path = os.path.expanduser(path)
+    if os.path.exists(path):
+        try:
+            request({'method': 'ping'}, path=path, timeout=PINGTIMEOUT)
+            click.secho("kclid already listening on %s. Leaving..." % path, fg='red')
+            os._exit(1)
+        except (socket.error, ValueError):
+            os.remove(path)
+    elif not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    events.start()
+    output = Output(sys.stdout)
+    kclid = Kclid(config, clients, output=output)
+    for client in clients:
+        if kclid.kvirt(client).conn is None:
+            click.secho("Couldnt connect to client %s, will retry upon requests" % client, fg='red')
+    umask = os.umask(0o077)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+    server.kclid = kclid
+    sys.stdout = output
+    click.secho("Serving clients %s on %s" % (','.join(clients), path), fg='green')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
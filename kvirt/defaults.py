@@ -11,3 +11,5 @@ VNC = False
 CLOUDINIT = True
 START = True
 EMULATOR = '/usr/bin/qemu-kvm'
+CACHETTL = 30
+TEMPLATES = {'cirros': 'cirros-0.3.4-x86_64-disk.img', 'centos7': 'CentOS-7-x86_64-GenericCloud.qcow2', 'ubuntu1604': 'xenial-server-cloudimg-amd64-disk1.img'}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+libvirt event loop shared by long lived processes
+"""
+
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _run():
+    import libvirt
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+def start():
+    """
+    register the default libvirt event implementation and run it in a daemon thread.
+    it needs to be called before opening the connections whose events are to be received
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            import libvirt
+            libvirt.virEventRegisterDefaultImpl()
+            _loop = threading.Thread(target=_run, name='libvirt-events')
+            _loop.daemon = True
+            _loop.start()
+    return _loop
+
+
+def running():
+    return _loop is not None
+
+
+def notify(conn, event):
+    """
+    set event, a threading.Event, upon lifecycle events of the domains of conn and upon their guest agents connecting.
+    return the callback ids, to be given to unnotify
+    """
+    import libvirt
+
+    def callback(*args):
+        event.set()
+    ids = [conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, callback, None)]
+    if hasattr(libvirt, 'VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE'):
+        ids.append(conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE, callback, None))
+    return ids
+
+
+def unnotify(conn, ids):
+    for callback in ids:
+        try:
+            conn.domainEventDeregisterAny(callback)
+        except Exception:
+            continue
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+periodic sampling of the domains, pools and networks of kcli clients, kept in ring buffers and exposed in the
+prometheus text format
+"""
+
+from collections import deque
+from kvirt.stats import rates, sample
+import threading
+import time
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+PORT = 9590
+INTERVAL = 10
+HISTORY = 360
+CONTENTTYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# name, type and help of every metric family, in exposition order
+FAMILIES = [('kcli_up', 'gauge', 'Whether the last sample of the client succeeded'),
+            ('kcli_sample_duration_seconds', 'gauge', 'Time taken by the last sample of the client'),
+            ('kcli_sample_timestamp_seconds', 'gauge', 'Time of the last successful sample of the client'),
+            ('kcli_domain_up', 'gauge', 'Whether the domain is running'),
+            ('kcli_domain_vcpus', 'gauge', 'Vcpus of the domain'),
+            ('kcli_domain_memory_bytes', 'gauge', 'Memory of the domain'),
+            ('kcli_domain_rss_bytes', 'gauge', 'Resident memory of the domain on the hypervisor'),
+            ('kcli_domain_cpu_seconds_total', 'counter', 'Cpu time used by the domain'),
+            ('kcli_domain_cpu_usage_ratio', 'gauge', 'Cpus used by the domain between the last two samples'),
+            ('kcli_domain_block_read_bytes_total', 'counter', 'Bytes read from the disks of the domain'),
+            ('kcli_domain_block_write_bytes_total', 'counter', 'Bytes written to the disks of the domain'),
+            ('kcli_domain_network_receive_bytes_total', 'counter', 'Bytes received by the interfaces of the domain'),
+            ('kcli_domain_network_transmit_bytes_total', 'counter', 'Bytes sent by the interfaces of the domain'),
+            ('kcli_pool_capacity_bytes', 'gauge', 'Size of the pool'),
+            ('kcli_pool_allocation_bytes', 'gauge', 'Space allocated in the pool'),
+            ('kcli_pool_available_bytes', 'gauge', 'Space available in the pool'),
+            ('kcli_network_leases', 'gauge', 'Dhcp leases of the network')]
+# sample record columns exposed for each domain, with their factor to base units
+DOMAINMETRICS = [('kcli_domain_up', 'active', 1), ('kcli_domain_vcpus', 'vcpus', 1), ('kcli_domain_memory_bytes', 'memory', 1024 * 1024),
+                 ('kcli_domain_rss_bytes', 'rss', 1024 * 1024), ('kcli_domain_cpu_seconds_total', 'cputime', 1),
+                 ('kcli_domain_block_read_bytes_total', 'blockread', 1), ('kcli_domain_block_write_bytes_total', 'blockwrite', 1),
+                 ('kcli_domain_network_receive_bytes_total', 'netrx', 1), ('kcli_domain_network_transmit_bytes_total', 'nettx', 1)]
+
+
+def escape(value):
+    """
+    label value with backslashes, double quotes and newlines escaped
+    """
+    return ("%s" % value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def line(name, labels, value):
+    return "%s{%s} %s" % (name, ','.join('%s="%s"' % (key, escape(label)) for key, label in labels), repr(float(value)))
+
+
+def pools(conn):
+    """
+    list of (name, capacity, allocation, available) in bytes of the active pools of conn
+    """
+    results = []
+    for pool in conn.listAllStoragePools(0):
+        try:
+            if not pool.isActive():
+                continue
+            results.append([pool.name()] + pool.info()[1:4])
+        except Exception:
+            continue
+    return results
+
+
+def leasecounts(conn):
+    """
+    list of (name, leases) of the active networks of conn
+    """
+    results = []
+    for network in conn.listAllNetworks(0):
+        try:
+            if not network.isActive():
+                continue
+            results.append((network.name(), len(network.DHCPLeases())))
+        except Exception:
+            continue
+    return results
+
+
+class Exporter(object):
+    """
+    sample each of clients every interval seconds in its own thread, keeping their history samples in ring buffers.
+    connect(client) returns the Kvirt of a client. the lines of each client are rendered once per sample,
+    so that serving them only joins strings
+    """
+    def __init__(self, connect, clients, interval=INTERVAL, history=HISTORY):
+        self.connect = connect
+        self.clients = clients
+        self.interval = interval
+        self.buffers = dict((client, deque(maxlen=history)) for client in clients)
+        self.lines = dict((client, {}) for client in clients)
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def collect(self, client):
+        """
+        sample client, store the sample in its buffer and render its lines
+        """
+        begin = time.time()
+        entry = None
+        try:
+            k = self.connections.get(client)
+            if k is None:
+                k = self.connect(client)
+                self.connections[client] = k
+            conn = k.conn
+            if conn is not None:
+                # disks arent exposed, pools being reported as a whole, so they arent sampled nor kept in the buffers
+                domains = sample(conn, k.descriptors, disks=False)
+                for record in domains:
+                    del record['disks']
+                entry = {'time': begin, 'domains': domains, 'pools': pools(conn), 'networks': leasecounts(conn)}
+        except Exception:
+            entry = None
+        duration = time.time() - begin
+        buffer = self.buffers[client]
+        with self.lock:
+            previous = buffer[-1] if buffer else None
+        lines = self.render(client, entry, previous, duration)
+        with self.lock:
+            if entry is not None:
+                buffer.append(entry)
+            self.lines[client] = lines
+        return entry
+
+    def render(self, client, entry, previous, duration):
+        """
+        lines of client, per metric family, out of entry and of the sample before it
+        """
+        lines = dict((name, []) for name, metrictype, description in FAMILIES)
+        labels = [('client', client)]
+        lines['kcli_up'].append(line('kcli_up', labels, entry is not None))
+        lines['kcli_sample_duration_seconds'].append(line('kcli_sample_duration_seconds', labels, duration))
+        if entry is None:
+            return lines
+        lines['kcli_sample_timestamp_seconds'].append(line('kcli_sample_timestamp_seconds', labels, entry['time']))
+        usage = {}
+        if previous is not None and entry['time'] > previous['time']:
+            usage = dict((record['name'], record['cputime']) for record in rates(previous['domains'], entry['domains'], entry['time'] - previous['time']))
+        for record in entry['domains']:
+            domainlabels = labels + [('domain', record['name']), ('plan', record['plan'] or '')]
+            for name, column, factor in DOMAINMETRICS:
+                lines[name].append(line(name, domainlabels, record[column] * factor))
+            if record['name'] in usage:
+                lines['kcli_domain_cpu_usage_ratio'].append(line('kcli_domain_cpu_usage_ratio', domainlabels, usage[record['name']]))
+        for name, capacity, allocation, available in entry['pools']:
+            poollabels = labels + [('pool', name)]
+            lines['kcli_pool_capacity_bytes'].append(line('kcli_pool_capacity_bytes', poollabels, capacity))
+            lines['kcli_pool_allocation_bytes'].append(line('kcli_pool_allocation_bytes', poollabels, allocation))
+            lines['kcli_pool_available_bytes'].append(line('kcli_pool_available_bytes', poollabels, available))
+        for name, leases in entry['networks']:
+            lines['kcli_network_leases'].append(line('kcli_network_leases', labels + [('network', name)], leases))
+        return lines
+
+    def exposition(self):
+        """
+        metrics of every client in the prometheus text format
+        """
+        with self.lock:
+            lines = [self.lines[client] for client in self.clients]
+        output = []
+        for name, metrictype, description in FAMILIES:
+            family = [entry for client in lines for entry in client.get(name, [])]
+            if not family:
+                continue
+            output.append("# HELP %s %s" % (name, description))
+            output.append("# TYPE %s %s" % (name, metrictype))
+            output.extend(family)
+        return "%s\n" % '\n'.join(output)
+
+    def history(self, client):
+        """
+        samples of client kept in its buffer, oldest first
+        """
+        with self.lock:
+            return [entry for entry in self.buffers[client]]
+
+    def run(self, client):
+        deadline = time.time()
+        while not self.stopped.is_set():
+            self.collect(client)
+            deadline += self.interval
+            remaining = deadline - time.time()
+            if remaining < 0:
+                # sampling took longer than interval, so the missed ticks are skipped
+                deadline, remaining = time.time(), 0
+            self.stopped.wait(remaining)
+
+    def start(self):
+        for client in self.clients:
+            thread = threading.Thread(target=self.run, args=(client,), name="exporter-%s" % client)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.exporter.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENTTYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(exporter, listen='127.0.0.1', port=PORT):
+    """
+    http server exposing the metrics of exporter on /metrics, to be run with serve_forever
+    """
+    server = Server((listen, port), Handler)
+    server.exporter = exporter
+    return server
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+single pass inventory of the vms of a libvirt daemon
+"""
+
+from kvirt.spec import tobytes
+from collections import namedtuple
+import errno
+import os
+import select
+import socket
+import time
+import xml.etree.ElementTree as ET
+
+# values of the libvirt constants, so that listing the inventory doesnt require loading the libvirt bindings
+VIR_DOMAIN_STATS_STATE, VIR_DOMAIN_SHUTOFF, VIR_DOMAIN_CRASHED = 1, 5, 6
+VM = namedtuple('VM', ['name', 'status', 'ip', 'source', 'description', 'profile', 'numcpus', 'memory'])
+# listings cached before numcpus and memory were gathered lack them
+VM.__new__.__defaults__ = (None, None)
+INACTIVE_STATES = [VIR_DOMAIN_SHUTOFF, VIR_DOMAIN_CRASHED]
+
+
+def leases(conn):
+    """
+    return a dict mac -> ip gathered from the dhcp leases of every active network, with one call per network
+    """
+    addresses = {}
+    for network in conn.listAllNetworks(0):
+        try:
+            if not network.isActive():
+                continue
+            for lease in network.DHCPLeases():
+                mac = lease.get('mac')
+                if mac is not None and mac not in addresses:
+                    addresses[mac] = lease.get('ipaddr')
+        except Exception:
+            continue
+    return addresses
+
+
+def domains(conn):
+    """
+    return a list of (domain, active) using a single bulk call
+    """
+    try:
+        return [(vm, stats.get('state.state') not in INACTIVE_STATES) for vm, stats in conn.getAllDomainStats(VIR_DOMAIN_STATS_STATE)]
+    except Exception:
+        return [(vm, bool(vm.isActive())) for vm in conn.listAllDomains(0)]
+
+
+def parse(name, active, xml, addresses={}):
+    """
+    build a VM entry out of the xml of a domain
+    """
+    root = ET.fromstring(xml)
+    description = root.find('description')
+    if description is not None and description.text is not None:
+        description = description.text
+    else:
+        description = ''
+    state = 'up' if active else 'down'
+    ip = ''
+    if active:
+        for interface in root.iter('interface'):
+            mac = interface.find('mac')
+            if mac is not None and addresses.get(mac.get('address')):
+                ip = addresses[mac.get('address')]
+                break
+    title = ''
+    for entry in root.iter('entry'):
+        attributes = entry.attrib
+        if attributes['name'] == 'version':
+            ip = entry.text
+        if attributes['name'] == 'product':
+            title = entry.text
+    source = ''
+    for element in root.iter('backingStore'):
+        s = element.find('source')
+        if s is not None:
+            source = os.path.basename(s.get('file'))
+            break
+    numcpus = None
+    vcpu = root.find('vcpu')
+    if vcpu is not None and vcpu.text is not None:
+        numcpus = int(vcpu.text)
+    memory = tobytes(root.find('memory'))
+    if memory is not None:
+        memory = memory // 1024 // 1024
+    return VM(name, state, ip, source, description, title, numcpus, memory)
+
+
+def iterinventory(conn, descriptors=None):
+    """
+    yield a VM for each domain of conn as soon as its xml is parsed, in the order of the bulk listing.
+    xml is taken from descriptors, a kvirt.cache.Descriptors, when given
+    """
+    addresses = leases(conn)
+    for vm, active in domains(conn):
+        try:
+            xml = descriptors.xml(vm) if descriptors is not None else vm.XMLDesc(0)
+        except Exception:
+            continue
+        yield parse(vm.name(), active, xml, addresses)
+
+
+def reachable(ips, port=22, timeout=1):
+    """
+    return the set of ips accepting tcp connections on port, all probed at once with non blocking sockets
+    """
+    sockets = {}
+    for ip in ips:
+        probe = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
+        probe.setblocking(0)
+        if probe.connect_ex((ip, port)) in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+            sockets[probe] = ip
+        else:
+            probe.close()
+    ready = set()
+    deadline = time.time() + timeout
+    try:
+        while sockets:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            writable = select.select([], [probe for probe in sockets], [], remaining)[1]
+            if not writable:
+                break
+            for probe in writable:
+                ip = sockets.pop(probe)
+                if probe.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    ready.add(ip)
+                probe.close()
+    finally:
+        for probe in sockets:
+            probe.close()
+    return ready
+
+
+class InventorySnapshot:
+    """
+    vms of a hypervisor gathered at once and indexed by name, plan, template and ip
+    """
+    def __init__(self, vms):
+        self.vms = sorted(vms)
+        self.names = {}
+        self.plans = {}
+        self.templates = {}
+        self.ips = {}
+        for vm in self.vms:
+            self.names[vm.name] = vm
+            self.plans.setdefault(vm.description, []).append(vm)
+            self.templates.setdefault(vm.source, []).append(vm)
+            if vm.ip:
+                self.ips[vm.ip] = vm
+
+    @classmethod
+    def fromconn(cls, conn, descriptors=None):
+        """
+        snapshot of the vms of conn, whose xml is taken from descriptors, a kvirt.cache.Descriptors, when given
+        """
+        return cls(iterinventory(conn, descriptors))
+
+    def __iter__(self):
+        return iter(self.vms)
+
+    def __len__(self):
+        return len(self.vms)
+
+    def get(self, name):
+        return self.names.get(name)
+
+    def plan(self, plan):
+        return self.plans.get(plan, [])
+
+    def template(self, template):
+        return self.templates.get(template, [])
+
+    def ip(self, ip):
+        return self.ips.get(ip)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+in memory iso9660 images with joliet extensions, as used for cloud-init nocloud seeds
+"""
+
+import re
+import struct
+import time
+
+SECTOR = 2048
+# layout of the image, in sectors
+PRIMARY, JOLIET, TERMINATOR = 16, 17, 18
+PATHTABLES = 19
+ROOT = 23
+DATA = 25
+# escape sequence of joliet ucs-2 level 3
+UCS2 = b'%/E'
+
+
+def both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def pad(data, size, fill=b'\x00'):
+    return data + fill * (size - len(data))
+
+
+def text(value, size, joliet=False):
+    """
+    space padded identifier, encoded in ucs-2 for joliet
+    """
+    if joliet:
+        return pad(value.encode('utf-16-be')[:size], size, b'\x00 ' if size % 2 == 0 else b' ')[:size]
+    return pad(value.encode('ascii')[:size], size, b' ')
+
+
+def shortname(name):
+    """
+    8.3 level 1 identifier of name
+    """
+    base, dot, extension = name.upper().rpartition('.')
+    if not dot:
+        base, extension = extension, ''
+    base = re.sub('[^A-Z0-9_]', '_', base)[:8]
+    extension = re.sub('[^A-Z0-9_]', '_', extension)[:3]
+    return ("%s.%s;1" % (base, extension)).encode('ascii')
+
+
+def recorddate(timestamp):
+    date = time.gmtime(timestamp)
+    return struct.pack('7B', date.tm_year - 1900, date.tm_mon, date.tm_mday, date.tm_hour, date.tm_min, date.tm_sec, 0)
+
+
+def volumedate(timestamp):
+    return time.strftime('%Y%m%d%H%M%S00', time.gmtime(timestamp)).encode('ascii') + b'\x00'
+
+
+def record(identifier, extent, size, timestamp, directory=False):
+    """
+    directory record pointing to extent
+    """
+    length = 33 + len(identifier)
+    length += length % 2
+    record = struct.pack('BB', length, 0) + both32(extent) + both32(size) + recorddate(timestamp)
+    record += struct.pack('BBB', 2 if directory else 0, 0, 0) + both16(1) + struct.pack('B', len(identifier)) + identifier
+    return pad(record, length)
+
+
+def directory(entries, extent, timestamp):
+    """
+    root directory sector, entries being (identifier, extent, size) sorted by identifier
+    """
+    data = record(b'\x00', extent, SECTOR, timestamp, directory=True) + record(b'\x01', extent, SECTOR, timestamp, directory=True)
+    for identifier, start, size in entries:
+        data += record(identifier, start, size, timestamp)
+    if len(data) > SECTOR:
+        raise ValueError("Too many files for a seed image")
+    return pad(data, SECTOR)
+
+
+def pathtable(extent, bigendian=False):
+    return struct.pack('>BBIH' if bigendian else '<BBIH', 1, 0, extent, 1) + b'\x00\x00'
+
+
+def descriptor(volid, size, root, pathtables, timestamp, joliet=False):
+    data = struct.pack('B', 2 if joliet else 1) + b'CD001\x01\x00'
+    data += text('LINUX', 32, joliet) + text(volid, 32, joliet) + b'\x00' * 8 + both32(size)
+    data += pad(UCS2 if joliet else b'', 32)
+    data += both16(1) + both16(1) + both16(SECTOR) + both32(10)
+    data += struct.pack('<I', pathtables) + b'\x00' * 4 + struct.pack('>I', pathtables + 1) + b'\x00' * 4
+    data += record(b'\x00', root, SECTOR, timestamp, directory=True)
+    data += text('', 128, joliet) * 3 + text('KCLI', 128, joliet)
+    data += text('', 37, joliet) * 3
+    data += volumedate(timestamp) * 2 + b'0' * 16 + b'\x00' + volumedate(timestamp)
+    data += b'\x01\x00'
+    return pad(data, SECTOR)
+
+
+def build(files, volid='cidata', timestamp=None):
+    """
+    return an iso9660 image with joliet extensions, as bytes, holding files, a dict of name -> content.
+    files all live in the root directory, which is what a nocloud seed needs
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    names = sorted(files)
+    contents = []
+    for name in names:
+        content = files[name]
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        contents.append(content)
+    extents = []
+    extent = DATA
+    for content in contents:
+        extents.append(extent)
+        extent += max(1, (len(content) + SECTOR - 1) // SECTOR)
+    size = extent
+    primary = sorted((shortname(name), start, len(content)) for name, start, content in zip(names, extents, contents))
+    joliet = sorted((name.encode('utf-16-be'), start, len(content)) for name, start, content in zip(names, extents, contents))
+    image = [b'\x00' * SECTOR * PRIMARY]
+    image.append(descriptor(volid, size, ROOT, PATHTABLES, timestamp))
+    image.append(descriptor(volid, size, ROOT + 1, PATHTABLES + 2, timestamp, joliet=True))
+    image.append(pad(b'\xffCD001\x01', SECTOR))
+    for root in (ROOT, ROOT + 1):
+        image.append(pad(pathtable(root), SECTOR))
+        image.append(pad(pathtable(root, bigendian=True), SECTOR))
+    image.append(directory(primary, ROOT, timestamp))
+    image.append(directory(joliet, ROOT + 1, timestamp))
+    for content in contents:
+        image.append(content)
+        image.append(b'\x00' * (-len(content) % SECTOR or (SECTOR if not content else 0)))
+    return b''.join(image)
+
+
+def seed(userdata, metadata, volid='cidata'):
+    """
+    nocloud seed image holding user-data and meta-data
+    """
+    return build({'user-data': userdata, 'meta-data': metadata}, volid=volid)
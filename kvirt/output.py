@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+machine readable output of listings, as json, yaml, csv or newline delimited json
+"""
+
+import csv
+import json
+import sys
+
+FORMATS = ['json', 'yaml', 'csv', 'ndjson']
+
+
+def flatten(value):
+    """
+    csv cell of value, with lists and dicts as json
+    """
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value)
+    return value
+
+
+def write(records, output, fields=None, stream=None, single=False):
+    """
+    write records, an iterable of dicts, to stream in format output. ndjson and csv records are written as soon as
+    they are produced, json and yaml ones once all of them were. fields are the csv columns, the keys of the first record
+    by default. when single, json and yaml render the only record instead of a list of records
+    """
+    stream = stream if stream is not None else sys.stdout
+    if output == 'ndjson':
+        for record in records:
+            stream.write("%s\n" % json.dumps(record))
+            stream.flush()
+    elif output == 'csv':
+        writer = None
+        for record in records:
+            if writer is None:
+                writer = csv.DictWriter(stream, fields or [key for key in record], extrasaction='ignore', lineterminator='\n')
+                writer.writeheader()
+            writer.writerow(dict((key, flatten(value)) for key, value in record.items()))
+            stream.flush()
+    elif output == 'json':
+        records = [record for record in records]
+        stream.write("%s\n" % json.dumps(records[0] if single and records else records, indent=2))
+    elif output == 'yaml':
+        import yaml
+        records = [dict(record) for record in records]
+        stream.write(yaml.safe_dump(records[0] if single and records else records, default_flow_style=False))
+    else:
+        raise ValueError("Invalid output %s" % output)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+concurrent deployment of the vms of a plan
+"""
+
+from multiprocessing.pool import ThreadPool
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+import threading
+import time
+
+
+def find_cycle(dependencies):
+    """
+    return a list of names forming a dependency cycle, or None if the graph is acyclic
+    """
+    visiting, visited = [], set()
+
+    def visit(name):
+        if name in visited:
+            return None
+        if name in visiting:
+            return visiting[visiting.index(name):] + [name]
+        visiting.append(name)
+        for dependency in sorted(dependencies.get(name, [])):
+            cycle = visit(dependency)
+            if cycle is not None:
+                return cycle
+        visiting.pop()
+        visited.add(name)
+        return None
+    for name in sorted(dependencies):
+        cycle = visit(name)
+        if cycle is not None:
+            return cycle
+    return None
+
+
+def critical_path(results, dependencies):
+    """
+    return the chain of vms which determined the total deployment time, walking back from the last vm to finish
+    """
+    ends = dict((vm['name'], vm['end']) for vm in results)
+    if not ends:
+        return []
+    name = max(ends, key=lambda vm: ends[vm])
+    path = [name]
+    while dependencies.get(name):
+        name = max(dependencies[name], key=lambda vm: ends.get(vm, 0))
+        path.insert(0, name)
+    return path
+
+
+def diff(vms, inventory):
+    """
+    compare vms, a list of (name, parameters of Kvirt.create), with an inventory snapshot. return the vms missing
+    from it, a list of (name, changes) for the deployed ones whose numcpus or memory drifted, changes being a dict
+    field -> wanted value, and the names of the deployed ones left as they are
+    """
+    missing, drifted, unchanged = [], [], []
+    for name, parameters in vms:
+        vm = inventory.get(name)
+        if vm is None:
+            missing.append((name, parameters))
+            continue
+        changes = {}
+        for field in ['numcpus', 'memory']:
+            current = getattr(vm, field)
+            if current is not None and parameters.get(field) is not None and int(parameters[field]) != current:
+                changes[field] = int(parameters[field])
+        if changes:
+            drifted.append((name, changes))
+        else:
+            unchanged.append(name)
+    return missing, drifted, unchanged
+
+
+class PlanExecutor:
+    """
+    deploy vms through a bounded pool of workers, each worker using its own libvirt connection
+    """
+    def __init__(self, connect, workers=1):
+        self.connect = connect
+        self.workers = max(1, int(workers))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self):
+        k = getattr(self._local, 'k', None)
+        if k is None:
+            k = self.connect()
+            self._local.k = k
+            with self._lock:
+                self._connections.append(k)
+        return k
+
+    def close(self):
+        with self._lock:
+            for k in self._connections:
+                if k.conn is not None:
+                    k.close()
+            self._connections = []
+
+    def deploy(self, vm):
+        """
+        create vm, always returning a result, as a raising worker would leave the scheduler waiting for it forever
+        """
+        name, parameters = vm
+        begin = time.time()
+        try:
+            k = self._connection()
+            if k.conn is None:
+                result = {'result': 'failure', 'reason': "Couldnt connect to hypervisor %s" % k.host}
+            else:
+                result = k.create(name=name, **parameters)
+        except Exception as e:
+            result = {'result': 'failure', 'reason': str(e)}
+        end = time.time()
+        return {'name': name, 'result': result, 'start': begin, 'end': end, 'time': end - begin}
+
+    def run(self, vms, callback=None, dependencies=None):
+        """
+        deploy vms, a list of (name, parameters of Kvirt.create) and return their results in the same order.
+        when dependencies, a dict of name -> names it requires, is provided, each vm is only deployed once
+        all its requirements were successfully deployed
+        """
+        if dependencies:
+            return self._schedule(vms, dependencies, callback=callback)
+        results = {}
+        workers = min(self.workers, len(vms))
+        pool = None
+        try:
+            if workers <= 1:
+                deployed = (self.deploy(vm) for vm in vms)
+            else:
+                pool = ThreadPool(workers)
+                deployed = pool.imap_unordered(self.deploy, vms)
+            for result in deployed:
+                results[result['name']] = result
+                if callback is not None:
+                    callback(result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self.close()
+        return [results[name] for name, parameters in vms]
+
+    def _schedule(self, vms, dependencies, callback=None):
+        parameters = dict(vms)
+        pending = dict((name, set(dependencies.get(name, [])) & set(parameters)) for name in parameters)
+        results = {}
+        done = Queue()
+        running = 0
+        pool = ThreadPool(max(1, min(self.workers, len(vms))))
+
+        def finish(result):
+            results[result['name']] = result
+            if callback is not None:
+                callback(result)
+        try:
+            while pending or running:
+                ready = [name for name, parameter in vms if name in pending and not pending[name]]
+                for name in ready:
+                    del pending[name]
+                    pool.apply_async(self.deploy, ((name, parameters[name]),), callback=done.put)
+                    running += 1
+                if not running:
+                    break
+                result = done.get()
+                running -= 1
+                finish(result)
+                if result['result']['result'] == 'success':
+                    for name in pending:
+                        pending[name].discard(result['name'])
+                    continue
+                failed = [result['name']]
+                while failed:
+                    dependency = failed.pop()
+                    for name in [name for name in pending if dependency in pending[name]]:
+                        del pending[name]
+                        now = time.time()
+                        reason = "dependency %s not deployed" % dependency
+                        finish({'name': name, 'result': {'result': 'failure', 'reason': reason}, 'start': now, 'end': now, 'time': 0})
+                        failed.append(name)
+        finally:
+            pool.close()
+            pool.join()
+            self.close()
+        return [results[name] for name, parameter in vms if name in results]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+resolution of the create parameters of vms out of plan entries, profiles and defaults
+"""
+
+from kvirt.defaults import NETS, POOL, NUMCPUS, MEMORY, DISKS, DISKSIZE, DISKINTERFACE, DISKTHIN, GUESTID, VNC, CLOUDINIT, START
+import copy
+import os
+
+# parameters falling back to the default section, then to the builtin defaults
+DEFAULTS = [('nets', NETS), ('pool', POOL), ('numcpus', NUMCPUS), ('memory', MEMORY), ('disks', DISKS), ('disksize', DISKSIZE), ('diskinterface', DISKINTERFACE), ('diskthin', DISKTHIN), ('guestid', GUESTID), ('vnc', VNC), ('cloudinit', CLOUDINIT), ('start', START)]
+# parameters only set by profiles or plan entries
+OPTIONALS = ['template', 'iso', 'keys', 'cmds', 'netmasks', 'gateway', 'dns', 'domain', 'scripts']
+
+
+def defaults(section=None):
+    """
+    default section of the config file completed with the builtin defaults
+    """
+    section = section or {}
+    values = dict((key, section.get(key, value)) for key, value in DEFAULTS)
+    values['numcpus'] = int(values['numcpus'])
+    values['memory'] = int(values['memory'])
+    for key in ['vnc', 'cloudinit', 'start']:
+        values[key] = bool(values[key])
+    return values
+
+
+class ProfileResolver(object):
+    """
+    profiles, which can inherit from another one through their base key, merged with the default section.
+    merged profiles are computed once and scripts are only read again when their file changes
+    """
+    def __init__(self, profiles=None, default=None):
+        self.profiles = profiles or {}
+        self.default = default if default is not None else defaults()
+        self._merged = {}
+        self._scripts = {}
+
+    @classmethod
+    def fromhome(cls, home=None):
+        """
+        resolver for the kcli.yml and kcli_profiles.yml files of home
+        """
+        import yaml
+        home = home or os.environ.get('HOME')
+        section, profiles = {}, {}
+        inifile = "%s/kcli.yml" % home
+        if os.path.exists(inifile):
+            with open(inifile, 'r') as entries:
+                section = (yaml.load(entries) or {}).get('default', {})
+        profilefile = "%s/kcli_profiles.yml" % home
+        if os.path.exists(profilefile):
+            with open(profilefile, 'r') as entries:
+                profiles = yaml.load(entries) or {}
+        return cls(profiles, defaults(section))
+
+    def __contains__(self, name):
+        return name in self.profiles
+
+    def profile(self, name, inheriting=None):
+        """
+        profile name merged with the profiles it inherits from and the default section, None if it doesnt exist
+        """
+        if name in self._merged:
+            return self._merged[name]
+        if name not in self.profiles:
+            return None
+        inheriting = (inheriting or []) + [name]
+        profile = self.profiles[name] or {}
+        base = profile.get('base')
+        if base is None:
+            merged = dict(self.default)
+        elif base in inheriting:
+            raise ValueError("Profile inheritance cycle: %s" % ' -> '.join(inheriting + [base]))
+        else:
+            merged = self.profile(base, inheriting)
+            if merged is None:
+                raise ValueError("Profile %s inherits from missing profile %s" % (name, base))
+            merged = dict(merged)
+        for key, value in profile.items():
+            if key != 'base' and value is not None:
+                merged[key] = value
+        self._merged[name] = merged
+        return merged
+
+    def script(self, path):
+        """
+        non empty lines of script path, None if it doesnt exist
+        """
+        path = os.path.expanduser(path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        cached = self._scripts.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path) as script:
+                cached = (mtime, [line.strip() for line in script.readlines() if line != '\n'])
+            self._scripts[path] = cached
+        return cached[1]
+
+    def resolve(self, profile=None, entry=None, title=None, description='kvirt'):
+        """
+        create parameters of a vm out of entry, its own parameters as found in a plan, on top of its profile and
+        of the default section. return None when the profile doesnt exist
+        """
+        entry = entry or {}
+        profile = entry.get('profile', profile)
+        if profile is not None:
+            merged = self.profile(profile)
+            if merged is None:
+                return None
+        else:
+            merged = self.default
+        parameters = dict((key, merged.get(key)) for key, value in DEFAULTS)
+        parameters.update((key, merged.get(key)) for key in OPTIONALS)
+        for key in parameters:
+            if entry.get(key) is not None:
+                parameters[key] = entry[key]
+        scripts = parameters.pop('scripts')
+        if scripts is not None:
+            scriptcmds = []
+            for script in scripts:
+                lines = self.script(script)
+                if lines is None:
+                    print("Script %s not found.Ignoring..." % os.path.expanduser(script))
+                else:
+                    scriptcmds.extend(lines)
+            if scriptcmds:
+                parameters['cmds'] = scriptcmds if parameters['cmds'] is None else parameters['cmds'] + scriptcmds
+        parameters['numcpus'] = int(parameters['numcpus'])
+        parameters['memory'] = int(parameters['memory'])
+        for key in ['vnc', 'cloudinit', 'start']:
+            parameters[key] = bool(parameters[key])
+        parameters['ips'] = entry.get('ips')
+        parameters['title'] = title if title is not None else profile or ''
+        parameters['description'] = description
+        # create fills the nets of the parameters, which would otherwise be shared with the merged profile
+        return copy.deepcopy(parameters)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+domains, volumes, networks and pools as plain objects, rendered to libvirt xml in one pass and parsed back from it
+"""
+
+from xml.sax.saxutils import escape, quoteattr
+import xml.etree.ElementTree as ET
+
+# bytes per unit of a memory or capacity element, in KiB when unit is missing
+UNITS = {'b': 1, 'bytes': 1, 'KB': 1000, 'k': 1024, 'KiB': 1024, 'MB': 1000 ** 2, 'M': 1024 ** 2, 'MiB': 1024 ** 2, 'GB': 1000 ** 3, 'G': 1024 ** 3, 'GiB': 1024 ** 3}
+
+
+def tobytes(element, default='KiB'):
+    """
+    value of a memory or capacity element in bytes, None if it is missing
+    """
+    if element is None or element.text is None:
+        return None
+    return int(element.text) * UNITS.get(element.get('unit', default), 1024)
+
+
+class Disk(object):
+    __slots__ = ['path', 'dev', 'bus', 'format', 'device', 'backing', 'backingformat', 'cache', 'readonly']
+
+    def __init__(self, path, dev, bus='virtio', format='qcow2', device='disk', backing=None, backingformat='raw', cache=None, readonly=False):
+        self.path = path
+        self.dev = dev
+        self.bus = bus
+        self.format = format
+        self.device = device
+        self.backing = backing
+        self.backingformat = backingformat
+        self.cache = cache
+        self.readonly = readonly
+
+    def xml(self):
+        parts = ["<disk type='file' device=%s>" % quoteattr(self.device)]
+        parts.append("<driver name='qemu' type=%s%s/>" % (quoteattr(self.format), " cache=%s" % quoteattr(self.cache) if self.cache else ''))
+        if self.path:
+            parts.append("<source file=%s/>" % quoteattr(self.path))
+        if self.backing is not None:
+            parts.append("<backingStore type='file' index='1'><format type=%s/><source file=%s/><backingStore/></backingStore>" % (quoteattr(self.backingformat), quoteattr(self.backing)))
+        elif self.device == 'disk':
+            parts.append("<backingStore/>")
+        parts.append("<target dev=%s bus=%s/>" % (quoteattr(self.dev), quoteattr(self.bus)))
+        if self.readonly:
+            parts.append("<readonly/>")
+        parts.append("</disk>")
+        return ''.join(parts)
+
+    @classmethod
+    def fromelement(cls, element):
+        driver = element.find('driver')
+        source = element.find('source')
+        target = element.find('target')
+        backing, backingformat = None, 'raw'
+        backingstore = element.find('backingStore')
+        if backingstore is not None and backingstore.find('source') is not None:
+            backing = backingstore.find('source').get('file')
+            if backingstore.find('format') is not None:
+                backingformat = backingstore.find('format').get('type')
+        return cls(source.get('file') if source is not None else None, target.get('dev') if target is not None else None,
+                   bus=target.get('bus') if target is not None else None, format=driver.get('type') if driver is not None else None,
+                   device=element.get('device', 'disk'), backing=backing, backingformat=backingformat,
+                   cache=driver.get('cache') if driver is not None else None, readonly=element.find('readonly') is not None)
+
+
+class Interface(object):
+    __slots__ = ['source', 'type', 'model', 'mac']
+
+    def __init__(self, source, type='network', model='virtio', mac=None):
+        self.source = source
+        self.type = type
+        self.model = model
+        self.mac = mac
+
+    def xml(self):
+        mac = "<mac address=%s/>" % quoteattr(self.mac) if self.mac else ''
+        return "<interface type=%s>%s<source %s=%s/><model type=%s/></interface>" % (quoteattr(self.type), mac, self.type, quoteattr(self.source), quoteattr(self.model))
+
+    @classmethod
+    def fromelement(cls, element):
+        networktype = element.get('type')
+        source = element.find('source')
+        mac = element.find('mac')
+        model = element.find('model')
+        return cls(source.get(networktype) if source is not None else None, type=networktype,
+                   model=model.get('type') if model is not None else None, mac=mac.get('address') if mac is not None else None)
+
+
+class Domain(object):
+    """
+    the parts of a domain kcli deals with. memory is in MiB and serial is the tcp port of a telnet serial console,
+    a pty one being used when it is None
+    """
+    __slots__ = ['name', 'virttype', 'description', 'title', 'version', 'memory', 'numcpus', 'machine', 'disks', 'interfaces', 'display', 'serial', 'nested', 'uuid', 'graphics']
+
+    def __init__(self, name, virttype='kvm', description='kvirt', title='', version=None, memory=512, numcpus=2, machine='pc', disks=None, interfaces=None, display='spice', serial=None, nested=True, uuid=None, graphics=None):
+        self.name = name
+        self.virttype = virttype
+        self.description = description
+        self.title = title
+        self.version = version
+        self.memory = memory
+        self.numcpus = numcpus
+        self.machine = machine
+        self.disks = disks if disks is not None else []
+        self.interfaces = interfaces if interfaces is not None else []
+        self.display = display
+        self.serial = serial
+        self.nested = nested
+        self.uuid = uuid
+        self.graphics = graphics if graphics is not None else []
+
+    def xml(self):
+        parts = ["<domain type=%s><name>%s</name>" % (quoteattr(self.virttype), escape(self.name))]
+        if self.uuid is not None:
+            parts.append("<uuid>%s</uuid>" % escape(self.uuid))
+        parts.append("<description>%s</description>" % escape(self.description or ''))
+        parts.append("<sysinfo type='smbios'><system>")
+        if self.version is not None:
+            parts.append("<entry name='version'>%s</entry>" % escape(self.version))
+        parts.append("<entry name='product'>%s</entry></system></sysinfo>" % escape(self.title or ''))
+        parts.append("<memory unit='MiB'>%d</memory><vcpu>%d</vcpu>" % (self.memory, self.numcpus))
+        parts.append("<os><type arch='x86_64' machine=%s>hvm</type><boot dev='hd'/><boot dev='cdrom'/><bootmenu enable='yes'/><smbios mode='sysinfo'/></os>" % quoteattr(self.machine))
+        parts.append("<features><acpi/><apic/><pae/></features><clock offset='utc'/>")
+        parts.append("<on_poweroff>destroy</on_poweroff><on_reboot>restart</on_reboot><on_crash>restart</on_crash><devices>")
+        parts.extend(disk.xml() for disk in self.disks)
+        parts.extend(interface.xml() for interface in self.interfaces)
+        parts.append("<input type='tablet' bus='usb'/><input type='mouse' bus='ps2'/>")
+        parts.append("<graphics type=%s port='-1' autoport='yes' listen='0.0.0.0'><listen type='address' address='0.0.0.0'/></graphics>" % quoteattr(self.display))
+        parts.append("<memballoon model='virtio'/>")
+        if self.serial is None:
+            parts.append("<serial type='pty'><target port='0'/></serial><console type='pty'><target type='serial' port='0'/></console>")
+        else:
+            parts.append("<serial type='tcp'><source mode='bind' host='127.0.0.1' service=%s/><protocol type='telnet'/><target port='0'/></serial>" % quoteattr(str(self.serial)))
+        parts.append("</devices>")
+        if self.nested and self.virttype == 'kvm':
+            parts.append("<cpu match='exact'><model>Westmere</model><feature policy='require' name='vmx'/></cpu>")
+        parts.append("</domain>")
+        return ''.join(parts)
+
+    @classmethod
+    def fromxml(cls, xml):
+        root = ET.fromstring(xml)
+        version, title = None, ''
+        for entry in root.iter('entry'):
+            if entry.get('name') == 'version':
+                version = entry.text
+            elif entry.get('name') == 'product':
+                title = entry.text
+        memory = tobytes(root.find('memory'))
+        vcpu = root.find('vcpu')
+        serial = None
+        for element in root.iter('serial'):
+            source = element.find('source')
+            if source is not None and source.get('service'):
+                serial = source.get('service')
+                break
+        graphics = [(element.get('type'), element.get('listen'), element.get('port')) for element in root.iter('graphics')]
+        description = root.find('description')
+        uuid = root.find('uuid')
+        ostype = root.find('os/type')
+        return cls(root.find('name').text, virttype=root.get('type'), description=(description.text or '') if description is not None else '',
+                   title=title, version=version, memory=memory // 1024 // 1024 if memory is not None else None,
+                   numcpus=int(vcpu.text) if vcpu is not None else None, machine=ostype.get('machine') if ostype is not None else None,
+                   disks=[Disk.fromelement(element) for element in root.iter('disk')],
+                   interfaces=[Interface.fromelement(element) for element in root.iter('interface')],
+                   display=graphics[0][0] if graphics else None, serial=serial, nested=root.find('cpu/feature[@name="vmx"]') is not None,
+                   uuid=uuid.text if uuid is not None else None, graphics=graphics)
+
+
+class Volume(object):
+    """
+    a volume of capacity bytes. block volumes only get a name, a capacity and a path
+    """
+    __slots__ = ['path', 'capacity', 'format', 'backing', 'backingformat', 'pooltype']
+
+    def __init__(self, path, capacity, format='qcow2', backing=None, backingformat=None, pooltype='file'):
+        self.path = path
+        self.capacity = capacity
+        self.format = format
+        self.backing = backing
+        self.backingformat = backingformat
+        self.pooltype = pooltype
+
+    def xml(self):
+        name = escape(self.path.split('/')[-1])
+        path = escape(self.path)
+        if self.pooltype == 'block':
+            return "<volume type='block'><name>%s</name><capacity unit='bytes'>%d</capacity><target><path>%s</path><compat>1.1</compat></target></volume>" % (name, self.capacity, path)
+        if self.backing is not None:
+            backingstore = "<backingStore><path>%s</path><format type=%s/></backingStore>" % (escape(self.backing), quoteattr(self.backingformat or self.format))
+        else:
+            backingstore = "<backingStore/>"
+        return ("<volume type='file'><name>%s</name><capacity unit='bytes'>%d</capacity><target><path>%s</path><format type=%s/>"
+                "<permissions><mode>0644</mode></permissions><compat>1.1</compat></target>%s</volume>") % (name, self.capacity, path, quoteattr(self.format), backingstore)
+
+    @classmethod
+    def fromxml(cls, xml):
+        root = ET.fromstring(xml)
+        diskformat = root.find('target/format')
+        backing = root.find('backingStore/path')
+        backingformat = root.find('backingStore/format')
+        return cls(root.find('target/path').text, tobytes(root.find('capacity'), default='bytes'),
+                   format=diskformat.get('type') if diskformat is not None else None, backing=backing.text if backing is not None else None,
+                   backingformat=backingformat.get('type') if backingformat is not None else None, pooltype=root.get('type'))
+
+
+class Network(object):
+    """
+    a nat network, with dhcp when start and end are set
+    """
+    __slots__ = ['name', 'gateway', 'netmask', 'start', 'end', 'forward']
+
+    def __init__(self, name, gateway=None, netmask=None, start=None, end=None, forward='nat'):
+        self.name = name
+        self.gateway = gateway
+        self.netmask = netmask
+        self.start = start
+        self.end = end
+        self.forward = forward
+
+    def xml(self):
+        dhcp = ''
+        if self.start is not None and self.end is not None:
+            dhcp = "<dhcp><range start=%s end=%s/></dhcp>" % (quoteattr(str(self.start)), quoteattr(str(self.end)))
+        return ("<network><name>%s</name><forward mode=%s><nat><port start='1024' end='65535'/></nat></forward><domain name=%s/>"
+                "<ip address=%s netmask=%s>%s</ip></network>") % (escape(self.name), quoteattr(self.forward), quoteattr(self.name), quoteattr(str(self.gateway)), quoteattr(str(self.netmask)), dhcp)
+
+    @classmethod
+    def fromxml(cls, xml):
+        root = ET.fromstring(xml)
+        ip = root.find('ip')
+        dhcp = root.find('ip/dhcp/range')
+        forward = root.find('forward')
+        return cls(root.find('name').text, gateway=ip.get('address') if ip is not None else None, netmask=(ip.get('netmask') or ip.get('prefix')) if ip is not None else None,
+                   start=dhcp.get('start') if dhcp is not None else None, end=dhcp.get('end') if dhcp is not None else None,
+                   forward=forward.get('mode') if forward is not None else None)
+
+
+class Pool(object):
+    __slots__ = ['name', 'path', 'type', 'device']
+
+    def __init__(self, name, path, type='dir', device=None):
+        self.name = name
+        self.path = path
+        self.type = type
+        self.device = device
+
+    def xml(self):
+        if self.type == 'logical':
+            return ("<pool type='logical'><name>%s</name><source><device path=%s/><name>%s</name><format type='lvm2'/></source>"
+                    "<target><path>%s</path></target></pool>") % (escape(self.name), quoteattr(self.device), escape(self.name), escape(self.path))
+        return "<pool type=%s><name>%s</name><source></source><target><path>%s</path></target></pool>" % (quoteattr(self.type), escape(self.name), escape(self.path))
+
+    @classmethod
+    def fromxml(cls, xml):
+        root = ET.fromstring(xml)
+        path = root.find('target/path')
+        device = root.find('source/device')
+        return cls(root.find('name').text, path.text if path is not None else None, type=root.get('type'), device=device.get('path') if device is not None else None)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+capacity and usage of a hypervisor out of the stats of all its domains, gathered with a single bulk call.
+aggregations use numpy when it is installed and plain python otherwise
+"""
+
+import os
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# values of the libvirt constants, so that sampling doesnt require loading the libvirt bindings
+VIR_DOMAIN_STATS_STATE, VIR_DOMAIN_STATS_CPU_TOTAL, VIR_DOMAIN_STATS_BALLOON = 1, 2, 4
+VIR_DOMAIN_STATS_INTERFACE, VIR_DOMAIN_STATS_BLOCK = 16, 32
+STATS = VIR_DOMAIN_STATS_STATE | VIR_DOMAIN_STATS_CPU_TOTAL | VIR_DOMAIN_STATS_BALLOON | VIR_DOMAIN_STATS_INTERFACE | VIR_DOMAIN_STATS_BLOCK
+VIR_DOMAIN_RUNNING = 1
+# usage counters, cumulative in a sample and turned into rates per second between two samples
+COUNTERS = ['cputime', 'blockread', 'blockwrite', 'netrx', 'nettx']
+# columns summed per plan
+COLUMNS = ['vcpus', 'memory', 'rss'] + COUNTERS
+# columns top consumers are ranked by
+RANKINGS = ['cputime', 'rss', 'blockio', 'netio']
+
+
+def total(stats, prefix, suffix):
+    """
+    sum of the prefix.N.suffix entries of stats
+    """
+    return sum(stats.get("%s.%d.%s" % (prefix, index, suffix), 0) for index in range(stats.get("%s.count" % prefix, 0)))
+
+
+def volumesize(conn, path):
+    """
+    (allocation, capacity) of the volume at path, None when it isnt a volume of a pool
+    """
+    try:
+        info = conn.storageVolLookupByPath(path).info()
+    except Exception:
+        return None
+    return info[2], info[1]
+
+
+def sample(conn, descriptors, disks=True):
+    """
+    one record per domain of conn, out of a single getAllDomainStats call. plan, profile, vcpus and memory come from the
+    domain definitions in descriptors, a kvirt.cache.Descriptors. cputime is in seconds, memory and rss in MiB,
+    block and network counters in bytes. disks are (path, allocation, capacity) of the disks of every domain when disks
+    is set, those whose sizes arent part of the stats, as with stopped domains, being looked up as volumes
+    """
+    records = []
+    for vm, stats in conn.getAllDomainStats(STATS, 0):
+        try:
+            definition = descriptors.domain(vm)
+        except Exception:
+            continue
+        volumes = []
+        if disks:
+            paths = [stats.get("block.%d.path" % index) for index in range(stats.get('block.count', 0))]
+            if 'block.count' not in stats:
+                # older libvirt releases report no block stats at all for stopped domains
+                paths = [disk.path for disk in definition.disks if disk.device == 'disk']
+            for index, path in enumerate(paths):
+                if path is None:
+                    continue
+                if "block.%d.capacity" % index in stats:
+                    volumes.append((path, stats.get("block.%d.allocation" % index, 0), stats["block.%d.capacity" % index]))
+                    continue
+                size = volumesize(conn, path)
+                if size is not None:
+                    volumes.append((path,) + size)
+        records.append({'name': definition.name, 'plan': definition.description, 'profile': definition.title,
+                        'active': stats.get('state.state') == VIR_DOMAIN_RUNNING, 'vcpus': definition.numcpus or 0,
+                        'memory': definition.memory or 0, 'rss': stats.get('balloon.rss', 0) // 1024,
+                        'cputime': stats.get('cpu.time', 0) / 1e9, 'blockread': total(stats, 'block', 'rd.bytes'),
+                        'blockwrite': total(stats, 'block', 'wr.bytes'), 'netrx': total(stats, 'net', 'rx.bytes'),
+                        'nettx': total(stats, 'net', 'tx.bytes'), 'disks': volumes})
+    return records
+
+
+def rates(before, after, interval):
+    """
+    records of after with their counters turned into rates per second since before, taken interval seconds earlier.
+    domains missing from before are left out
+    """
+    previous = dict((record['name'], record) for record in before)
+    records = []
+    for record in after:
+        old = previous.get(record['name'])
+        if old is None:
+            continue
+        record = dict(record)
+        for counter in COUNTERS:
+            record[counter] = max(record[counter] - old[counter], 0) / float(interval)
+        records.append(record)
+    return records
+
+
+def totals(keys, columns):
+    """
+    sums of columns, a dict name -> values, grouped by keys. return a dict key -> name -> sum
+    """
+    if not keys:
+        return {}
+    if numpy is not None:
+        groups, inverse = numpy.unique(numpy.array(keys), return_inverse=True)
+        sums = dict((name, numpy.bincount(inverse, weights=numpy.asarray(values, dtype=float), minlength=len(groups)).tolist()) for name, values in columns.items())
+        return dict((str(group), dict((name, sums[name][index]) for name in columns)) for index, group in enumerate(groups.tolist()))
+    results = {}
+    for index, key in enumerate(keys):
+        result = results.setdefault(key, dict((name, 0.0) for name in columns))
+        for name, values in columns.items():
+            result[name] += values[index]
+    return results
+
+
+def top(names, values, count):
+    """
+    the count (name, value) with the highest values
+    """
+    if numpy is not None:
+        values = numpy.asarray(values, dtype=float)
+        indexes = numpy.argsort(-values, kind='stable')[:count].tolist()
+        return [(names[index], values[index].item()) for index in indexes]
+    return sorted(zip(names, [float(value) for value in values]), key=lambda entry: -entry[1])[:count]
+
+
+def capacity(records, cpus, memory, pools, count=5, interval=0):
+    """
+    aggregate records of sample, or of rates when interval is set, for a host of cpus cpus and memory MiB whose pools
+    are a dict name -> (path, capacity, available) in bytes. return per plan and per pool totals, overcommit ratios
+    of the running and of all the domains, and the top count consumers
+    """
+    active = [record for record in records if record['active']]
+    report = {'cpus': cpus, 'memory': memory, 'interval': interval, 'vms': len(records), 'active': len(active)}
+    vcpus = sum(record['vcpus'] for record in active)
+    allocated = sum(record['memory'] for record in active)
+    report['overcommit'] = {'cpu': vcpus / float(cpus) if cpus else 0.0, 'memory': allocated / float(memory) if memory else 0.0,
+                            'cpudefined': sum(record['vcpus'] for record in records) / float(cpus) if cpus else 0.0,
+                            'memorydefined': sum(record['memory'] for record in records) / float(memory) if memory else 0.0}
+    columns = dict((column, [record[column] for record in records]) for column in COLUMNS)
+    columns['vms'] = [1] * len(records)
+    report['plans'] = totals([record['plan'] or '' for record in records], columns)
+    directories = dict((path, name) for name, (path, size, available) in pools.items() if path)
+    # disks of stopped domains use space in their pools just as well
+    disks = [disk for record in records for disk in record['disks']]
+    owners = [directories.get(os.path.dirname(path), '') for path, allocation, size in disks]
+    usage = totals(owners, {'allocation': [disk[1] for disk in disks], 'capacity': [disk[2] for disk in disks], 'disks': [1] * len(disks)})
+    report['pools'] = {}
+    for name, (path, size, available) in pools.items():
+        result = usage.get(name, {'allocation': 0.0, 'capacity': 0.0, 'disks': 0.0})
+        result.update({'size': size, 'available': available, 'overcommit': result['capacity'] / float(size) if size else 0.0})
+        report['pools'][name] = result
+    names = [record['name'] for record in active]
+    values = {'cputime': [record['cputime'] for record in active], 'rss': [record['rss'] for record in active],
+              'blockio': [record['blockread'] + record['blockwrite'] for record in active], 'netio': [record['netrx'] + record['nettx'] for record in active]}
+    report['top'] = dict((ranking, top(names, values[ranking], count)) for ranking in RANKINGS)
+    return report
+
+
+def measure(conn, descriptors, interval=0):
+    """
+    sample conn, twice interval seconds apart when interval is set so that counters are rates
+    """
+    records = sample(conn, descriptors)
+    if interval:
+        time.sleep(interval)
+        records = rates(records, sample(conn, descriptors), interval)
+    return records
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+chunked transfers of volume contents through libvirt streams
+"""
+
+from collections import deque
+from itertools import islice
+import mmap
+import os
+import sys
+import threading
+import time
+
+CHUNKSIZE = 4 * 1024 * 1024
+# bytes imported through a single stream, after which progress is committed
+SEGMENT = 256 * 1024 * 1024
+# size of the ends of a chunk checked before comparing it whole with zeros
+SAMPLE = 64
+
+
+def iszero(chunk, zeros):
+    """
+    whether chunk only holds zeros. its ends are looked at first so that chunks with data are rejected cheaply
+    """
+    if bytes(chunk[:SAMPLE]).strip(b'\x00') or bytes(chunk[-SAMPLE:]).strip(b'\x00'):
+        return False
+    return bytes(chunk) == zeros[:len(chunk)]
+
+
+def write(stream, chunk, zeros=None):
+    """
+    send chunk through stream, as a hole if zeros, a buffer of zeros at least as long, is given and chunk only holds zeros
+    """
+    length = len(chunk)
+    if zeros is not None and iszero(chunk, zeros):
+        stream.sendHole(length, 0)
+        return length
+    while len(chunk):
+        chunk = chunk[stream.send(chunk):]
+    return length
+
+
+def send(stream, fileobj, size, chunksize=CHUNKSIZE, sparse=False, callback=None):
+    """
+    send size bytes of fileobj, from its current position, through a libvirt upload stream and return the time it took.
+    regular files are memory mapped and sent as views over the mapping, so that no copy happens in python,
+    other file objects are read chunk by chunk. when sparse, chunks of zeros are sent as holes.
+    callback(sent, size, elapsed) is called after each chunk
+    """
+    begin = time.time()
+    zeros = b'\x00' * chunksize
+    mapped, view, chunk = None, None, None
+    start = 0
+    if size:
+        try:
+            start = fileobj.tell()
+            mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            mapped = None
+    if mapped is not None:
+        # python2 mmap objects dont expose the new buffer interface, so their slices are copies
+        view = memoryview(mapped) if sys.version_info[0] > 2 else mapped
+    sent = 0
+    try:
+        while sent < size:
+            if view is not None:
+                chunk = view[start + sent:start + min(sent + chunksize, size)]
+            else:
+                chunk = fileobj.read(min(chunksize, size - sent))
+            if not len(chunk):
+                raise IOError("Unexpected end of file after %d bytes" % sent)
+            sent += write(stream, chunk, zeros if sparse else None)
+            if callback is not None:
+                callback(sent, size, time.time() - begin)
+    finally:
+        # views over the mapping need to be gone before closing it
+        chunk, view = None, None
+        if mapped is not None:
+            mapped.close()
+    return time.time() - begin
+
+
+def filesize(fileobj):
+    """
+    size of the remaining content of fileobj, which needs to be seekable
+    """
+    position = fileobj.tell()
+    fileobj.seek(0, 2)
+    size = fileobj.tell() - position
+    fileobj.seek(position)
+    return size
+
+
+def readahead(path, start, size, chunksize=CHUNKSIZE, workers=4):
+    """
+    yield size bytes of path from offset start, in chunks of chunksize bytes. ranges are read concurrently by workers
+    threads, each with its own file handle, with at most twice as many chunks as workers held in memory
+    """
+    from multiprocessing.pool import ThreadPool
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+
+    def read(offset):
+        handle = getattr(local, 'handle', None)
+        if handle is None:
+            handle = open(path, 'rb')
+            local.handle = handle
+            with lock:
+                handles.append(handle)
+        handle.seek(offset)
+        return handle.read(min(chunksize, start + size - offset))
+    offsets = iter(range(start, start + size, chunksize))
+    pool = ThreadPool(max(1, workers))
+    try:
+        pending = deque(pool.apply_async(read, (offset,)) for offset in islice(offsets, max(1, workers) * 2))
+        while pending:
+            chunk = pending.popleft().get()
+            for offset in islice(offsets, 1):
+                pending.append(pool.apply_async(read, (offset,)))
+            if not chunk:
+                raise IOError("Unexpected end of file %s" % path)
+            yield chunk
+    finally:
+        pool.terminate()
+        pool.join()
+        for handle in handles:
+            handle.close()
+
+
+def checksum(path):
+    """
+    expected sha256 of path, as found in the SHA256SUMS file of its directory or in path.sha256, None otherwise
+    """
+    directory, name = os.path.split(path)
+    candidates = [(os.path.join(directory, 'SHA256SUMS'), True), ("%s.sha256" % path, False)]
+    for candidate, listing in candidates:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate) as entries:
+            for entry in entries:
+                fields = entry.split()
+                if not fields:
+                    continue
+                if not listing or (len(fields) > 1 and fields[-1].lstrip('*') == name):
+                    return fields[0].lower()
+    return None
@@ -1,11 +1,27 @@
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 import os
+import sys
 description = 'Libvirt wrapper on steroids'
 long_description = description
 if os.path.exists('README.rst'):
     long_description = open('README.rst').read()
 
+
+class kvirt_build_py(build_py):
+    """
+    skip modules which only run on python3, so python2 installs dont fail to byte compile them
+    """
+    py3only = ['kvirt.aio']
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] >= 3:
+            return modules
+        return [(pkg, module, path) for (pkg, module, path) in modules if "%s.%s" % (pkg, module) not in self.py3only]
+
+
 setup(
     name='kcli',
     version='1.0.28',
@@ -25,8 +41,13 @@ setup(
         'PyYAML',
         'prettytable',
     ],
+    extras_require={
+        'stats': ['numpy'],
+    },
+    cmdclass={'build_py': kvirt_build_py},
     entry_points='''
         [console_scripts]
         kcli=kvirt.cli:cli
+        kclid=kvirt.daemon:main
     ''',
 )
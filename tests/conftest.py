@@ -0,0 +1,226 @@
+from collections import OrderedDict
+import pytest
+import xml.etree.ElementTree as ET
+from kvirt import Kvirt
+from kvirt.connection import manager
+
+POOL = "<pool type='dir'><name>%s</name><target><path>%s</path></target></pool>"
+
+
+class FakeVolume(object):
+    def __init__(self, pool, name, capacity=0, allocation=None):
+        self.pool, self.volumename, self.capacity = pool, name, capacity
+        self.allocation = capacity if allocation is None else allocation
+
+    def name(self):
+        return self.volumename
+
+    def path(self):
+        return "%s/%s" % (self.pool.path, self.volumename)
+
+    def info(self):
+        return [0, self.capacity, self.allocation]
+
+    def storagePoolLookupByVolume(self):
+        return self.pool
+
+    def delete(self, flags):
+        self.pool.volumes.remove(self)
+
+
+class FakePool(object):
+    def __init__(self, conn, name, path, volumes=(), capacity=0, available=0):
+        self.conn, self.poolname, self.path = conn, name, path
+        self.capacity, self.available = capacity, available
+        self.volumes = [FakeVolume(self, volume) for volume in volumes]
+        self.listings = 0
+
+    def name(self):
+        return self.poolname
+
+    def UUIDString(self):
+        return self.poolname
+
+    def isActive(self):
+        return 1
+
+    def refresh(self, flags):
+        pass
+
+    def info(self):
+        return [2, self.capacity, self.capacity - self.available, self.available]
+
+    def XMLDesc(self, flags):
+        return POOL % (self.poolname, self.path)
+
+    def listAllVolumes(self, flags):
+        self.listings += 1
+        return list(self.volumes)
+
+    def addvolume(self, name, capacity=0, allocation=None):
+        volume = FakeVolume(self, name, capacity, allocation)
+        self.volumes.append(volume)
+        return volume
+
+    def _create(self, xml, allocation):
+        root = ET.fromstring(xml)
+        self.conn.created.append(xml)
+        return self.addvolume(root.find('name').text, int(root.find('capacity').text), allocation)
+
+    def createXML(self, xml, flags):
+        return self._create(xml, 196616)
+
+    def createXMLFrom(self, xml, volume, flags):
+        return self._create(xml, volume.allocation)
+
+
+class FakeDomain(object):
+    """
+    domain of xml, whose stats are a dict or a function of the number of samples taken so far
+    """
+    def __init__(self, conn, xml, stats=None, active=False):
+        self.conn, self.xml, self.stats, self.active = conn, xml, stats or {}, active
+        self.uuid = self.name()
+        self.fetches = 0
+
+    def name(self):
+        return ET.fromstring(self.xml).find('name').text
+
+    def UUIDString(self):
+        return self.uuid
+
+    def XMLDesc(self, flags):
+        self.fetches += 1
+        return self.xml
+
+    def isActive(self):
+        return 1 if self.active else 0
+
+    def create(self):
+        self.active = True
+
+    def destroy(self):
+        self.active = False
+
+    def undefine(self):
+        del self.conn.domains[self.name()]
+
+    def rename(self, name, flags):
+        if name in self.conn.domains:
+            raise Exception("Domain %s already exists" % name)
+        old = self.name()
+        self.xml = self.xml.replace("<name>%s</name>" % old, "<name>%s</name>" % name)
+        self.conn.domains[name] = self.conn.domains.pop(old)
+
+
+class FakeNetwork(object):
+    def __init__(self, name, leases=()):
+        self.networkname, self.leases = name, list(leases)
+
+    def name(self):
+        return self.networkname
+
+    def isActive(self):
+        return 1
+
+    def DHCPLeases(self):
+        return self.leases
+
+
+class FakeConn(object):
+    """
+    libvirt connection to a hypervisor of cpus cpus and memory MiB, holding the domains, pools and networks added to it
+    """
+    def __init__(self, hostname='bumblefoot', cpus=4, memory=4096):
+        self.hostname, self.cpus, self.memory = hostname, cpus, memory
+        self.domains = OrderedDict()
+        self.pools = []
+        self.networks = []
+        self.created = []
+        self.defined = []
+        self.samples = 0
+
+    def adddomain(self, xml, stats=None, active=False):
+        domain = FakeDomain(self, xml, stats=stats, active=active)
+        self.domains[domain.name()] = domain
+        return domain
+
+    def addpool(self, name, path, volumes=(), capacity=0, available=0):
+        pool = FakePool(self, name, path, volumes, capacity=capacity, available=available)
+        self.pools.append(pool)
+        return pool
+
+    def addnetwork(self, name, leases=()):
+        network = FakeNetwork(name, leases)
+        self.networks.append(network)
+        return network
+
+    def isAlive(self):
+        return 1
+
+    def getHostname(self):
+        return self.hostname
+
+    def getCPUMap(self):
+        return [self.cpus]
+
+    def getInfo(self):
+        return ['x86_64', self.memory, self.cpus]
+
+    def lookupByName(self, name):
+        if name not in self.domains:
+            raise Exception("Domain %s not found" % name)
+        return self.domains[name]
+
+    def listAllDomains(self, flags):
+        return list(self.domains.values())
+
+    def defineXML(self, xml):
+        self.defined.append(xml)
+        name = ET.fromstring(xml).find('name').text
+        if name in self.domains:
+            self.domains[name].xml = xml
+            return self.domains[name]
+        return self.adddomain(xml)
+
+    def getAllDomainStats(self, flags, domainflags):
+        self.samples += 1
+        return [(domain, domain.stats(self.samples) if callable(domain.stats) else domain.stats) for domain in self.domains.values()]
+
+    def listAllStoragePools(self, flags):
+        return list(self.pools)
+
+    def storagePoolLookupByName(self, name):
+        for pool in self.pools:
+            if pool.name() == name:
+                return pool
+        raise Exception("Pool %s not found" % name)
+
+    def storageVolLookupByPath(self, path):
+        for pool in self.pools:
+            for volume in pool.volumes:
+                if volume.path() == path:
+                    return volume
+        raise Exception("Volume %s not found" % path)
+
+    def listAllNetworks(self, flags):
+        return list(self.networks)
+
+
+@pytest.fixture
+def conn():
+    """
+    fake libvirt connection, empty until domains, pools and networks are added to it
+    """
+    return FakeConn()
+
+
+@pytest.fixture
+def kvirt(monkeypatch):
+    """
+    factory of Kvirt objects wrapping a fake connection
+    """
+    def factory(conn, **kwargs):
+        monkeypatch.setattr(manager, 'open', lambda url: conn)
+        return Kvirt(url='test:///default', **kwargs)
+    return factory
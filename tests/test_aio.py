@@ -0,0 +1,56 @@
+import sys
+import threading
+import time
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason='asyncio facade requires python3')
+
+
+class SlowKvirt:
+    conn = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+
+    def start(self, name):
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        time.sleep(0.05)
+        with self.lock:
+            self.inflight -= 1
+        return name
+
+    def list(self):
+        return [['vm1', 'up', '', '', 'kvirt', '']]
+
+    def close(self):
+        pass
+
+
+class TestAio:
+    def test_inflight_limit(self):
+        import asyncio
+        from kvirt.aio import AsyncKvirt
+        k = SlowKvirt()
+        ak = AsyncKvirt(maxinflight=2, kvirt=k)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        results = loop.run_until_complete(asyncio.gather(*[ak.start('vm%d' % index) for index in range(6)]))
+        loop.run_until_complete(ak.close())
+        loop.close()
+        assert results == ['vm%d' % index for index in range(6)]
+        assert k.peak == 2
+
+    def test_fanout(self):
+        import asyncio
+        from kvirt.aio import AsyncKvirt, fanout
+        clients = {'twix': AsyncKvirt(kvirt=SlowKvirt()), 'bumblefoot': AsyncKvirt(kvirt=SlowKvirt())}
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        results = loop.run_until_complete(fanout(clients, 'list'))
+        loop.close()
+        assert sorted(results) == ['bumblefoot', 'twix']
+        assert results['twix'][0][0] == 'vm1'
@@ -0,0 +1,56 @@
+import xml.etree.ElementTree as ET
+import pytest
+
+DOMAIN = """<domain type='kvm'>
+<name>base</name>
+<uuid>c7a5fdbd-edaf-9455-926a-d65c16db1809</uuid>
+<devices>
+<disk type='file' device='disk'><driver name='qemu' type='qcow2'/><source file='/pool/base_1.img'/><target dev='vda' bus='virtio'/></disk>
+<disk type='file' device='disk'><driver name='qemu' type='raw'/><source file='/pool/base_2.img'/><target dev='vdb' bus='virtio'/></disk>
+<disk type='file' device='cdrom'><driver name='qemu' type='raw'/><source file='/pool/base.iso'/><target dev='hdc' bus='ide'/></disk>
+<interface type='network'><mac address='52:54:00:00:00:01'/><source network='default'/></interface>
+</devices>
+</domain>"""
+
+
+class TestClone:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        conn.adddomain(DOMAIN)
+        pool = conn.addpool('default', '/pool')
+        for name, capacity in [('base_1.img', 10 * 1024 ** 3 + 512), ('base_2.img', 1024 ** 3 // 2), ('base.iso', 2048)]:
+            pool.addvolume(name, capacity)
+        self.k = kvirt(conn)
+
+    def test_clone(self):
+        result = self.k.clone('base', 'twix')
+        assert result['result'] == 'success'
+        assert result['allocation'] == 10 * 1024 ** 3 + 512
+        volume = ET.fromstring(self.k._conn.created[0])
+        assert volume.find('capacity').text == str(10 * 1024 ** 3 + 512)
+        root = ET.fromstring(self.k._conn.defined[0])
+        assert root.find('name').text == 'twix'
+        assert root.find('uuid') is None
+        assert [disk.find('source').get('file') for disk in root.iter('disk')] == ['/pool/twix_1.img']
+        assert root.find('devices/interface/mac') is None
+
+    def test_full_clone_keeps_formats(self):
+        self.k.clone('base', 'twix', full=True)
+        formats = [(volume.find('name').text, volume.find('target/format').get('type')) for volume in map(ET.fromstring, self.k._conn.created)]
+        assert formats == [('twix_1.img', 'qcow2'), ('twix_2.img', 'raw'), ('twix.iso', 'raw')]
+
+    def test_linked_clones(self):
+        frozen = {'vda': ('/pool/base_1.img', 'qcow2'), 'vdb': ('/pool/base_2.img', 'raw')}
+        for name in ['twix1', 'twix2']:
+            assert self.k.clone('base', name, linked=True, frozen=frozen)['allocation'] == 196616 * 2
+        volumes = [ET.fromstring(volume) for volume in self.k._conn.created]
+        assert [volume.find('name').text for volume in volumes] == ['twix1_1.img', 'twix1_2.img', 'twix2_1.img', 'twix2_2.img']
+        assert [volume.find('backingStore/format').get('type') for volume in volumes] == ['qcow2', 'raw', 'qcow2', 'raw']
+        assert set(volume.find('target/format').get('type') for volume in volumes) == set(['qcow2'])
+        for root in map(ET.fromstring, self.k._conn.defined):
+            assert [disk.find('driver').get('type') for disk in root.iter('disk')] == ['qcow2', 'qcow2']
+
+    def test_clone_many(self):
+        results = self.k.clone_many('base', ['twix1', 'twix2', 'twix3'], workers=2)
+        assert [result['result'] for result in results] == ['success'] * 3
+        assert sorted(ET.fromstring(xml).find('name').text for xml in self.k._conn.defined) == ['twix1', 'twix2', 'twix3']
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from kvirt.cache import Cache
+from kvirt.daemon import Handler, Kclid, Output, RemoteKvirt, Server
+
+
+class FakeKvirt:
+    host = '127.0.0.1'
+    conn = True
+    listings = 0
+
+    def list(self):
+        FakeKvirt.listings += 1
+        return [['vm1', 'up', '192.168.122.10', 'centos7.qcow2', 'plan1', 'base7']]
+
+    def iterlist(self):
+        yield ['vm1', 'up', '192.168.122.10', 'centos7.qcow2', 'plan1', 'base7', 2, 512]
+
+    def start(self, name):
+        print("VM %s not found" % name)
+
+    def delete_many(self, names, workers=4):
+        return [{'result': 'success'} for name in names]
+
+
+class FakeConfig:
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self, client, shared=False):
+        return FakeKvirt()
+
+    def clientcache(self, client):
+        return Cache(client, path=self.path)
+
+
+class KvirtConfig(FakeConfig):
+    def __init__(self, path, k):
+        FakeConfig.__init__(self, path)
+        self.k = k
+
+    def connect(self, client, shared=False):
+        return self.k
+
+
+class TestDaemon:
+    @classmethod
+    def setup_class(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmpdir, 'kclid.sock')
+        self.server = Server(self.socket, Handler)
+        self.server.kclid = Kclid(FakeConfig(self.tmpdir), ['twix'])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def test_unknown_client(self):
+        assert RemoteKvirt.connect('bumblefoot', None, path=self.socket) is None
+
+    def test_listings_are_memoized(self):
+        k = RemoteKvirt.connect('twix', None, path=self.socket)
+        assert k.list() == k.list()
+        assert FakeKvirt.listings == 1
+        assert k.inventory().get('vm1').ip == '192.168.122.10'
+        assert k.inventory().get('vm1').memory == 512
+
+    def test_bulk_writes_are_served(self):
+        def local():
+            raise Exception("local connection opened")
+        k = RemoteKvirt.connect('twix', local, path=self.socket)
+        assert k.list() == k.list()
+        assert k.delete_many(['vm1', 'vm2'], workers=2) == [{'result': 'success'}] * 2
+        assert k._k is None
+        listings = FakeKvirt.listings
+        k.list()
+        assert FakeKvirt.listings == listings + 1
+
+    def test_output_is_captured(self):
+        stdout = sys.stdout
+        sys.stdout = Output(stdout)
+        try:
+            kclid = Kclid(FakeConfig(self.tmpdir), ['twix'], output=sys.stdout)
+            response = kclid.handle({'client': 'twix', 'method': 'start', 'args': ['vm2']})
+        finally:
+            sys.stdout = stdout
+        assert response == {'result': None, 'output': "VM vm2 not found\n"}
+
+    def test_volumes_follow_writes(self, conn, kvirt):
+        pool = conn.addpool('default', '/var/lib/libvirt/images', ['centos7.qcow2'])
+        kclid = Kclid(KvirtConfig(self.tmpdir, kvirt(conn)), ['twix'])
+        message = {'client': 'twix', 'method': 'volumes'}
+        assert kclid.handle(message) == {'result': ['/var/lib/libvirt/images/centos7.qcow2']}
+        pool.addvolume('fedora.qcow2')
+        assert kclid.handle(message) == {'result': ['/var/lib/libvirt/images/centos7.qcow2']}
+        kclid.handle({'client': 'twix', 'method': 'stop', 'args': ['vm1']})
+        assert sorted(kclid.handle(message)['result']) == ['/var/lib/libvirt/images/centos7.qcow2', '/var/lib/libvirt/images/fedora.qcow2']
+
+    @classmethod
+    def teardown_class(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
@@ -0,0 +1,33 @@
+import pytest
+
+DOMAIN = """<domain type='kvm'>
+<name>%s</name>
+<devices>
+<disk type='file' device='disk'><source file='/%s/%s_1.img'/><target dev='vda' bus='virtio'/></disk>
+<disk type='file' device='disk'><source file='/fast/%s_2.img'/><target dev='vdb' bus='virtio'/></disk>
+<disk type='file' device='cdrom'><source file='/default/%s.iso'/><target dev='hdc' bus='ide'/></disk>
+<disk type='file' device='cdrom'><source file='/default/shared.iso'/><target dev='hdd' bus='ide'/></disk>
+</devices>
+</domain>"""
+
+
+class TestDelete:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        names = ['vm%d' % index for index in range(10)]
+        for index, name in enumerate(names):
+            conn.adddomain(DOMAIN % (name, 'default' if index % 2 else 'slow', name, name, name), active=True)
+        conn.addpool('default', '/default', ['vm%d_1.img' % index for index in range(1, 10, 2)] + ['%s.iso' % name for name in names] + ['shared.iso'])
+        conn.addpool('slow', '/slow', ['vm%d_1.img' % index for index in range(0, 10, 2)])
+        conn.addpool('fast', '/fast', ['%s_2.img' % name for name in names])
+        self.k = kvirt(conn)
+
+    def test_delete_many(self):
+        names = ['vm%d' % index for index in range(10)] + ['missing']
+        results = self.k.delete_many(names, workers=3)
+        assert results[:10] == [{'result': 'success'}] * 10
+        assert results[10] == {'result': 'failure', 'reason': "VM missing not found"}
+        assert self.k._conn.domains == {}
+        assert [[volume.name() for volume in pool.volumes] for pool in self.k._conn.pools] == [['shared.iso'], [], []]
+        assert [pool.listings for pool in self.k._conn.pools] == [1, 1, 1]
+        assert sorted(self.k._volumes) == ['shared.iso']
@@ -0,0 +1,55 @@
+import pytest
+from kvirt.cache import Descriptors
+
+DOMAIN = "<domain type='kvm'><name>%s</name><memory unit='MiB'>%d</memory><vcpu>2</vcpu></domain>"
+
+
+class TestDescriptors:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn):
+        self.conn = conn
+        self.descriptors = Descriptors(ttl=60)
+        self.descriptors.bind(object())
+
+    def test_hits_and_invalidation(self):
+        vm = self.conn.adddomain(DOMAIN % ('twix', 512))
+        assert self.descriptors.domain(vm).memory == 512
+        assert self.descriptors.domain(vm) is self.descriptors.domain(vm)
+        assert self.descriptors.xml(vm) == DOMAIN % ('twix', 512)
+        assert vm.fetches == 1
+        vm.xml = DOMAIN % ('twix', 1024)
+        self.descriptors.invalidate(vm.UUIDString())
+        assert self.descriptors.domain(vm).memory == 1024
+        assert vm.fetches == 2
+        assert self.descriptors.stats == {'hits': 3, 'misses': 2, 'invalidations': 1}
+
+    def test_pool(self):
+        pool = self.descriptors.pool(self.conn.addpool('default', '/var/lib/libvirt/images'))
+        assert (pool.name, pool.type, pool.path) == ('default', 'dir', '/var/lib/libvirt/images')
+
+    def test_expiry_without_events(self):
+        vm = self.conn.adddomain(DOMAIN % ('twix', 512))
+        self.descriptors.domain(vm)
+        self.descriptors.ttl = 0
+        self.descriptors.entries[('domain', vm.UUIDString())][0] -= 1
+        self.descriptors.domain(vm)
+        assert vm.fetches == 2
+
+    def test_invalidation_while_fetching(self):
+        vm = self.conn.adddomain(DOMAIN % ('twix', 512))
+        fetch = vm.XMLDesc
+
+        def XMLDesc(flags):
+            xml = fetch(flags)
+            self.descriptors.invalidate(vm.UUIDString())
+            return xml
+        vm.XMLDesc = XMLDesc
+        self.descriptors.xml(vm)
+        assert ('domain', vm.UUIDString()) not in self.descriptors.entries
+
+    def test_new_connection(self):
+        vm = self.conn.adddomain(DOMAIN % ('twix', 512))
+        self.descriptors.xml(vm)
+        self.descriptors.bind(object())
+        self.descriptors.xml(vm)
+        assert vm.fetches == 2
@@ -0,0 +1,68 @@
+import pytest
+import threading
+from kvirt.exporter import Exporter, serve
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+DOMAIN = "<domain type='kvm'><name>%s</name><description>%s</description><memory unit='MiB'>1024</memory><vcpu>2</vcpu></domain>"
+
+
+def stats(samples):
+    return {'state.state': 1, 'cpu.time': 5 * 10 ** 9 * samples, 'balloon.rss': 1024, 'net.count': 1, 'net.0.rx.bytes': 10}
+
+
+class TestExporter:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        self.connections = []
+
+        def connect(client):
+            if client == 'down':
+                raise Exception("Couldnt connect")
+            conn.adddomain(DOMAIN % ('vm1', 'web "front"'), stats=stats)
+            conn.adddomain(DOMAIN % ('vm2', ''), stats={'state.state': 5})
+            conn.addpool('default', '/var/lib/libvirt/images', capacity=100, available=60)
+            conn.addnetwork('default', [{'mac': '52:54:00:00:00:01'}, {'mac': '52:54:00:00:00:02'}])
+            k = kvirt(conn)
+            self.connections.append(k)
+            return k
+        self.exporter = Exporter(connect, ['down', 'twix'], history=2)
+
+    def test_exposition(self):
+        self.exporter.collect('twix')
+        self.exporter.collect('down')
+        text = self.exporter.exposition()
+        assert 'kcli_up{client="twix"} 1.0' in text
+        assert 'kcli_up{client="down"} 0.0' in text
+        assert 'kcli_domain_cpu_seconds_total{client="twix",domain="vm1",plan="web \\"front\\""} 5.0' in text
+        assert 'kcli_domain_memory_bytes{client="twix",domain="vm2",plan=""} 1073741824.0' in text
+        assert 'kcli_domain_up{client="twix",domain="vm2",plan=""} 0.0' in text
+        assert 'kcli_pool_available_bytes{client="twix",pool="default"} 60.0' in text
+        assert 'kcli_network_leases{client="twix",network="default"} 2.0' in text
+        assert 'kcli_domain_cpu_usage_ratio' not in text
+        assert text.count('# TYPE kcli_up gauge') == 1
+        assert text.index('kcli_up{client="down"}') < text.index('kcli_up{client="twix"}') < text.index('# HELP kcli_sample_duration_seconds')
+
+    def test_history(self):
+        for index in range(3):
+            self.exporter.collect('twix')
+        assert len(self.connections) == 1
+        history = self.exporter.history('twix')
+        assert [entry['domains'][0]['cputime'] for entry in history] == [10.0, 15.0]
+        assert 'kcli_domain_cpu_usage_ratio{client="twix",domain="vm1"' in self.exporter.exposition()
+
+    def test_serve(self):
+        self.exporter.collect('twix')
+        server = serve(self.exporter, port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            response = urlopen("http://127.0.0.1:%s/metrics" % server.server_address[1])
+            assert response.info().get('Content-Type').startswith('text/plain; version=0.0.4')
+            assert b'kcli_up{client="twix"} 1.0' in response.read()
+        finally:
+            server.shutdown()
+            server.server_close()
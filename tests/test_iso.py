@@ -0,0 +1,37 @@
+import struct
+from kvirt.iso import SECTOR, build, seed
+
+
+def files(image, joliet=False):
+    """
+    return a dict name -> content of the root directory of image
+    """
+    descriptor = image[(17 if joliet else 16) * SECTOR:]
+    root = struct.unpack('<I', descriptor[158:162])[0] * SECTOR
+    entries = {}
+    offset = root
+    while ord(image[offset:offset + 1]):
+        length = ord(image[offset:offset + 1])
+        extent, size = struct.unpack('<I', image[offset + 2:offset + 6])[0], struct.unpack('<I', image[offset + 10:offset + 14])[0]
+        identifier = image[offset + 33:offset + 33 + ord(image[offset + 32:offset + 33])]
+        if identifier not in [b'\x00', b'\x01']:
+            name = identifier.decode('utf-16-be') if joliet else identifier.decode('ascii')
+            entries[name] = image[extent * SECTOR:extent * SECTOR + size]
+        offset += length
+    return entries
+
+
+class TestIso:
+    def test_seed(self):
+        image = seed('#cloud-config\nhostname: twix\n', 'instance-id: XXX\nlocal-hostname: twix\n')
+        assert len(image) % SECTOR == 0
+        assert image[16 * SECTOR + 1:16 * SECTOR + 6] == b'CD001'
+        assert image[16 * SECTOR + 40:16 * SECTOR + 46] == b'cidata'
+        assert image[17 * SECTOR + 88:17 * SECTOR + 91] == b'%/E'
+        assert files(image, joliet=True) == {'user-data': b'#cloud-config\nhostname: twix\n', 'meta-data': b'instance-id: XXX\nlocal-hostname: twix\n'}
+        assert sorted(files(image)) == ['META_DAT.;1', 'USER_DAT.;1']
+
+    def test_large_and_empty_files(self):
+        image = build({'user-data': 'x' * (SECTOR * 2 + 1), 'vendor-data': ''}, timestamp=0)
+        assert files(image, joliet=True) == {'user-data': b'x' * (SECTOR * 2 + 1), 'vendor-data': b''}
+        assert image == build({'user-data': 'x' * (SECTOR * 2 + 1), 'vendor-data': ''}, timestamp=0)
@@ -23,6 +23,21 @@ class TestK:
         klist = k.list()
         assert klist is not None
 
+    def test_inventory(self):
+        k = self.conn
+        inventory = k.inventory()
+        assert sorted(list(vm[:6]) for vm in inventory) == sorted(k.list())
+        assert sorted(list(vm) for vm in inventory) == sorted(k.iterlist())
+        for vm in inventory:
+            assert inventory.get(vm.name) == vm
+            assert vm in inventory.plan(vm.description)
+
+    def test_shared_connection(self):
+        k = Kvirt(self.host, shared=True)
+        assert k.conn is not None
+        assert Kvirt(self.host, shared=True).conn is k.conn
+        k.close()
+
     def test_create_network(self):
         k = self.conn
         counter = random.randint(1, 254)
@@ -49,6 +64,7 @@ class TestK:
         status = k.status(self.name)
         print(status)
         assert status is not None
+        assert k.wait([self.name], state='up', timeout=60)['result'] == 'success'
 
     def test_delete_vm(self):
         k = self.conn
@@ -56,6 +72,16 @@ class TestK:
         status = k.status(self.name)
         assert status is None
 
+    def test_create_many(self):
+        k = self.conn
+        names = ["%s%d" % (self.name, index) for index in range(1, 3)]
+        specs = [{'name': name, 'virttype': self.virttype, 'numcpus': 1, 'memory': 512, 'pool': self.name, 'nets': [self.name]} for name in names]
+        results = k.create_many(specs)
+        assert results == [{'result': 'success'}, {'result': 'success'}]
+        for name in names:
+            k.delete(name)
+            assert k.status(name) is None
+
     @classmethod
     def teardown_class(self):
         print("Cleaning stuff")
@@ -0,0 +1,81 @@
+import csv
+import json
+import os
+import pytest
+from io import StringIO
+from kvirt.cli import Config
+from kvirt.output import write
+
+
+class Stream(StringIO):
+    """
+    text buffer accepting str with python2 and counting flushes
+    """
+    def __init__(self):
+        StringIO.__init__(self)
+        self.flushes = 0
+
+    def write(self, data):
+        return StringIO.write(self, u"%s" % data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestOutput:
+    def setup_method(self, method):
+        self.records = [{'name': 'vm1', 'ips': ['10.0.0.1'], 'memory': 512}, {'name': 'vm2', 'ips': [], 'memory': None}]
+
+    def produce(self, stream):
+        for record in self.records:
+            yield record
+            # records are written as soon as they are produced
+            assert stream.getvalue().count('vm') == self.records.index(record) + 1
+
+    def test_ndjson(self):
+        stream = Stream()
+        write(self.produce(stream), 'ndjson', stream=stream)
+        assert [json.loads(line) for line in stream.getvalue().splitlines()] == self.records
+        assert stream.flushes == 2
+
+    def test_csv(self):
+        stream = Stream()
+        write(self.produce(stream), 'csv', fields=['name', 'memory', 'ips'], stream=stream)
+        rows = [row for row in csv.reader(StringIO(stream.getvalue()))]
+        assert rows == [['name', 'memory', 'ips'], ['vm1', '512', '["10.0.0.1"]'], ['vm2', '', '[]']]
+
+    def test_json_and_yaml(self):
+        stream = Stream()
+        write(iter(self.records), 'json', stream=stream)
+        assert json.loads(stream.getvalue()) == self.records
+        stream = Stream()
+        write(self.records[:1], 'json', stream=stream, single=True)
+        assert json.loads(stream.getvalue()) == self.records[0]
+        stream = Stream()
+        write(self.records, 'yaml', stream=stream)
+        assert stream.getvalue().startswith('- ips:\n  - 10.0.0.1\n')
+
+    def test_failures_go_to_stderr(self, capsys):
+        config = Config()
+        config.targets = ['bumblefoot', 'twix']
+
+        def vms(client):
+            if client == 'bumblefoot':
+                raise Exception("Couldnt connect")
+            return ['vm1']
+        write(({'client': client, 'name': name} for client, names in config.fanout(vms) for name in names), 'ndjson')
+        out, err = capsys.readouterr()
+        assert [json.loads(line) for line in out.splitlines()] == [{'client': 'twix', 'name': 'vm1'}]
+        assert 'Client bumblefoot failed: Couldnt connect' in err
+        assert config.failed == ['bumblefoot']
+
+    def test_failures_exit_non_zero(self, monkeypatch):
+        def exit(code):
+            raise SystemExit(code)
+        monkeypatch.setattr(os, '_exit', exit)
+        config = Config()
+        config.finish()
+        config.failed.append('bumblefoot')
+        with pytest.raises(SystemExit) as excinfo:
+            config.finish()
+        assert excinfo.value.code == 1
@@ -0,0 +1,56 @@
+import time
+from kvirt.inventory import VM, InventorySnapshot, parse
+from kvirt.plan import PlanExecutor, critical_path, diff, find_cycle
+
+
+class FakeKvirt:
+    host = '127.0.0.1'
+    conn = True
+
+    def create(self, name, **parameters):
+        time.sleep(parameters.get('delay', 0))
+        if parameters.get('fail'):
+            return {'result': 'failure', 'reason': 'failed on purpose'}
+        return {'result': 'success'}
+
+    def close(self):
+        pass
+
+
+class TestPlan:
+    def test_find_cycle(self):
+        assert find_cycle({'b': ['a'], 'c': ['a', 'b']}) is None
+        assert find_cycle({'a': ['c'], 'b': ['a'], 'c': ['b']}) == ['a', 'c', 'b', 'a']
+
+    def test_parallel_results_keep_plan_order(self):
+        vms = [('vm%d' % index, {'delay': 0.05 - index * 0.01}) for index in range(5)]
+        results = PlanExecutor(FakeKvirt, workers=5).run(vms)
+        assert [vm['name'] for vm in results] == [name for name, parameters in vms]
+        assert all(vm['result']['result'] == 'success' for vm in results)
+
+    def test_dependencies(self):
+        vms = [('engine', {'delay': 0.05}), ('node1', {}), ('node2', {}), ('broken', {'fail': True}), ('orphan', {})]
+        dependencies = {'node1': ['engine'], 'node2': ['engine', 'node1'], 'orphan': ['broken']}
+        results = PlanExecutor(FakeKvirt, workers=4).run(vms, dependencies=dependencies)
+        results = dict((vm['name'], vm) for vm in results)
+        assert results['node1']['start'] >= results['engine']['end']
+        assert results['node2']['start'] >= results['node1']['end']
+        assert results['orphan']['result']['result'] == 'failure'
+        assert critical_path(results.values(), dependencies) == ['engine', 'node1', 'node2']
+
+    def test_connection_failures(self):
+        def connect():
+            raise Exception("Couldnt connect")
+        vms = [('engine', {}), ('node1', {})]
+        results = PlanExecutor(connect, workers=2).run(vms, dependencies={'node1': ['engine']})
+        assert [vm['result'] for vm in results] == [{'result': 'failure', 'reason': 'Couldnt connect'}, {'result': 'failure', 'reason': 'dependency engine not deployed'}]
+
+    def test_diff(self):
+        xml = "<domain><vcpu>2</vcpu><memory unit='KiB'>524288</memory></domain>"
+        inventory = InventorySnapshot([parse('vm1', False, xml), parse('vm2', False, xml), VM('vm3', 'up', '', '', 'plan1', '')])
+        assert inventory.get('vm1').numcpus == 2 and inventory.get('vm1').memory == 512
+        vms = [('vm1', {'numcpus': 2, 'memory': 512}), ('vm2', {'numcpus': 4, 'memory': '1024'}), ('vm3', {'numcpus': 1}), ('vm4', {'numcpus': 1})]
+        missing, drifted, unchanged = diff(vms, inventory)
+        assert missing == [('vm4', {'numcpus': 1})]
+        assert drifted == [('vm2', {'numcpus': 4, 'memory': 1024})]
+        assert unchanged == ['vm1', 'vm3']
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import pytest
+from kvirt.profiles import ProfileResolver, defaults
+
+
+class TestProfiles:
+    def setup_method(self, method):
+        self.tmpdir = tempfile.mkdtemp()
+        self.script = os.path.join(self.tmpdir, 'script.sh')
+        with open(self.script, 'w') as script:
+            script.write('echo one\n\necho two\n')
+        profiles = {'base': {'template': 'centos7.qcow2', 'numcpus': 4, 'cmds': ['date']},
+                    'web': {'base': 'base', 'memory': 2048, 'scripts': [self.script]},
+                    'loop1': {'base': 'loop2'}, 'loop2': {'base': 'loop1'}}
+        self.resolver = ProfileResolver(profiles, defaults({'pool': 'images', 'numcpus': '1'}))
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.tmpdir)
+
+    def test_inheritance(self):
+        parameters = self.resolver.resolve('web')
+        assert parameters['template'] == 'centos7.qcow2'
+        assert (parameters['numcpus'], parameters['memory'], parameters['pool']) == (4, 2048, 'images')
+        assert parameters['cmds'] == ['date', 'echo one', 'echo two']
+        assert parameters['title'] == 'web'
+        assert self.resolver.resolve('missing') is None
+        with pytest.raises(ValueError):
+            self.resolver.resolve('loop1')
+
+    def test_plan_entry(self):
+        parameters = self.resolver.resolve(entry={'profile': 'base', 'numcpus': 8, 'ips': ['10.0.0.2']}, title='base', description='plan1')
+        assert (parameters['numcpus'], parameters['ips'], parameters['description']) == (8, ['10.0.0.2'], 'plan1')
+        parameters = self.resolver.resolve(entry={'memory': 1024})
+        assert (parameters['numcpus'], parameters['memory'], parameters['template']) == (1, 1024, None)
+
+    def test_parameters_are_not_shared(self):
+        parameters = self.resolver.resolve('web')
+        parameters['cmds'].append('reboot')
+        parameters['nets'].append('other')
+        assert self.resolver.resolve('web')['cmds'] == ['date', 'echo one', 'echo two']
+        assert self.resolver.resolve('web')['nets'] == ['default']
+
+    def test_scripts_are_cached(self):
+        assert self.resolver.script(self.script) == ['echo one', 'echo two']
+        self.resolver._scripts[self.script] = (os.stat(self.script).st_mtime, ['cached'])
+        assert self.resolver.script(self.script) == ['cached']
+        with open(self.script, 'w') as script:
+            script.write('echo three\n')
+        os.utime(self.script, (0, 0))
+        assert self.resolver.script(self.script) == ['echo three']
+        assert self.resolver.script(os.path.join(self.tmpdir, 'missing.sh')) is None
@@ -0,0 +1,19 @@
+import socket
+from kvirt.inventory import reachable
+
+
+class TestReachable:
+    def test_reachable(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.2', 0))
+        port = server.getsockname()[1]
+        try:
+            assert reachable(['127.0.0.1'], port=port) == set(['127.0.0.1'])
+            assert reachable(['127.0.0.1', '127.0.0.2'], port=closed.getsockname()[1], timeout=0.5) == set()
+            assert reachable([], port=port) == set()
+        finally:
+            server.close()
+            closed.close()
@@ -0,0 +1,40 @@
+import xml.etree.ElementTree as ET
+from kvirt.spec import Disk, Domain, Interface, Network, Pool, Volume
+
+
+class TestSpec:
+    def test_domain(self):
+        disks = [Disk('/pool/twix_1.img', 'vda', backing='/pool/centos7.qcow2', backingformat='qcow2'), Disk('/pool/twix_2.img', 'vdb', bus='scsi', format='raw'),
+                 Disk('/pool/twix.iso', 'hdc', bus='ide', format='raw', device='cdrom', readonly=True)]
+        interfaces = [Interface('default', mac='52:54:00:00:00:01'), Interface('br0', type='bridge')]
+        domain = Domain('twix', title='centos & co', description='<plan1>', version='192.168.122.10', memory=1024, numcpus=4,
+                        disks=disks, interfaces=interfaces, serial=5900)
+        parsed = Domain.fromxml(domain.xml())
+        assert (parsed.name, parsed.title, parsed.description, parsed.version) == ('twix', 'centos & co', '<plan1>', '192.168.122.10')
+        assert (parsed.memory, parsed.numcpus, parsed.serial, parsed.nested, parsed.display) == (1024, 4, '5900', True, 'spice')
+        assert [(disk.path, disk.dev, disk.bus, disk.format, disk.device) for disk in parsed.disks] == [
+            ('/pool/twix_1.img', 'vda', 'virtio', 'qcow2', 'disk'), ('/pool/twix_2.img', 'vdb', 'scsi', 'raw', 'disk'), ('/pool/twix.iso', 'hdc', 'ide', 'raw', 'cdrom')]
+        assert (parsed.disks[0].backing, parsed.disks[0].backingformat, parsed.disks[2].readonly) == ('/pool/centos7.qcow2', 'qcow2', True)
+        assert [(interface.type, interface.source, interface.mac) for interface in parsed.interfaces] == [('network', 'default', '52:54:00:00:00:01'), ('bridge', 'br0', None)]
+
+    def test_domain_libvirt(self):
+        xml = """<domain type='qemu'><name>twix</name><uuid>1234</uuid><memory unit='KiB'>2097152</memory><vcpu placement='static'>2</vcpu>
+        <devices><disk type='file' device='cdrom'><driver name='qemu' type='raw'/><target dev='hdc' bus='ide'/><readonly/></disk>
+        <serial type='pty'><target port='0'/></serial><graphics type='vnc' port='5901' listen='127.0.0.1'/></devices></domain>"""
+        parsed = Domain.fromxml(xml)
+        assert (parsed.virttype, parsed.uuid, parsed.memory, parsed.numcpus, parsed.description, parsed.title) == ('qemu', '1234', 2048, 2, '', '')
+        assert (parsed.disks[0].path, parsed.serial, parsed.nested, parsed.graphics) == (None, None, False, [('vnc', '127.0.0.1', '5901')])
+
+    def test_volume(self):
+        volume = Volume('/pool/twix_1.img', 10 * 1024 ** 3, backing='/pool/centos7.qcow2', backingformat='qcow2')
+        parsed = Volume.fromxml(volume.xml())
+        assert (parsed.path, parsed.capacity, parsed.format, parsed.backing, parsed.backingformat) == ('/pool/twix_1.img', 10 * 1024 ** 3, 'qcow2', '/pool/centos7.qcow2', 'qcow2')
+        block = ET.fromstring(Volume('/dev/vms/twix_1.img', 1024, pooltype='block').xml())
+        assert (block.get('type'), block.find('name').text, block.find('target/format')) == ('block', 'twix_1.img', None)
+
+    def test_network_and_pool(self):
+        network = Network.fromxml(Network('kcli', gateway='10.0.0.1', netmask='255.255.255.0', start='10.0.0.2', end='10.0.0.254').xml())
+        assert (network.name, network.gateway, network.netmask, network.start, network.end, network.forward) == ('kcli', '10.0.0.1', '255.255.255.0', '10.0.0.2', '10.0.0.254', 'nat')
+        assert Network.fromxml(Network('kcli', gateway='10.0.0.1', netmask='255.255.255.0').xml()).start is None
+        pool = Pool.fromxml(Pool('vms', '/dev/vms', type='logical', device='/dev/sdb').xml())
+        assert (pool.name, pool.path, pool.type, pool.device) == ('vms', '/dev/vms', 'logical', '/dev/sdb')
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+# modules only to be loaded by the commands needing them
+HEAVY = ['libvirt', 'netaddr', 'iptools', 'prettytable', 'yaml', 'numpy', 'multiprocessing', 'asyncio',
+         'kvirt.iso', 'kvirt.plan', 'kvirt.stats', 'kvirt.exporter', 'kvirt.aio']
+# cumulative import time of kvirt.cli in microseconds, only enforced when set
+BUDGET = os.environ.get('KCLI_STARTUP_BUDGET')
+
+
+def run(code, *options):
+    """
+    return the output of code run in a fresh interpreter using this checkout
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    process = subprocess.Popen([sys.executable] + [option for option in options] + ['-c', code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    output, errors = process.communicate()
+    assert process.returncode == 0, errors
+    return output, errors
+
+
+def importtime(module):
+    """
+    return a dict of module -> cumulative import time in microseconds, as reported by python -X importtime
+    """
+    times = {}
+    for line in run("import %s" % module, '-X', 'importtime')[1].splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        selftime, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup:
+    def test_heavy_modules_are_lazy(self):
+        modules = json.loads(run("import json, sys, kvirt.cli; print(json.dumps(sorted(sys.modules)))")[0])
+        assert [name for name in modules if name in HEAVY or name.split('.')[0] in HEAVY] == []
+
+    @pytest.mark.skipif(BUDGET is None, reason="set KCLI_STARTUP_BUDGET in microseconds to enforce a startup budget")
+    @pytest.mark.skipif(sys.version_info < (3, 7), reason="requires python -X importtime")
+    def test_budget(self):
+        times = min((importtime('kvirt.cli') for attempt in range(3)), key=lambda times: times['kvirt.cli'])
+        assert times['kvirt.cli'] < int(BUDGET), "kvirt.cli took %sus to import, over the %sus budget" % (times['kvirt.cli'], BUDGET)
@@ -0,0 +1,64 @@
+import pytest
+from kvirt import stats
+
+DOMAIN = "<domain type='kvm'><name>%s</name><description>%s</description><memory unit='MiB'>%d</memory><vcpu>%d</vcpu><devices>%s</devices></domain>"
+DISK = "<disk type='file' device='disk'><source file='%s'/><target dev='vda' bus='virtio'/></disk>"
+GB = 1024 ** 3
+
+
+def vm1(samples):
+    return {'state.state': 1, 'cpu.time': 10 ** 9 * 10 * samples, 'balloon.rss': 1024 * 1024, 'block.count': 2,
+            'block.0.path': '/var/lib/libvirt/images/vm1_1.img', 'block.0.allocation': GB, 'block.0.capacity': 10 * GB,
+            'block.0.rd.bytes': 100 * samples, 'block.0.wr.bytes': 50 * samples, 'block.1.path': '/data/vm1_2.img',
+            'block.1.allocation': GB, 'block.1.capacity': 20 * GB, 'net.count': 1, 'net.0.rx.bytes': 10, 'net.0.tx.bytes': 5}
+
+
+def vm2(samples):
+    return {'state.state': 1, 'cpu.time': 10 ** 9 * 30 * samples, 'balloon.rss': 512 * 1024, 'block.count': 1,
+            'block.0.path': '/var/lib/libvirt/images/vm2_1.img', 'block.0.allocation': 2 * GB, 'block.0.capacity': 10 * GB}
+
+
+def vm4(samples):
+    return {'state.state': 1, 'cpu.time': 10 ** 9 * samples, 'balloon.rss': 256 * 1024, 'net.count': 1, 'net.0.rx.bytes': 1000 * samples}
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(stats, 'numpy', None)
+    return request.param
+
+
+class TestStats:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        conn.adddomain(DOMAIN % ('vm1', 'web', 2048, 2, ''), stats=vm1)
+        conn.adddomain(DOMAIN % ('vm2', 'web', 1024, 4, ''), stats=vm2)
+        conn.adddomain(DOMAIN % ('vm3', 'db', 4096, 8, DISK % '/var/lib/libvirt/images/vm3_1.img'), stats={'state.state': 5})
+        conn.adddomain(DOMAIN % ('vm4', '', 512, 1, ''), stats=vm4)
+        pool = conn.addpool('default', '/var/lib/libvirt/images', capacity=100 * GB, available=60 * GB)
+        pool.addvolume('vm3_1.img', 40 * GB, 4 * GB)
+        conn.addpool('data', '/data', capacity=10 * GB, available=5 * GB)
+        self.k = kvirt(conn)
+
+    def test_capacity(self, backend):
+        report = self.k.capacity(count=2, display=False)
+        assert (report['host'], report['vms'], report['active']) == ('bumblefoot', 4, 3)
+        assert report['overcommit'] == {'cpu': 7 / 4.0, 'memory': 3584 / 4096.0, 'cpudefined': 15 / 4.0, 'memorydefined': 7680 / 4096.0}
+        web = report['plans']['web']
+        assert (web['vms'], web['vcpus'], web['memory'], web['rss'], web['cputime'], web['blockread']) == (2, 6, 3072, 1536, 40, 100)
+        assert (report['plans']['db']['vms'], report['plans']['']['netrx']) == (1, 1000)
+        default = report['pools']['default']
+        assert (default['disks'], default['allocation'], default['capacity'], default['overcommit']) == (3, 7 * GB, 60 * GB, 0.6)
+        assert (report['pools']['data']['capacity'], report['pools']['data']['overcommit']) == (20 * GB, 2.0)
+        assert report['top']['cputime'] == [('vm2', 30.0), ('vm1', 10.0)]
+        assert [name for name, value in report['top']['netio']] == ['vm4', 'vm1']
+
+    def test_rates(self, backend):
+        report = self.k.capacity(interval=0.01, display=False)
+        assert self.k._conn.samples == 2
+        assert report['top']['cputime'][0] == ('vm2', pytest.approx(3000.0))
+        assert report['plans']['web']['rss'] == 1536
+        assert report['plans']['web']['blockread'] == pytest.approx(10000.0)
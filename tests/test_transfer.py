@@ -0,0 +1,67 @@
+import os
+import tempfile
+from io import BytesIO
+from kvirt.transfer import checksum, filesize, readahead, send
+
+CHUNKSIZE = 1024
+
+
+class FakeStream:
+    """
+    libvirt stream accepting at most 100 bytes per send
+    """
+    def __init__(self):
+        self.content = b''
+        self.holes = 0
+
+    def send(self, data):
+        self.content += bytes(data[:100])
+        return min(len(data), 100)
+
+    def sendHole(self, length, flags):
+        self.content += b'\x00' * length
+        self.holes += 1
+
+
+class TestTransfer:
+    @classmethod
+    def setup_class(self):
+        self.content = b'kcli' * 512 + b'\x00' * CHUNKSIZE * 3 + b'\x00' * 10 + b'x'
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as origin:
+            origin.write(self.content)
+
+    def test_send_mapped_file(self):
+        stream = FakeStream()
+        progress = []
+        with open(self.path, 'rb') as origin:
+            send(stream, origin, filesize(origin), chunksize=CHUNKSIZE, sparse=True, callback=lambda sent, size, elapsed: progress.append(sent))
+        assert stream.content == self.content
+        assert stream.holes == 3
+        assert progress[-1] == len(self.content)
+
+    def test_send_file_object(self):
+        stream = FakeStream()
+        origin = BytesIO(self.content)
+        origin.read(4)
+        send(stream, origin, filesize(origin), chunksize=CHUNKSIZE)
+        assert stream.content == self.content[4:]
+        assert stream.holes == 0
+
+    def test_readahead(self):
+        chunks = list(readahead(self.path, 100, len(self.content) - 100, chunksize=CHUNKSIZE, workers=3))
+        assert b''.join(chunks) == self.content[100:]
+        assert max(len(chunk) for chunk in chunks) == CHUNKSIZE
+
+    def test_checksum(self):
+        assert checksum(self.path) is None
+        with open("%s.sha256" % self.path, 'w') as sha256:
+            sha256.write("ABCD  %s\n" % os.path.basename(self.path))
+        try:
+            assert checksum(self.path) == 'abcd'
+        finally:
+            os.remove("%s.sha256" % self.path)
+
+    @classmethod
+    def teardown_class(self):
+        os.remove(self.path)
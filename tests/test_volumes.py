@@ -0,0 +1,29 @@
+import pytest
+
+
+class TestVolumes:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        self.pool = conn.addpool('default', '/var/lib/libvirt/images', ['centos7.qcow2', 'centos7.iso'])
+        self.k = kvirt(conn)
+        self.k.descriptors.ttl = 60
+
+    def test_index_is_reused(self):
+        assert self.k.volumes() == ['/var/lib/libvirt/images/centos7.qcow2']
+        self.pool.addvolume('fedora.qcow2')
+        assert self.k.volumes(iso=True) == ['/var/lib/libvirt/images/centos7.iso']
+        assert self.pool.listings == 1
+
+    def test_index_expires(self):
+        self.k.volumes()
+        self.pool.addvolume('fedora.qcow2')
+        self.k.descriptors.ttl = 0
+        self.k._indexed = (self.k._indexed[0] - 1, self.k._indexed[1])
+        assert sorted(self.k.volumes()) == ['/var/lib/libvirt/images/centos7.qcow2', '/var/lib/libvirt/images/fedora.qcow2']
+
+    def test_storage_event(self):
+        self.k.volumes()
+        self.pool.volumes.pop(0)
+        self.k.descriptors.storage += 1
+        assert self.k.volumes() == []
+        assert self.pool.listings == 2
@@ -0,0 +1,10 @@
+from kvirt import events
+from kvirt.connection import manager
+
+
+class TestWait:
+    def test_unreachable(self, conn, kvirt, monkeypatch):
+        k = kvirt(conn)
+        monkeypatch.setattr(events, 'start', lambda: None)
+        monkeypatch.setattr(manager, 'open', lambda url: None)
+        assert k.wait(['vm1']) == {'result': 'failure', 'reason': "Couldnt connect to specify hypervisor 127.0.0.1"}
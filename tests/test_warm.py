@@ -0,0 +1,45 @@
+import xml.etree.ElementTree as ET
+import pytest
+from kvirt import WARM
+
+DOMAIN = """<domain type='kvm'>
+<name>%s</name>
+<description>%s</description>
+<sysinfo type='smbios'><system><entry name='product'>base7</entry><entry name='version'>192.168.122.2</entry></system></sysinfo>
+<devices>
+<disk type='file' device='disk'><source file='/pool/%s_1.img'/><target dev='vda' bus='virtio'/></disk>
+<disk type='file' device='cdrom'><target dev='hdc' bus='ide'/><readonly/></disk>
+</devices>
+</domain>"""
+
+
+class TestWarm:
+    @pytest.fixture(autouse=True)
+    def setup(self, conn, kvirt):
+        for name in ['base7-warm-aaaaa', 'base7-warm-bbbbb', 'other-warm-ccccc']:
+            conn.adddomain(DOMAIN % (name, WARM, name))
+        self.plain = conn.adddomain(DOMAIN % ('twix0', 'plan1', 'twix0'))
+        conn.adddomain(DOMAIN % ('base7-warm-ddddd', WARM, 'base7-warm-ddddd'), active=True)
+        self.k = kvirt(conn)
+
+    def test_warms(self):
+        assert self.k.warms('base7') == ['base7-warm-aaaaa', 'base7-warm-bbbbb']
+        assert self.k.warms('missing') == []
+        assert self.plain.fetches == 0
+
+    def test_claim(self):
+        result = self.k.claim('twix', 'base7', description='plan1', nets=[{'name': 'default', 'mask': '255.255.255.0'}], cloudinit=False, ips=['192.168.122.10'])
+        assert result == {'result': 'success', 'warm': 'base7-warm-aaaaa'}
+        root = ET.fromstring(self.k._conn.defined[-1])
+        assert root.find('name').text == 'twix'
+        assert root.find('description').text == 'plan1'
+        assert [entry.text for entry in root.iter('entry') if entry.get('name') == 'version'] == ['192.168.122.10']
+        assert self.k._conn.domains['twix'].active
+
+    def test_claim_exhausted(self):
+        warms = self.k.warms('base7')
+        assert self.k.claim('twix1', 'base7', cloudinit=False, warms=warms)['warm'] == 'base7-warm-aaaaa'
+        assert self.k.claim('twix2', 'base7', cloudinit=False, warms=warms)['warm'] == 'base7-warm-bbbbb'
+        assert warms == []
+        assert self.k.claim('twix3', 'base7', cloudinit=False) is None
+        assert self.k.claim('twix4', 'missing', cloudinit=False) is None